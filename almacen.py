@@ -0,0 +1,1465 @@
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import pandas as pd
+
+from asignacion import carga_ponderada, repartir
+from esquema import (
+    ESTADOS, ESTADOS_ABIERTOS, FORMATO_FECHA, PRIORIDADES, TIPOS_MENSAJE,
+    tipar_tickets, validar_campos, validar_mensaje, validar_ticket
+)
+
+# ============================================
+# 1. Esquema
+# ============================================
+
+# Versión del esquema, guardada en `PRAGMA user_version`. Los cambios desde
+# ESQUEMA_MINIMO solo añaden tablas o índices y se aplican al abrir la base.
+ESQUEMA_VERSION = 14
+ESQUEMA_MINIMO = 5
+
+# Prefijo de los identificadores visibles de ticket ("TICKET-1050")
+PREFIJO_ID = "TICKET-"
+
+# Mayor número de ticket admitido: 18 cifras, muy por debajo del máximo entero de
+# SQLite. Vale tanto para los ids que se leen como para los que reserva la
+# secuencia, así que todo ticket guardado se puede volver a buscar por su id.
+MAX_NUMERO = 10 ** 18 - 1
+
+# El número de ticket es el rowid de SQLite (INTEGER PRIMARY KEY), así que buscar
+# un ticket es un único acceso directo al árbol de la tabla, sin índice intermedio.
+# El identificador textual es una columna generada a partir del número.
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    numero INTEGER PRIMARY KEY,
+    id TEXT GENERATED ALWAYS AS ('TICKET-' || numero) VIRTUAL,
+    problema TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    prioridad TEXT NOT NULL,
+    fecha_creacion TEXT NOT NULL,
+    empresa TEXT NOT NULL,
+    usuario TEXT NOT NULL,
+    agente TEXT NOT NULL,
+    fecha_cierre TEXT
+);
+-- Sirve a los filtros por estado y a la vigilancia de SLA, que recorre los tickets
+-- abiertos de cada prioridad por rangos de fecha de creación
+DROP INDEX IF EXISTS idx_tickets_estado;
+CREATE INDEX IF NOT EXISTS idx_tickets_estado_prioridad_fecha ON tickets (estado, prioridad, fecha_creacion);
+CREATE INDEX IF NOT EXISTS idx_tickets_empresa ON tickets (empresa);
+CREATE INDEX IF NOT EXISTS idx_tickets_prioridad ON tickets (prioridad);
+-- Cubre la carga abierta de cada agente sin leer las filas de los tickets
+DROP INDEX IF EXISTS idx_tickets_agente;
+CREATE INDEX IF NOT EXISTS idx_tickets_agente_estado ON tickets (agente, estado, prioridad);
+CREATE INDEX IF NOT EXISTS idx_tickets_fecha_numero ON tickets (fecha_creacion, numero);
+
+CREATE TABLE IF NOT EXISTS mensajes (
+    numero INTEGER NOT NULL REFERENCES tickets (numero),
+    timestamp TEXT NOT NULL,
+    autor TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    contenido TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mensajes_numero ON mensajes (numero, timestamp);
+
+-- Último número de ticket asignado. Nunca retrocede, aunque se borren tickets,
+-- y cubre también los números explícitos de tickets sembrados o importados.
+CREATE TABLE IF NOT EXISTS secuencias (
+    nombre TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS secuencias_tickets AFTER INSERT ON tickets BEGIN
+    INSERT INTO secuencias (nombre, valor) VALUES ('tickets', NEW.numero)
+    ON CONFLICT (nombre) DO UPDATE SET valor = max(valor, excluded.valor);
+END;
+
+-- Índice de texto completo: un documento por ticket (rowid = numero) con el
+-- problema y el texto de todos sus mensajes, para ordenar por relevancia del ticket.
+-- Las inserciones las hace el almacén (un documento por ticket ya armado, en lugar
+-- de reescribirlo por cada mensaje); los triggers cubren ediciones y borrados.
+CREATE VIRTUAL TABLE IF NOT EXISTS busqueda USING fts5 (
+    problema, mensajes, tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS busqueda_actualizar_ticket AFTER UPDATE OF problema ON tickets BEGIN
+    UPDATE busqueda SET problema = NEW.problema WHERE rowid = NEW.numero;
+END;
+
+CREATE TRIGGER IF NOT EXISTS busqueda_eliminar_ticket AFTER DELETE ON tickets BEGIN
+    DELETE FROM busqueda WHERE rowid = OLD.numero;
+END;
+
+-- Conteos precalculados por mes, prioridad y agente, desglosados por estado.
+-- Los triggers los mantienen al día en la misma transacción que cada escritura.
+CREATE TABLE IF NOT EXISTS agregados (
+    dimension TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    conteo INTEGER NOT NULL,
+    PRIMARY KEY (dimension, clave, estado)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS agregados_insertar AFTER INSERT ON tickets BEGIN
+    INSERT INTO agregados (dimension, clave, estado, conteo) VALUES
+        ('mes', substr(NEW.fecha_creacion, 1, 7), NEW.estado, 1),
+        ('prioridad', NEW.prioridad, NEW.estado, 1),
+        ('agente', NEW.agente, NEW.estado, 1)
+    ON CONFLICT (dimension, clave, estado) DO UPDATE SET conteo = conteo + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS agregados_eliminar AFTER DELETE ON tickets BEGIN
+    UPDATE agregados SET conteo = conteo - 1
+    WHERE (dimension = 'mes' AND clave = substr(OLD.fecha_creacion, 1, 7) AND estado = OLD.estado)
+       OR (dimension = 'prioridad' AND clave = OLD.prioridad AND estado = OLD.estado)
+       OR (dimension = 'agente' AND clave = OLD.agente AND estado = OLD.estado);
+END;
+
+CREATE TRIGGER IF NOT EXISTS agregados_actualizar
+AFTER UPDATE OF estado, prioridad, agente, fecha_creacion ON tickets BEGIN
+    UPDATE agregados SET conteo = conteo - 1
+    WHERE (dimension = 'mes' AND clave = substr(OLD.fecha_creacion, 1, 7) AND estado = OLD.estado)
+       OR (dimension = 'prioridad' AND clave = OLD.prioridad AND estado = OLD.estado)
+       OR (dimension = 'agente' AND clave = OLD.agente AND estado = OLD.estado);
+    INSERT INTO agregados (dimension, clave, estado, conteo) VALUES
+        ('mes', substr(NEW.fecha_creacion, 1, 7), NEW.estado, 1),
+        ('prioridad', NEW.prioridad, NEW.estado, 1),
+        ('agente', NEW.agente, NEW.estado, 1)
+    ON CONFLICT (dimension, clave, estado) DO UPDATE SET conteo = conteo + 1;
+END;
+
+-- Registro de cambios. Cada escritura sobre un ticket (alta, edición, borrado o
+-- mensaje nuevo) incrementa la versión global 'cambios' de `secuencias` y anota
+-- esa versión en la fila del ticket. Hay una fila por ticket, así que el registro
+-- no crece con las ediciones; las sesiones guardan la última versión que vieron y
+-- releen solo los tickets con una versión mayor.
+CREATE TABLE IF NOT EXISTS cambios (
+    numero INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cambios_version ON cambios (version);
+INSERT OR IGNORE INTO secuencias (nombre, valor) VALUES ('cambios', 0);
+
+CREATE TRIGGER IF NOT EXISTS cambios_insertar_ticket AFTER INSERT ON tickets BEGIN
+    UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'cambios';
+    INSERT INTO cambios (numero, version)
+    VALUES (NEW.numero, (SELECT valor FROM secuencias WHERE nombre = 'cambios'))
+    ON CONFLICT (numero) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cambios_actualizar_ticket AFTER UPDATE ON tickets BEGIN
+    UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'cambios';
+    INSERT INTO cambios (numero, version)
+    VALUES (NEW.numero, (SELECT valor FROM secuencias WHERE nombre = 'cambios'))
+    ON CONFLICT (numero) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cambios_eliminar_ticket AFTER DELETE ON tickets BEGIN
+    UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'cambios';
+    INSERT INTO cambios (numero, version)
+    VALUES (OLD.numero, (SELECT valor FROM secuencias WHERE nombre = 'cambios'))
+    ON CONFLICT (numero) DO UPDATE SET version = excluded.version;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cambios_insertar_mensaje AFTER INSERT ON mensajes BEGIN
+    UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'cambios';
+    INSERT INTO cambios (numero, version)
+    VALUES (NEW.numero, (SELECT valor FROM secuencias WHERE nombre = 'cambios'))
+    ON CONFLICT (numero) DO UPDATE SET version = excluded.version;
+END;
+
+-- Registro de empresas, usuarios y agentes. La clave primaria da la pertenencia
+-- y el orden alfabético: comprobar un duplicado es una búsqueda en el índice y
+-- buscar por prefijo es un recorrido de rango. Con COLLATE NOCASE se rechazan los
+-- nombres que solo difieren en mayúsculas y las búsquedas no distinguen entre ellas.
+CREATE TABLE IF NOT EXISTS empresas (
+    nombre TEXT PRIMARY KEY COLLATE NOCASE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    empresa TEXT NOT NULL COLLATE NOCASE REFERENCES empresas (nombre) ON DELETE CASCADE,
+    nombre TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (empresa, nombre)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS agentes (
+    nombre TEXT PRIMARY KEY COLLATE NOCASE,
+    email TEXT NOT NULL DEFAULT '',
+    departamento TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+
+-- Tickets abiertos que superaron su plazo de SLA, con el momento en que se
+-- detectó. La marca se borra al cerrar o borrar el ticket; si se reabre y vuelve
+-- a vencer, se marca (y se notifica) de nuevo.
+CREATE TABLE IF NOT EXISTS incumplimientos (
+    numero INTEGER PRIMARY KEY,
+    detectado TEXT NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS incumplimientos_cerrar_ticket AFTER UPDATE OF estado ON tickets
+WHEN NEW.estado = 'Cerrado' BEGIN
+    DELETE FROM incumplimientos WHERE numero = NEW.numero;
+END;
+
+CREATE TRIGGER IF NOT EXISTS incumplimientos_eliminar_ticket AFTER DELETE ON tickets BEGIN
+    DELETE FROM incumplimientos WHERE numero = OLD.numero;
+END;
+
+-- Resúmenes calculados a partir de los tickets (p. ej. los percentiles de tiempos),
+-- con la versión de los datos de la que salieron. Los comparten todos los procesos
+-- que usan la base: el primero que calcula una versión la guarda para los demás.
+CREATE TABLE IF NOT EXISTS resumenes (
+    clave TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+
+-- Histórico de tickets cerrados (ver historico.py). Los tickets que pasan a los
+-- archivos Parquet se borran de `tickets`; aquí queda en qué lote y mes están, así
+-- que su número sigue ocupado y buscarlos lee un solo archivo. Cada fila de
+-- `archivos_historico` es un archivo confirmado: los lectores solo abren esos.
+-- Los conteos de los tickets archivados pasan de `agregados` a `agregados_historico`.
+CREATE TABLE IF NOT EXISTS archivados (
+    numero INTEGER PRIMARY KEY,
+    lote INTEGER NOT NULL,
+    mes TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS archivos_historico (
+    lote INTEGER NOT NULL,
+    mes TEXT NOT NULL,
+    PRIMARY KEY (lote, mes)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS agregados_historico (
+    dimension TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    conteo INTEGER NOT NULL,
+    PRIMARY KEY (dimension, clave, estado)
+) WITHOUT ROWID;
+
+-- Conteos de todos los tickets, los del almacén y los del histórico
+CREATE VIEW IF NOT EXISTS agregados_totales AS
+SELECT dimension, clave, estado, SUM(conteo) AS conteo FROM (
+    SELECT dimension, clave, estado, conteo FROM agregados
+    UNION ALL
+    SELECT dimension, clave, estado, conteo FROM agregados_historico
+)
+GROUP BY dimension, clave, estado;
+"""
+
+# Tipos de evento del historial; cada uno se guarda como su posición en la lista
+TIPOS_EVENTO = ["creacion", "estado", "agente", "prioridad", "mensaje_usuario", "mensaje_agente"]
+EVENTO = {tipo: codigo for codigo, tipo in enumerate(TIPOS_EVENTO)}
+
+def _codigo_sql(expresion: str, valores: List[str]) -> str:
+    """
+    Devuelve una expresión SQL con la posición de `expresion` en `valores`.
+    """
+    casos = " ".join(f"WHEN '{valor}' THEN {codigo}" for codigo, valor in enumerate(valores))
+    return f"CASE {expresion} {casos} END"
+
+def _segundos_sql(expresion: str) -> str:
+    # Las fechas se guardan sin zona horaria: se cuentan los segundos desde 1970
+    # de la fecha tal como está escrita, igual que hace `ahora()` con la hora local
+    return f"CAST(strftime('%s', {expresion}) AS INTEGER)"
+
+# Historial de eventos, de solo anexado: altas, cambios de estado, de agente y de
+# prioridad, y mensajes. Cada fila ocupa unos pocos bytes: el momento en segundos,
+# el tipo como código y, en los eventos que cambian el ticket, su estado completo
+# tras el cambio (estado y prioridad como códigos). Así, el estado de un ticket en
+# cualquier momento es su último evento con estado hasta ese momento. Lo mantienen
+# triggers en la misma transacción que cada escritura y no se borra con los tickets.
+# Un ticket cerrado que llega con su fecha de cierre (sembrado o importado) se
+# registra como abierto en su creación y cerrado en esa fecha.
+ESQUEMA_EVENTOS = f"""
+CREATE TABLE IF NOT EXISTS eventos (
+    numero INTEGER NOT NULL,
+    momento INTEGER NOT NULL,
+    tipo INTEGER NOT NULL,
+    estado INTEGER,
+    prioridad INTEGER,
+    agente TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_eventos_numero ON eventos (numero, momento);
+
+CREATE TRIGGER IF NOT EXISTS eventos_insertar_ticket AFTER INSERT ON tickets BEGIN
+    INSERT INTO eventos (numero, momento, tipo, estado, prioridad, agente) VALUES (
+        NEW.numero, {_segundos_sql("NEW.fecha_creacion")}, {EVENTO["creacion"]},
+        CASE WHEN NEW.estado = 'Cerrado' AND NEW.fecha_cierre IS NOT NULL
+             THEN {ESTADOS.index("Abierto")} ELSE {_codigo_sql("NEW.estado", ESTADOS)} END,
+        {_codigo_sql("NEW.prioridad", PRIORIDADES)}, NEW.agente
+    );
+    INSERT INTO eventos (numero, momento, tipo, estado, prioridad, agente)
+    SELECT NEW.numero, {_segundos_sql("NEW.fecha_cierre")}, {EVENTO["estado"]},
+           {ESTADOS.index("Cerrado")}, {_codigo_sql("NEW.prioridad", PRIORIDADES)}, NEW.agente
+    WHERE NEW.estado = 'Cerrado' AND NEW.fecha_cierre IS NOT NULL;
+END;
+""" + "".join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS eventos_actualizar_{campo} AFTER UPDATE OF {campo} ON tickets
+WHEN NEW.{campo} IS NOT OLD.{campo} BEGIN
+    INSERT INTO eventos (numero, momento, tipo, estado, prioridad, agente) VALUES (
+        NEW.numero, {_segundos_sql("'now', 'localtime'")}, {EVENTO[campo]},
+        {_codigo_sql("NEW.estado", ESTADOS)}, {_codigo_sql("NEW.prioridad", PRIORIDADES)}, NEW.agente
+    );
+END;
+"""
+    for campo in ("estado", "agente", "prioridad")
+) + f"""
+CREATE TRIGGER IF NOT EXISTS eventos_insertar_mensaje AFTER INSERT ON mensajes BEGIN
+    INSERT INTO eventos (numero, momento, tipo) VALUES (
+        NEW.numero, {_segundos_sql("NEW.timestamp")},
+        {EVENTO["mensaje_usuario"]} + {_codigo_sql("NEW.tipo", TIPOS_MENSAJE)}
+    );
+END;
+"""
+
+# Tipos de evento que fijan el estado de un ticket: su alta y sus cambios de estado
+EVENTOS_ESTADO = f"{EVENTO['creacion']}, {EVENTO['estado']}"
+
+def _abierto_sql(estado: str) -> str:
+    return f"({estado} IN ({', '.join(str(ESTADOS.index(e)) for e in ESTADOS_ABIERTOS)}))"
+
+def _abierto_anterior_sql(numero: str, momento: str, rowid: str) -> str:
+    # Si el ticket estaba abierto según su evento de estado anterior a uno dado (sin
+    # ese evento, no). Lo resuelve idx_eventos_numero sin tocar otros tickets.
+    return f"""COALESCE((
+        SELECT {_abierto_sql("estado")} FROM eventos
+        WHERE numero = {numero} AND tipo IN ({EVENTOS_ESTADO}) AND (momento, rowid) < ({momento}, {rowid})
+        ORDER BY momento DESC, rowid DESC LIMIT 1
+    ), 0)"""
+
+# Tickets abiertos por día: cuánto sube o baja el backlog cada día (segundos / 86400
+# del momento de sus eventos de estado). La serie del dashboard es la suma
+# acumulada, así que no hace falta recorrer el historial. Cada evento de estado
+# aporta la diferencia con el anterior del mismo ticket; si llega con un momento
+# anterior a otro ya registrado, también se corrige la aportación de ese siguiente.
+ESQUEMA_BACKLOG = f"""
+CREATE TABLE IF NOT EXISTS backlog_diario (
+    dia INTEGER PRIMARY KEY,
+    diferencia INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS backlog_insertar_evento AFTER INSERT ON eventos
+WHEN NEW.tipo IN ({EVENTOS_ESTADO}) BEGIN
+    INSERT INTO backlog_diario (dia, diferencia)
+    SELECT NEW.momento / 86400, diferencia FROM (
+        SELECT {_abierto_sql("NEW.estado")}
+             - {_abierto_anterior_sql("NEW.numero", "NEW.momento", "NEW.rowid")} AS diferencia
+    )
+    WHERE diferencia <> 0
+    ON CONFLICT (dia) DO UPDATE SET diferencia = diferencia + excluded.diferencia;
+    INSERT INTO backlog_diario (dia, diferencia)
+    SELECT siguiente.momento / 86400, diferencia FROM (
+        SELECT {_abierto_anterior_sql("NEW.numero", "NEW.momento", "NEW.rowid")}
+             - {_abierto_sql("NEW.estado")} AS diferencia
+    ) JOIN eventos siguiente ON siguiente.rowid = (
+        SELECT rowid FROM eventos
+        WHERE numero = NEW.numero AND tipo IN ({EVENTOS_ESTADO})
+          AND (momento, rowid) > (NEW.momento, NEW.rowid)
+        ORDER BY momento, rowid LIMIT 1
+    )
+    WHERE diferencia <> 0
+    ON CONFLICT (dia) DO UPDATE SET diferencia = diferencia + excluded.diferencia;
+END;
+"""
+
+# Columnas que se devuelven en los listados (sin el historial de mensajes)
+COLUMNAS_LISTADO = [
+    "id", "problema", "estado", "prioridad", "fecha_creacion",
+    "empresa", "usuario", "agente"
+]
+
+COLUMNAS_MENSAJE = ["contenido", "autor", "timestamp", "tipo"]
+
+def id_ticket(numero: int) -> str:
+    """
+    Devuelve el identificador visible de un número de ticket.
+    """
+    return f"{PREFIJO_ID}{numero}"
+
+def numero_ticket(id_ticket: str) -> Optional[int]:
+    """
+    Convierte un identificador como "TICKET-1050" (o solo "1050") en su número.
+    Devuelve None si el texto no es un identificador válido.
+    """
+    texto = id_ticket.strip().upper()
+    if texto.startswith(PREFIJO_ID):
+        texto = texto[len(PREFIJO_ID):]
+    # Solo cifras ASCII (str.isdigit acepta también "²" y otras que int() no
+    # convierte) y como mucho las de MAX_NUMERO, para que quepa en un entero de SQLite
+    return int(texto) if re.fullmatch(rf"[0-9]{{1,{len(str(MAX_NUMERO))}}}", texto) else None
+
+def _condiciones_filtro(
+    estados: Optional[List[str]],
+    empresas: Optional[List[str]],
+    prioridades: Optional[List[str]],
+    tabla: str = "tickets",
+    sin_indice: bool = False
+) -> Tuple[List[str], List]:
+    """
+    Traduce los filtros de la lista de tickets a condiciones SQL con sus parámetros.
+    Elegir todos los estados equivale a no filtrar por estado. Con `sin_indice`,
+    las columnas se escriben como `+columna`, para que SQLite no use sus índices y
+    recorra el del orden de la consulta.
+    """
+    if estados and set(estados) >= set(ESTADOS):
+        estados = None
+    condiciones: List[str] = []
+    parametros: List = []
+    for columna, valores in (("estado", estados), ("empresa", empresas), ("prioridad", prioridades)):
+        if valores:
+            expresion = f"{'+' if sin_indice else ''}{tabla}.{columna}"
+            condiciones.append(f"{expresion} IN ({', '.join('?' * len(valores))})")
+            parametros.extend(valores)
+    return condiciones, parametros
+
+def _rango_prefijo(prefijo: str) -> Tuple[str, str]:
+    """
+    Devuelve los límites [desde, hasta) de los textos que empiezan por `prefijo`,
+    para buscar con un recorrido de rango sobre un índice.
+    """
+    return prefijo, prefijo + "\U0010ffff"
+
+def consulta_texto(texto: str) -> str:
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 segura: cada palabra
+    se busca como prefijo y todas deben aparecer en el ticket.
+    """
+    palabras = texto.replace('"', " ").split()
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+def _decodificar_eventos(eventos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Traduce las columnas de eventos presentes en `eventos`: los segundos a
+    datetime64[ns] y los códigos de tipo, estado y prioridad a categorías.
+    """
+    if "momento" in eventos.columns:
+        eventos["momento"] = pd.to_datetime(eventos["momento"], unit="s").astype("datetime64[ns]")
+    for columna, valores in (("tipo", TIPOS_EVENTO), ("estado", ESTADOS), ("prioridad", PRIORIDADES)):
+        if columna in eventos.columns:
+            # Los eventos de mensaje no llevan estado: el código -1 queda como nulo
+            codigos = eventos[columna].fillna(-1).astype("int8")
+            eventos[columna] = pd.Categorical.from_codes(codigos, dtype=pd.CategoricalDtype(valores))
+    return eventos
+
+# ============================================
+# 2. Repositorio de Tickets
+# ============================================
+
+class AlmacenTickets:
+    """
+    Repositorio de tickets respaldado por SQLite en modo WAL.
+
+    Una única instancia se comparte entre todas las sesiones del proceso; cada
+    hilo obtiene su propia conexión, de modo que las lecturas concurrentes no se
+    bloquean entre sí y las escrituras se serializan en la base de datos.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._local = threading.local()
+        conexion = self._conexion()
+        version = conexion.execute("PRAGMA user_version").fetchone()[0]
+        if version != 0 and not ESQUEMA_MINIMO <= version <= ESQUEMA_VERSION:
+            # Desde la v5 las tablas usan el número de ticket como clave, lo que no
+            # se puede migrar con ALTER TABLE; hay que exportar y volver a importar.
+            raise RuntimeError(
+                f"La base de datos '{ruta}' usa el esquema v{version}; se esperaba v{ESQUEMA_VERSION}."
+            )
+        conexion.executescript(ESQUEMA + ESQUEMA_EVENTOS + ESQUEMA_BACKLOG)
+        if 0 < version < 7:
+            # El índice de texto completo es nuevo en la v7
+            self.reconstruir_busqueda()
+        if 0 < version < 9:
+            # El registro de empresas, usuarios y agentes es nuevo en la v9
+            self.reconstruir_registro()
+        if 0 < version < 10:
+            # El historial de eventos es nuevo en la v10: se parte de lo que se sabe
+            self._eventos_iniciales()
+        if 0 < version < 14:
+            # El backlog por día es nuevo en la v14
+            self.reconstruir_backlog()
+        conexion.execute(f"PRAGMA user_version = {ESQUEMA_VERSION}")
+
+    def _conexion(self) -> sqlite3.Connection:
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute("PRAGMA foreign_keys=ON")
+            self._local.conexion = conexion
+        return conexion
+
+    def cerrar(self) -> None:
+        """
+        Cierra la conexión del hilo actual. Debe llamarse antes de hacer fork del
+        proceso, porque una conexión SQLite abierta no puede cruzar un fork().
+        """
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is not None:
+            conexion.close()
+            self._local.conexion = None
+
+    @contextmanager
+    def _transaccion(self) -> Iterator[sqlite3.Connection]:
+        """
+        Abre una transacción de escritura y la confirma al salir del bloque.
+        """
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            yield conexion
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        conexion.execute("COMMIT")
+
+    # --------------------------------------------
+    # 2.1. Escritura
+    # --------------------------------------------
+
+    @staticmethod
+    def _insertar(conexion: sqlite3.Connection, tickets) -> None:
+        """
+        Valida los tickets, los inserta y aplana sus mensajes en la tabla `mensajes`.
+        """
+        tickets = list(tickets)
+        for ticket in tickets:
+            validar_ticket(ticket)
+        tickets = [{"fecha_cierre": None, **t, "numero": numero_ticket(t["id"])} for t in tickets]
+        # Un número archivado ya no está en `tickets`, así que la clave primaria no lo
+        # detecta: insertarlo duplicaría el ticket del histórico
+        archivado = conexion.execute(
+            "SELECT numero FROM archivados WHERE numero IN (SELECT value FROM json_each(?)) LIMIT 1",
+            (json.dumps([t["numero"] for t in tickets]),)
+        ).fetchone()
+        if archivado:
+            raise ValueError(f"El ticket {id_ticket(archivado[0])} ya existe en el histórico.")
+        conexion.executemany(
+            """
+            INSERT INTO tickets (numero, problema, estado, prioridad, fecha_creacion,
+                                 empresa, usuario, agente, fecha_cierre)
+            VALUES (:numero, :problema, :estado, :prioridad, :fecha_creacion,
+                    :empresa, :usuario, :agente, :fecha_cierre)
+            """,
+            tickets
+        )
+        conexion.executemany(
+            """
+            INSERT INTO mensajes (numero, timestamp, autor, tipo, contenido)
+            VALUES (:numero, :timestamp, :autor, :tipo, :contenido)
+            """,
+            ({**m, "numero": t["numero"]} for t in tickets for m in t.get("mensajes", []))
+        )
+        # Las empresas, usuarios y agentes que aparecen en los tickets quedan registrados
+        conexion.executemany(
+            "INSERT OR IGNORE INTO empresas (nombre) VALUES (?)", {(t["empresa"],) for t in tickets}
+        )
+        conexion.executemany(
+            "INSERT OR IGNORE INTO usuarios (empresa, nombre) VALUES (?, ?)",
+            {(t["empresa"], t["usuario"]) for t in tickets}
+        )
+        conexion.executemany(
+            "INSERT OR IGNORE INTO agentes (nombre) VALUES (?)", {(t["agente"],) for t in tickets}
+        )
+        conexion.executemany(
+            "INSERT INTO busqueda (rowid, problema, mensajes) VALUES (?, ?, ?)",
+            (
+                (t["numero"], t["problema"], " ".join(m["contenido"] for m in t.get("mensajes", [])))
+                for t in tickets
+            )
+        )
+
+    @staticmethod
+    def _reservar_numeros(conexion: sqlite3.Connection, cantidad: int) -> int:
+        """
+        Reserva `cantidad` números de ticket consecutivos y devuelve el primero.
+
+        Los números se toman de la tabla `secuencias` dentro de la transacción de
+        escritura en curso. Como SQLite solo admite un escritor a la vez, la reserva
+        es atómica entre hilos y entre procesos que comparten la base. Si la reserva
+        pasaría de MAX_NUMERO, lanza ValueError.
+        """
+        ultimo = conexion.execute(
+            """
+            INSERT INTO secuencias (nombre, valor)
+            VALUES ('tickets', (SELECT COALESCE(MAX(numero), 1000) + :cantidad FROM tickets))
+            ON CONFLICT (nombre) DO UPDATE SET valor = valor + :cantidad
+            RETURNING valor
+            """,
+            {"cantidad": cantidad}
+        ).fetchone()[0]
+        if ultimo > MAX_NUMERO:
+            # La transacción se deshace: la secuencia no avanza
+            raise ValueError(f"No quedan números de ticket libres (el máximo es {id_ticket(MAX_NUMERO)}).")
+        return ultimo - cantidad + 1
+
+    def insertar_tickets(self, tickets: List[Dict]) -> List[str]:
+        """
+        Inserta un lote de tickets en una sola transacción y devuelve sus ids.
+        Los tickets sin "id" reciben números nuevos de la secuencia.
+        """
+        explicitos = [t for t in tickets if t.get("id")]
+        nuevos = [t for t in tickets if not t.get("id")]
+        with self._transaccion() as conexion:
+            # Primero los números explícitos, para que la secuencia ya los haya
+            # superado cuando se reserven los números de los tickets nuevos
+            if explicitos:
+                self._insertar(conexion, explicitos)
+            if nuevos:
+                primero = self._reservar_numeros(conexion, len(nuevos))
+                nuevos = [{**t, "id": id_ticket(primero + i)} for i, t in enumerate(nuevos)]
+                self._insertar(conexion, nuevos)
+        ids_nuevos = iter(t["id"] for t in nuevos)
+        return [t["id"] if t.get("id") else next(ids_nuevos) for t in tickets]
+
+    def crear_ticket(self, ticket: Dict) -> str:
+        """
+        Guarda un ticket nuevo asignándole el siguiente número libre y devuelve su id.
+        """
+        return self.insertar_tickets([ticket])[0]
+
+    def sembrar_si_vacio(self, generar) -> bool:
+        """
+        Inserta los tickets devueltos por `generar()` solo si el almacén nunca tuvo
+        tickets: no basta con que `tickets` esté vacía, porque puede que todos se
+        hayan archivado. La comprobación y la inserción ocurren en la misma
+        transacción para que dos sesiones que arrancan a la vez no siembren dos veces.
+        """
+        with self._transaccion() as conexion:
+            if conexion.execute(
+                """
+                SELECT EXISTS (SELECT 1 FROM tickets) OR EXISTS (SELECT 1 FROM archivados)
+                    OR EXISTS (SELECT 1 FROM secuencias WHERE nombre = 'tickets')
+                """
+            ).fetchone()[0]:
+                return False
+            self._insertar(conexion, generar())
+        return True
+
+    def actualizar_ticket(
+        self, numero: int, estado: str, agente: str, prioridad: str, momento: str,
+        anterior: Optional[Dict] = None
+    ) -> None:
+        """
+        Actualiza los campos editables de un ticket. Al pasar a 'Cerrado' se anota
+        `momento` como fecha de cierre; si se reabre, la fecha de cierre se borra.
+
+        Con `anterior` (el ticket tal como se mostró), el cambio solo se aplica si
+        su estado, agente y prioridad siguen siendo esos; si otra sesión cambió
+        alguno entretanto, se lanza ValueError en lugar de sobrescribir sus cambios.
+        Los mensajes nuevos no cuentan: no tocan esos campos.
+        """
+        validar_campos(estado, prioridad)
+        anterior = anterior or {}
+        with self._transaccion() as conexion:
+            cursor = conexion.execute(
+                """
+                UPDATE tickets
+                SET estado = :estado, agente = :agente, prioridad = :prioridad,
+                    fecha_cierre = CASE WHEN :estado = 'Cerrado'
+                                        THEN COALESCE(fecha_cierre, :momento) END
+                WHERE numero = :numero
+                  AND (:comprobar = 0 OR
+                       (estado, agente, prioridad) = (:estado_anterior, :agente_anterior, :prioridad_anterior))
+                """,
+                {"estado": estado, "agente": agente, "prioridad": prioridad,
+                 "momento": momento, "numero": numero, "comprobar": int(bool(anterior)),
+                 "estado_anterior": anterior.get("estado"), "agente_anterior": anterior.get("agente"),
+                 "prioridad_anterior": anterior.get("prioridad")}
+            )
+            if anterior and cursor.rowcount == 0:
+                raise ValueError("otra sesión modificó el ticket; revise sus valores actuales y vuelva a intentarlo.")
+
+    def agregar_mensaje(self, numero: int, mensaje: Dict) -> None:
+        """
+        Añade un mensaje al historial de un ticket con una única inserción.
+        """
+        validar_mensaje(mensaje)
+        with self._transaccion() as conexion:
+            conexion.execute(
+                """
+                INSERT INTO mensajes (numero, timestamp, autor, tipo, contenido)
+                VALUES (:numero, :timestamp, :autor, :tipo, :contenido)
+                """,
+                {**mensaje, "numero": numero}
+            )
+            conexion.execute(
+                "UPDATE busqueda SET mensajes = mensajes || ' ' || ? WHERE rowid = ?",
+                (mensaje["contenido"], numero)
+            )
+
+    def marcar_incumplimientos(self, numeros: List[int], momento: str) -> List[int]:
+        """
+        Marca los tickets `numeros` como fuera de SLA y devuelve los que no lo
+        estaban. Como la marca se guarda en la base, varios procesos que vigilan
+        a la vez no notifican dos veces el mismo incumplimiento.
+        """
+        nuevos = []
+        with self._transaccion() as conexion:
+            for numero in numeros:
+                # Un ticket que se cerró después de la revisión ya no se marca
+                cursor = conexion.execute(
+                    """
+                    INSERT OR IGNORE INTO incumplimientos (numero, detectado)
+                    SELECT numero, ? FROM tickets WHERE numero = ? AND estado != 'Cerrado'
+                    """,
+                    (momento, numero)
+                )
+                if cursor.rowcount:
+                    nuevos.append(numero)
+        return nuevos
+
+    def guardar_resumen(self, clave: str, version: int, datos: str) -> None:
+        """
+        Guarda un resumen calculado con los datos de `version`, salvo que ya haya
+        uno de una versión posterior.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute(
+                """
+                INSERT INTO resumenes (clave, version, datos) VALUES (?, ?, ?)
+                ON CONFLICT (clave) DO UPDATE SET version = excluded.version, datos = excluded.datos
+                WHERE excluded.version > resumenes.version
+                """,
+                (clave, version, datos)
+            )
+
+    def archivar_cerrados(
+        self, antes: str, limite: int, escribir: Callable[[int, pd.DataFrame, pd.DataFrame], List[str]]
+    ) -> int:
+        """
+        Pasa al histórico hasta `limite` tickets cerrados antes de `antes`, los más
+        antiguos primero (así cada lote ocupa pocos meses), y devuelve cuántos fueron.
+
+        `escribir(lote, tickets, mensajes)` recibe el número del lote nuevo y los
+        tickets y mensajes a archivar, los guarda y devuelve los meses de los
+        archivos que escribió. Se llama dentro de la transacción que anota el lote
+        y borra los tickets del almacén: si falla, no se borra nada, y si falla la
+        transacción, el lote no queda anotado y sus archivos no se leen.
+        """
+        with self._transaccion() as conexion:
+            numeros = [f[0] for f in conexion.execute(
+                """
+                SELECT numero FROM tickets
+                WHERE estado = 'Cerrado' AND COALESCE(fecha_cierre, fecha_creacion) < ?
+                ORDER BY fecha_creacion, numero LIMIT ?
+                """,
+                (antes, limite)
+            )]
+            if not numeros:
+                return 0
+            filtro = "numero IN (SELECT value FROM json_each(:numeros))"
+            parametros = {"numeros": json.dumps(numeros)}
+            tickets = pd.read_sql_query(
+                f"""
+                SELECT numero, {', '.join(c for c in COLUMNAS_LISTADO if c != 'id')}, fecha_cierre
+                FROM tickets WHERE {filtro} ORDER BY numero
+                """,
+                conexion, params=parametros
+            )
+            mensajes = pd.read_sql_query(
+                f"""
+                SELECT numero, {', '.join(COLUMNAS_MENSAJE)} FROM mensajes
+                WHERE {filtro} ORDER BY numero, timestamp, rowid
+                """,
+                conexion, params=parametros
+            )
+            lote = conexion.execute(
+                """
+                INSERT INTO secuencias (nombre, valor) VALUES ('lotes_historico', 1)
+                ON CONFLICT (nombre) DO UPDATE SET valor = valor + 1
+                RETURNING valor
+                """
+            ).fetchone()[0]
+            meses = escribir(lote, tickets, mensajes)
+
+            conexion.executemany(
+                "INSERT INTO archivos_historico (lote, mes) VALUES (?, ?)", [(lote, mes) for mes in meses]
+            )
+            conexion.execute(
+                f"""
+                INSERT INTO archivados (numero, lote, mes)
+                SELECT numero, :lote, substr(fecha_creacion, 1, 7) FROM tickets WHERE {filtro}
+                """,
+                {**parametros, "lote": lote}
+            )
+            conexion.execute(
+                f"""
+                WITH lote AS (SELECT * FROM tickets WHERE {filtro})
+                INSERT INTO agregados_historico (dimension, clave, estado, conteo)
+                SELECT * FROM (
+                    SELECT 'mes', substr(fecha_creacion, 1, 7), estado, COUNT(*) FROM lote GROUP BY 2, 3
+                    UNION ALL
+                    SELECT 'prioridad', prioridad, estado, COUNT(*) FROM lote GROUP BY 2, 3
+                    UNION ALL
+                    SELECT 'agente', agente, estado, COUNT(*) FROM lote GROUP BY 2, 3
+                ) WHERE true
+                ON CONFLICT (dimension, clave, estado) DO UPDATE SET conteo = conteo + excluded.conteo
+                """,
+                parametros
+            )
+            # Los triggers de borrado descuentan los tickets de `agregados` y los
+            # sacan de la búsqueda; sus eventos se conservan
+            conexion.execute(f"DELETE FROM mensajes WHERE {filtro}", parametros)
+            conexion.execute(f"DELETE FROM tickets WHERE {filtro}", parametros)
+        return len(numeros)
+
+    def reconstruir_busqueda(self) -> None:
+        """
+        Vuelve a llenar el índice de texto completo a partir de tickets y mensajes.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute("DELETE FROM busqueda")
+            conexion.execute(
+                """
+                INSERT INTO busqueda (rowid, problema, mensajes)
+                SELECT t.numero, t.problema, COALESCE(
+                    (SELECT group_concat(m.contenido, ' ') FROM mensajes m WHERE m.numero = t.numero), ''
+                )
+                FROM tickets t
+                """
+            )
+
+    def _eventos_iniciales(self) -> None:
+        """
+        Crea el historial de los tickets anteriores al registro de eventos con lo que
+        se sabe de ellos: su alta, su cierre (si tiene fecha) y sus mensajes. Los
+        cambios de agente o prioridad que hubo antes no se guardaron en ningún sitio.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute(
+                f"""
+                INSERT INTO eventos (numero, momento, tipo, estado, prioridad, agente)
+                SELECT numero, {_segundos_sql("fecha_creacion")}, {EVENTO["creacion"]},
+                       CASE WHEN estado = 'Cerrado' AND fecha_cierre IS NOT NULL
+                            THEN {ESTADOS.index("Abierto")} ELSE {_codigo_sql("estado", ESTADOS)} END,
+                       {_codigo_sql("prioridad", PRIORIDADES)}, agente
+                FROM tickets
+                UNION ALL
+                SELECT numero, {_segundos_sql("fecha_cierre")}, {EVENTO["estado"]},
+                       {ESTADOS.index("Cerrado")}, {_codigo_sql("prioridad", PRIORIDADES)}, agente
+                FROM tickets WHERE estado = 'Cerrado' AND fecha_cierre IS NOT NULL
+                UNION ALL
+                SELECT numero, {_segundos_sql("timestamp")},
+                       {EVENTO["mensaje_usuario"]} + {_codigo_sql("tipo", TIPOS_MENSAJE)}, NULL, NULL, NULL
+                FROM mensajes
+                """
+            )
+
+    def reconstruir_backlog(self) -> None:
+        """
+        Vuelve a calcular el backlog por día a partir del historial de eventos.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute("DELETE FROM backlog_diario")
+            conexion.execute(
+                f"""
+                INSERT INTO backlog_diario (dia, diferencia)
+                SELECT momento / 86400 AS dia, SUM(abierto - anterior) FROM (
+                    SELECT momento, {_abierto_sql("estado")} AS abierto,
+                           LAG({_abierto_sql("estado")}, 1, 0) OVER (
+                               PARTITION BY numero ORDER BY momento, rowid
+                           ) AS anterior
+                    FROM eventos WHERE tipo IN ({EVENTOS_ESTADO})
+                )
+                GROUP BY dia HAVING SUM(abierto - anterior) <> 0
+                """
+            )
+
+    def _redistribuir(self, conexion: sqlite3.Connection, agente: str, destinos: List[str]) -> Dict[str, int]:
+        """
+        Reparte los tickets abiertos de `agente` entre los agentes de `destinos`
+        según su carga abierta actual, los de mayor prioridad primero. Los tickets
+        cerrados conservan su agente histórico. Devuelve cuántos tickets recibió
+        cada agente.
+        """
+        destinos = [d for d in destinos if d != agente]
+        marcas = ", ".join("?" * len(ESTADOS_ABIERTOS))
+        tickets = conexion.execute(
+            f"SELECT numero, prioridad FROM tickets WHERE agente = ? AND estado IN ({marcas})",
+            (agente, *ESTADOS_ABIERTOS)
+        ).fetchall()
+        if not tickets:
+            return {}
+        asignaciones = repartir(
+            [tuple(t) for t in tickets], self._cargas_abiertas(conexion, destinos)
+        )
+        conexion.executemany(
+            "UPDATE tickets SET agente = ? WHERE numero = ?",
+            [(destino, numero) for numero, destino in asignaciones.items()]
+        )
+        recibidos: Dict[str, int] = {}
+        for destino in asignaciones.values():
+            recibidos[destino] = recibidos.get(destino, 0) + 1
+        return recibidos
+
+    # --------------------------------------------
+    # 2.2. Lectura
+    # --------------------------------------------
+
+    def conteo_por_estado(self) -> Dict[str, int]:
+        """
+        Devuelve el número de tickets de cada estado, leído de los agregados (los
+        archivados en el histórico incluidos).
+        """
+        filas = self._conexion().execute(
+            """
+            SELECT estado, SUM(conteo) FROM agregados_totales
+            WHERE dimension = 'prioridad' GROUP BY estado
+            """
+        ).fetchall()
+        return {estado: conteo for estado, conteo in filas}
+
+    def contar(self, estado: Optional[str] = None) -> int:
+        """
+        Cuenta los tickets, opcionalmente solo los de un estado.
+        """
+        conteos = self.conteo_por_estado()
+        return sum(conteos.values()) if estado is None else conteos.get(estado, 0)
+
+    def resumen(self, dimension: str, por_estado: bool = True) -> pd.DataFrame:
+        """
+        Devuelve los conteos agregados de una dimensión ('mes', 'prioridad' o 'agente'),
+        desglosados por estado o sumados por clave. Incluye los tickets del histórico.
+        """
+        if por_estado:
+            consulta = """
+                SELECT clave, estado, conteo FROM agregados_totales
+                WHERE dimension = ? AND conteo > 0 ORDER BY clave, estado
+            """
+            columnas = ["clave", "estado", "conteo"]
+        else:
+            consulta = """
+                SELECT clave, SUM(conteo) FROM agregados_totales
+                WHERE dimension = ? GROUP BY clave HAVING SUM(conteo) > 0 ORDER BY clave
+            """
+            columnas = ["clave", "conteo"]
+        filas = self._conexion().execute(consulta, (dimension,)).fetchall()
+        return pd.DataFrame([tuple(f) for f in filas], columns=columnas)
+
+    @staticmethod
+    def _cargas_abiertas(conexion: sqlite3.Connection, agentes: List[str]) -> Dict[str, int]:
+        marcas = ", ".join("?" * len(ESTADOS_ABIERTOS))
+        filas = conexion.execute(
+            f"""
+            SELECT agente, prioridad, COUNT(*) FROM tickets
+            WHERE agente IN (SELECT value FROM json_each(?)) AND estado IN ({marcas})
+            GROUP BY agente, prioridad
+            """,
+            (json.dumps(agentes), *ESTADOS_ABIERTOS)
+        ).fetchall()
+        return carga_ponderada(filas, agentes)
+
+    def cargas_abiertas(self, agentes: List[str]) -> Dict[str, int]:
+        """
+        Devuelve la carga de cada agente: sus tickets abiertos ponderados por prioridad.
+        """
+        return self._cargas_abiertas(self._conexion(), agentes)
+
+    def obtener_ticket(self, id_ticket: str) -> Optional[Dict]:
+        """
+        Devuelve un ticket sin su historial de mensajes, o None si no existe.
+        El ticket incluye su `numero`, que es la clave del resto de operaciones,
+        y su `version`, la del último cambio registrado.
+        """
+        numero = numero_ticket(id_ticket)
+        if numero is None:
+            return None
+        fila = self._conexion().execute(
+            """
+            SELECT t.*, COALESCE(c.version, 0) AS version
+            FROM tickets t LEFT JOIN cambios c ON c.numero = t.numero
+            WHERE t.numero = ?
+            """,
+            (numero,)
+        ).fetchone()
+        return None if fila is None else dict(fila)
+
+    def obtener_mensajes(self, numero: int, ultimos: Optional[int] = None) -> List[Dict]:
+        """
+        Devuelve el historial de mensajes de un ticket en orden cronológico;
+        con `ultimos`, solo los más recientes. Ambos recorren el índice
+        (numero, timestamp), así que no se ordena nada en memoria.
+        """
+        if ultimos is None:
+            filas = self._conexion().execute(
+                f"""
+                SELECT {', '.join(COLUMNAS_MENSAJE)} FROM mensajes
+                WHERE numero = ? ORDER BY timestamp, rowid
+                """,
+                (numero,)
+            ).fetchall()
+            return [dict(f) for f in filas]
+        filas = self._conexion().execute(
+            f"""
+            SELECT {', '.join(COLUMNAS_MENSAJE)} FROM mensajes
+            WHERE numero = ? ORDER BY timestamp DESC, rowid DESC LIMIT ?
+            """,
+            (numero, ultimos)
+        ).fetchall()
+        return [dict(f) for f in reversed(filas)]
+
+    def contar_mensajes(self, numero: int) -> int:
+        """
+        Cuenta los mensajes de un ticket.
+        """
+        return self._conexion().execute(
+            "SELECT COUNT(*) FROM mensajes WHERE numero = ?", (numero,)
+        ).fetchone()[0]
+
+    def _abiertos(self, condicion: str, parametros: Tuple) -> List[Dict]:
+        # Los que ya están marcados fuera de SLA no se devuelven: volver a marcarlos
+        # no cambia nada, y tras un reinicio serían todos los vencidos
+        marcas = ", ".join("?" * len(ESTADOS_ABIERTOS))
+        filas = self._conexion().execute(
+            f"""
+            SELECT numero, id, prioridad, fecha_creacion, empresa, agente FROM tickets
+            WHERE estado IN ({marcas}) AND {condicion}
+              AND numero NOT IN (SELECT numero FROM incumplimientos)
+            """,
+            (*ESTADOS_ABIERTOS, *parametros)
+        ).fetchall()
+        return [dict(f) for f in filas]
+
+    def abiertos_creados_entre(self, prioridad: str, desde: Optional[str], hasta: str) -> List[Dict]:
+        """
+        Devuelve los tickets abiertos de `prioridad`, sin marcar fuera de SLA,
+        creados después de `desde` (o desde siempre, si es None) y hasta `hasta`,
+        inclusive. Es un recorrido de rango sobre el índice (estado, prioridad,
+        fecha_creacion): cuesta lo que recorre, no lo que hay abierto.
+        """
+        return self._abiertos(
+            "prioridad = ? AND fecha_creacion > ? AND fecha_creacion <= ?", (prioridad, desde or "", hasta)
+        )
+
+    def tickets_abiertos(self, numeros: List[int]) -> List[Dict]:
+        """
+        Devuelve los tickets abiertos y sin marcar fuera de SLA entre `numeros`.
+        """
+        return self._abiertos("numero IN (SELECT value FROM json_each(?))", (json.dumps(numeros),))
+
+    def leer_resumen(self, clave: str) -> Optional[Tuple[int, str]]:
+        """
+        Devuelve la versión y los datos del último resumen guardado con `clave`, o None.
+        """
+        fila = self._conexion().execute(
+            "SELECT version, datos FROM resumenes WHERE clave = ?", (clave,)
+        ).fetchone()
+        return None if fila is None else (fila[0], fila[1])
+
+    def archivos_historico(self) -> List[Tuple[int, str]]:
+        """
+        Devuelve el lote y el mes de cada archivo confirmado del histórico.
+        """
+        filas = self._conexion().execute("SELECT lote, mes FROM archivos_historico ORDER BY mes, lote").fetchall()
+        return [(lote, mes) for lote, mes in filas]
+
+    def ubicacion_archivado(self, numero: int) -> Optional[Tuple[int, str]]:
+        """
+        Devuelve el lote y el mes del archivo del histórico que guarda el ticket
+        `numero`, o None si el ticket no está archivado.
+        """
+        fila = self._conexion().execute(
+            "SELECT lote, mes FROM archivados WHERE numero = ?", (numero,)
+        ).fetchone()
+        return None if fila is None else (fila[0], fila[1])
+
+    def contar_incumplimientos(self) -> int:
+        """
+        Cuenta los tickets abiertos marcados como fuera de SLA.
+        """
+        return self._conexion().execute("SELECT COUNT(*) FROM incumplimientos").fetchone()[0]
+
+    def siguiente_numero(self) -> int:
+        """
+        Devuelve el primer número libre tras los ya usados, sin reservarlo.
+        En un almacén vacío es 1000, el primero de los datos de ejemplo.
+        """
+        return self._conexion().execute(
+            """
+            SELECT COALESCE(MAX(
+                (SELECT MAX(numero) FROM tickets),
+                (SELECT valor FROM secuencias WHERE nombre = 'tickets')
+            ) + 1, 1000)
+            """
+        ).fetchone()[0]
+
+    def numeros_existentes(self, numeros: List[int]) -> Set[int]:
+        """
+        Devuelve cuáles de los números de ticket dados ya están en el almacén o en
+        el histórico.
+        """
+        if not numeros:
+            return set()
+        filas = self._conexion().execute(
+            """
+            SELECT numero FROM tickets WHERE numero IN (SELECT value FROM json_each(:numeros))
+            UNION ALL
+            SELECT numero FROM archivados WHERE numero IN (SELECT value FROM json_each(:numeros))
+            """,
+            {"numeros": json.dumps(numeros)}
+        ).fetchall()
+        return {f[0] for f in filas}
+
+    def iterar_tickets(self, lote: int = 5000) -> Iterator[List[Dict]]:
+        """
+        Recorre todos los tickets, con sus mensajes, en lotes de `lote` tickets
+        ordenados por número. Cada lote se lee con dos consultas por rango de clave,
+        así que la memoria usada no depende del tamaño del almacén.
+        """
+        conexion = self._conexion()
+        ultimo = -1
+        while True:
+            filas = conexion.execute(
+                f"""
+                SELECT numero, {', '.join(COLUMNAS_LISTADO)}, fecha_cierre FROM tickets
+                WHERE numero > ? ORDER BY numero LIMIT ?
+                """,
+                (ultimo, lote)
+            ).fetchall()
+            if not filas:
+                return
+            tickets = {f["numero"]: {**dict(f), "mensajes": []} for f in filas}
+            ultimo = filas[-1]["numero"]
+            for fila in conexion.execute(
+                f"""
+                SELECT numero, {', '.join(COLUMNAS_MENSAJE)} FROM mensajes
+                WHERE numero BETWEEN ? AND ? ORDER BY numero, timestamp, rowid
+                """,
+                (filas[0]["numero"], ultimo)
+            ):
+                mensaje = dict(fila)
+                tickets[mensaje.pop("numero")]["mensajes"].append(mensaje)
+            for ticket in tickets.values():
+                del ticket["numero"]
+            yield list(tickets.values())
+
+    def version(self) -> int:
+        """
+        Devuelve la versión global de los datos, que aumenta con cada escritura.
+        Es una lectura por clave primaria, pensada para consultarse a menudo.
+        """
+        return self._conexion().execute(
+            "SELECT valor FROM secuencias WHERE nombre = 'cambios'"
+        ).fetchone()[0]
+
+    def cambios_desde(self, version: int) -> Tuple[int, List[int]]:
+        """
+        Devuelve la versión más reciente y los números de los tickets que cambiaron
+        después de `version` (incluidos los borrados).
+        """
+        filas = self._conexion().execute(
+            "SELECT numero, version FROM cambios WHERE version > ?", (version,)
+        ).fetchall()
+        return max((v for _, v in filas), default=version), [n for n, _ in filas]
+
+    def datos_tiempos(self, numeros: Optional[List[int]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Devuelve, en formato columnar y con tipos nativos, los datos necesarios para
+        medir tiempos de respuesta y resolución: los tickets con sus fechas y los
+        mensajes de agentes. Con `numeros`, solo los de esos tickets.
+        """
+        conexion = self._conexion()
+        filtro, parametros = "", ()
+        if numeros is not None:
+            filtro, parametros = "numero IN (SELECT value FROM json_each(?))", (json.dumps(numeros),)
+        tickets = pd.read_sql_query(
+            "SELECT numero, empresa, agente, fecha_creacion, fecha_cierre FROM tickets"
+            + (f" WHERE {filtro}" if filtro else ""),
+            conexion, params=parametros
+        )
+        mensajes = pd.read_sql_query(
+            "SELECT numero, timestamp FROM mensajes WHERE tipo = 'agente'"
+            + (f" AND {filtro}" if filtro else ""),
+            conexion, params=parametros
+        )
+        mensajes["timestamp"] = pd.to_datetime(mensajes["timestamp"], format=FORMATO_FECHA).astype("datetime64[ns]")
+        return tipar_tickets(tickets), mensajes
+
+    def historial_ticket(self, numero: int) -> pd.DataFrame:
+        """
+        Devuelve los eventos de un ticket en orden cronológico. Los de alta y de
+        cambio llevan el estado, la prioridad y el agente que quedaron tras ellos.
+        """
+        eventos = pd.read_sql_query(
+            """
+            SELECT momento, tipo, estado, prioridad, agente FROM eventos
+            WHERE numero = ? ORDER BY momento, rowid
+            """,
+            self._conexion(), params=(numero,)
+        )
+        return _decodificar_eventos(eventos)
+
+    def estado_en(self, momento: str, numeros: Optional[List[int]] = None) -> pd.DataFrame:
+        """
+        Reconstruye el estado, la prioridad y el agente que tenía cada ticket en
+        `momento` (o solo los tickets `numeros`), a partir de su último evento con
+        estado hasta entonces. Los tickets creados después no aparecen.
+        """
+        # Cada ticket busca su último evento en idx_eventos_numero; los tickets se
+        # sacan de sus altas (o de `numeros`), sin ordenar todo el historial
+        if numeros is None:
+            tickets = f"SELECT numero FROM eventos WHERE tipo = {EVENTO['creacion']} AND momento <= {_segundos_sql('?')}"
+            parametros: Tuple = (momento, momento)
+        else:
+            tickets = "SELECT DISTINCT value AS numero FROM json_each(?)"
+            parametros = (json.dumps(numeros), momento)
+        eventos = pd.read_sql_query(
+            f"""
+            SELECT e.numero, e.estado, e.prioridad, e.agente
+            FROM ({tickets}) t
+            JOIN eventos e ON e.rowid = (
+                SELECT rowid FROM eventos
+                WHERE numero = t.numero AND momento <= {_segundos_sql("?")} AND estado IS NOT NULL
+                ORDER BY momento DESC, rowid DESC LIMIT 1
+            )
+            ORDER BY e.numero
+            """,
+            self._conexion(), params=parametros
+        )
+        return _decodificar_eventos(eventos)
+
+    def backlog_diario(self) -> pd.DataFrame:
+        """
+        Devuelve cuánto cambió cada día el número de tickets abiertos, con las
+        columnas fecha y diferencia, en orden cronológico.
+        """
+        dias = pd.read_sql_query(
+            "SELECT dia, diferencia FROM backlog_diario ORDER BY dia", self._conexion()
+        )
+        fechas = pd.to_datetime(dias.pop("dia") * 86400, unit="s").astype("datetime64[ns]")
+        return dias.assign(fecha=fechas)[["fecha", "diferencia"]]
+
+    def pagina_tickets(
+        self,
+        estados: Optional[List[str]] = None,
+        empresas: Optional[List[str]] = None,
+        prioridades: Optional[List[str]] = None,
+        limite: int = 50,
+        despues_de: Optional[Tuple[Union[str, pd.Timestamp], str]] = None,
+        descendente: bool = True
+    ) -> pd.DataFrame:
+        """
+        Devuelve una página de tickets que cumplen los filtros, sin los mensajes.
+
+        Los tickets se ordenan por (fecha_creacion, numero) y la página empieza justo
+        después de la clave `despues_de` (fecha e id de la última fila de la página anterior).
+        Así cada página cuesta lo mismo sin importar lo profunda que sea (paginación
+        por clave en lugar de OFFSET) y solo se materializan `limite` filas, ya tipadas.
+        Los filtros no usan sus índices: la consulta recorre (fecha_creacion, numero)
+        desde el cursor y se detiene en `limite` filas, sin ordenar nada en memoria.
+        """
+        condiciones, parametros = _condiciones_filtro(estados, empresas, prioridades, sin_indice=True)
+        if despues_de is not None:
+            fecha, id_ticket = despues_de
+            condiciones.append(f"(fecha_creacion, numero) {'<' if descendente else '>'} (?, ?)")
+            parametros.extend([pd.Timestamp(fecha).strftime(FORMATO_FECHA), numero_ticket(id_ticket)])
+        consulta = f"SELECT {', '.join(COLUMNAS_LISTADO)} FROM tickets"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        orden = "DESC" if descendente else "ASC"
+        consulta += f" ORDER BY fecha_creacion {orden}, numero {orden} LIMIT ?"
+        filas = self._conexion().execute(consulta, [*parametros, limite]).fetchall()
+        return tipar_tickets(pd.DataFrame([tuple(f) for f in filas], columns=COLUMNAS_LISTADO))
+
+    def buscar_texto(
+        self,
+        texto: str,
+        estados: Optional[List[str]] = None,
+        empresas: Optional[List[str]] = None,
+        prioridades: Optional[List[str]] = None,
+        limite: int = 50
+    ) -> pd.DataFrame:
+        """
+        Busca `texto` en el problema y en los mensajes de los tickets que cumplen
+        los filtros. Devuelve los más relevantes primero (bm25, con el problema
+        pesando el doble que los mensajes) y un fragmento con la coincidencia.
+        """
+        consulta = consulta_texto(texto)
+        columnas = COLUMNAS_LISTADO + ["coincidencia"]
+        if not consulta:
+            return pd.DataFrame(columns=columnas)
+        condiciones, parametros = _condiciones_filtro(estados, empresas, prioridades, tabla="t")
+        filtros = "".join(f" AND {c}" for c in condiciones)
+        filas = self._conexion().execute(
+            f"""
+            SELECT {', '.join('t.' + c for c in COLUMNAS_LISTADO)},
+                   snippet(busqueda, -1, '[', ']', '…', 12)
+            FROM busqueda JOIN tickets t ON t.numero = busqueda.rowid
+            WHERE busqueda MATCH ?{filtros}
+            ORDER BY bm25(busqueda, 2.0, 1.0)
+            LIMIT ?
+            """,
+            [consulta, *parametros, limite]
+        ).fetchall()
+        return tipar_tickets(pd.DataFrame([tuple(f) for f in filas], columns=columnas))
+
+    # --------------------------------------------
+    # 2.3. Registro de Empresas, Usuarios y Agentes
+    # --------------------------------------------
+
+    def sembrar_registro_si_vacio(self, empresas: Dict[str, List[str]], agentes: List[str]) -> bool:
+        """
+        Registra las empresas (con sus usuarios) y los agentes indicados solo si el
+        registro está vacío, en una única transacción.
+        """
+        with self._transaccion() as conexion:
+            if conexion.execute("SELECT 1 FROM empresas LIMIT 1").fetchone():
+                return False
+            conexion.executemany("INSERT INTO empresas (nombre) VALUES (?)", [(e,) for e in empresas])
+            conexion.executemany(
+                "INSERT OR IGNORE INTO usuarios (empresa, nombre) VALUES (?, ?)",
+                [(e, u) for e, usuarios in empresas.items() for u in usuarios]
+            )
+            conexion.executemany("INSERT OR IGNORE INTO agentes (nombre) VALUES (?)", [(a,) for a in agentes])
+        return True
+
+    def reconstruir_registro(self) -> None:
+        """
+        Registra las empresas, usuarios y agentes que aparecen en los tickets.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute("INSERT OR IGNORE INTO empresas (nombre) SELECT DISTINCT empresa FROM tickets")
+            conexion.execute(
+                "INSERT OR IGNORE INTO usuarios (empresa, nombre) SELECT DISTINCT empresa, usuario FROM tickets"
+            )
+            conexion.execute("INSERT OR IGNORE INTO agentes (nombre) SELECT DISTINCT agente FROM tickets")
+
+    @staticmethod
+    def _nombre(valor: str, campo: str) -> str:
+        valor = valor.strip()
+        if not valor:
+            raise ValueError(f"El nombre {campo} no puede estar vacío.")
+        return valor
+
+    def agregar_empresa(self, nombre: str, usuarios: List[str]) -> None:
+        """
+        Registra una empresa nueva con sus usuarios. Lanza ValueError si ya existe
+        o si no tiene usuarios.
+        """
+        nombre = self._nombre(nombre, "de la empresa")
+        usuarios = [u.strip() for u in usuarios if u.strip()]
+        if not usuarios:
+            raise ValueError("Debe agregar al menos un usuario.")
+        try:
+            with self._transaccion() as conexion:
+                conexion.execute("INSERT INTO empresas (nombre) VALUES (?)", (nombre,))
+                conexion.executemany(
+                    "INSERT OR IGNORE INTO usuarios (empresa, nombre) VALUES (?, ?)",
+                    [(nombre, u) for u in usuarios]
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"La empresa '{nombre}' ya existe.") from None
+
+    def agregar_usuario(self, empresa: str, nombre: str) -> None:
+        """
+        Registra un usuario en una empresa. Lanza ValueError si la empresa no existe
+        (p. ej. porque otra sesión la acaba de eliminar) o si el usuario ya existe en ella.
+        """
+        nombre = self._nombre(nombre, "del usuario")
+        try:
+            with self._transaccion() as conexion:
+                # Dentro de la transacción: la empresa no puede desaparecer entre la
+                # comprobación y la inserción
+                if not conexion.execute("SELECT 1 FROM empresas WHERE nombre = ?", (empresa,)).fetchone():
+                    raise ValueError(f"La empresa '{empresa}' no existe.")
+                conexion.execute("INSERT INTO usuarios (empresa, nombre) VALUES (?, ?)", (empresa, nombre))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"El usuario '{nombre}' ya existe en '{empresa}'.") from None
+
+    def eliminar_usuario(self, empresa: str, nombre: str) -> None:
+        """
+        Quita un usuario del registro; sus tickets conservan el nombre. Lanza
+        ValueError si es el último usuario de la empresa.
+        """
+        with self._transaccion() as conexion:
+            if conexion.execute("SELECT COUNT(*) FROM usuarios WHERE empresa = ?", (empresa,)).fetchone()[0] <= 1:
+                raise ValueError("No se puede eliminar el último usuario de una empresa.")
+            conexion.execute("DELETE FROM usuarios WHERE empresa = ? AND nombre = ?", (empresa, nombre))
+
+    def buscar_empresas(self, prefijo: str = "", limite: int = 50) -> List[str]:
+        """
+        Devuelve hasta `limite` empresas cuyo nombre empieza por `prefijo`.
+        """
+        filas = self._conexion().execute(
+            "SELECT nombre FROM empresas WHERE nombre >= ? AND nombre < ? ORDER BY nombre LIMIT ?",
+            (*_rango_prefijo(prefijo.strip()), limite)
+        )
+        return [f[0] for f in filas]
+
+    def contar_usuarios(self, empresa: str, prefijo: str = "") -> int:
+        """
+        Cuenta los usuarios de una empresa cuyo nombre empieza por `prefijo`.
+        """
+        return self._conexion().execute(
+            "SELECT COUNT(*) FROM usuarios WHERE empresa = ? AND nombre >= ? AND nombre < ?",
+            (empresa, *_rango_prefijo(prefijo.strip()))
+        ).fetchone()[0]
+
+    def buscar_usuarios(self, empresa: str, prefijo: str = "", limite: int = 50, desde: int = 0) -> List[str]:
+        """
+        Devuelve, en orden alfabético, hasta `limite` usuarios de una empresa cuyo
+        nombre empieza por `prefijo`, saltando los `desde` primeros.
+        """
+        filas = self._conexion().execute(
+            """
+            SELECT nombre FROM usuarios
+            WHERE empresa = ? AND nombre >= ? AND nombre < ?
+            ORDER BY nombre LIMIT ? OFFSET ?
+            """,
+            (empresa, *_rango_prefijo(prefijo.strip()), limite, desde)
+        )
+        return [f[0] for f in filas]
+
+    def agentes(self) -> List[Dict]:
+        """
+        Devuelve los agentes registrados, con su email y departamento.
+        """
+        filas = self._conexion().execute("SELECT nombre, email, departamento FROM agentes ORDER BY nombre")
+        return [dict(f) for f in filas]
+
+    def nombres_agentes(self) -> List[str]:
+        """
+        Devuelve solo los nombres de los agentes registrados, en orden alfabético.
+        """
+        return [f[0] for f in self._conexion().execute("SELECT nombre FROM agentes ORDER BY nombre")]
+
+    def agregar_agente(self, nombre: str, email: str = "", departamento: str = "") -> None:
+        """
+        Registra un agente. Lanza ValueError si ya existe.
+        """
+        nombre = self._nombre(nombre, "del agente")
+        try:
+            with self._transaccion() as conexion:
+                conexion.execute(
+                    "INSERT INTO agentes (nombre, email, departamento) VALUES (?, ?, ?)",
+                    (nombre, email.strip(), departamento)
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"El agente '{nombre}' ya existe.") from None
+
+    def eliminar_agente(self, nombre: str) -> Dict[str, int]:
+        """
+        Quita un agente del registro y reparte sus tickets abiertos entre los demás
+        según su carga abierta, los de mayor prioridad primero, todo en una
+        transacción. Lanza ValueError si es el último agente. Devuelve cuántos
+        tickets recibió cada agente.
+        """
+        with self._transaccion() as conexion:
+            restantes = [
+                f[0] for f in conexion.execute("SELECT nombre FROM agentes WHERE nombre <> ?", (nombre,))
+            ]
+            if not restantes:
+                raise ValueError("No se puede eliminar el último agente.")
+            conexion.execute("DELETE FROM agentes WHERE nombre = ?", (nombre,))
+            return self._redistribuir(conexion, nombre, restantes)
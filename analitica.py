@@ -0,0 +1,134 @@
+"""
+Cálculos pesados en procesos aparte.
+
+Con TICKETS_PROCESOS=N (N > 0), el resumen de tiempos del dashboard y las
+importaciones se ejecutan en un ProcessPoolExecutor de N procesos, en lugar de
+ocupar el intérprete del servidor de Streamlit que atiende a las sesiones. Los
+procesos se crean con "spawn": no heredan por fork las conexiones SQLite abiertas
+del servidor, sino que cada uno abre las suyas sobre la misma base.
+
+El resumen calculado se guarda en el almacén junto a la versión de los datos, así
+que todos los procesos del despliegue lo comparten: el primero que lo necesita lo
+calcula y los demás lo leen.
+"""
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+import importacion
+import metricas
+from almacen import AlmacenTickets
+from compartido import TiemposCompartidos
+from historico import Historico
+
+# Clave del resumen de tiempos en la caché compartida del almacén
+CLAVE_TIEMPOS = "tiempos"
+
+Resumen = Tuple[pd.Series, pd.DataFrame, pd.DataFrame]
+
+# ============================================
+# 1. Grupo de Procesos
+# ============================================
+
+def procesos_configurados() -> int:
+    return int(os.environ.get("TICKETS_PROCESOS", "0") or 0)
+
+def crear_ejecutor(procesos: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    Crea el grupo de procesos de análisis, o devuelve None si está desactivado
+    (los cálculos se hacen entonces en el propio proceso).
+    """
+    procesos = procesos_configurados() if procesos is None else procesos
+    if procesos <= 0:
+        return None
+    # Cada proceso arranca un intérprete nuevo que vuelve a importar el módulo
+    # principal del padre (con `streamlit run`, el __main__ de la CLI de Streamlit,
+    # no el script de la aplicación) y luego solo recibe tareas de este módulo
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+
+# Almacén de cada proceso del grupo, abierto en la primera tarea que lo usa
+_almacenes: Dict[str, AlmacenTickets] = {}
+
+def _almacen(ruta: str) -> AlmacenTickets:
+    if ruta not in _almacenes:
+        _almacenes[ruta] = AlmacenTickets(ruta)
+    return _almacenes[ruta]
+
+# Tiempos por ticket de cada base: se recalculan solo los tickets que cambian
+_tiempos: Dict[str, TiemposCompartidos] = {}
+
+def _tiempos_compartidos(ruta: str) -> TiemposCompartidos:
+    if ruta not in _tiempos:
+        _tiempos[ruta] = TiemposCompartidos(_almacen(ruta))
+    return _tiempos[ruta]
+
+# Histórico de cada base, con los tiempos de los tickets archivados ya calculados
+_historicos: Dict[Tuple[str, str], Historico] = {}
+
+def _historico(ruta: str, raiz: str) -> Historico:
+    if (ruta, raiz) not in _historicos:
+        _historicos[ruta, raiz] = Historico(_almacen(ruta), raiz)
+    return _historicos[ruta, raiz]
+
+# ============================================
+# 2. Tareas
+# ============================================
+
+def resumir_tiempos(tiempos: pd.DataFrame) -> Resumen:
+    """
+    Devuelve los promedios y los percentiles por agente y por empresa de los tiempos.
+    """
+    return (
+        metricas.promedios(tiempos),
+        metricas.percentiles_por(tiempos, "agente"),
+        metricas.percentiles_por(tiempos, "empresa")
+    )
+
+def resumen_tiempos(ruta: str, raiz_historico: str) -> Tuple[int, Resumen]:
+    """
+    Calcula el resumen de tiempos de la base `ruta` y de su histórico y devuelve
+    la versión de los datos con la que se calculó. De los tickets del almacén solo
+    se recalculan los que cambiaron desde la vez anterior en este proceso; los del
+    histórico, solo si se archivaron más.
+    """
+    version, tiempos = _tiempos_compartidos(ruta).obtener()
+    return version, resumir_tiempos(_historico(ruta, raiz_historico).agregar_tiempos(tiempos))
+
+def importar_archivo(ruta: str, archivo: str, formato: Optional[str] = None) -> Dict:
+    """
+    Importa un archivo de tickets a la base `ruta`; devuelve el resumen de `importacion.importar`.
+    """
+    return importacion.importar(_almacen(ruta), archivo, formato)
+
+# ============================================
+# 3. Caché Compartida
+# ============================================
+
+def codificar_resumen(resumen: Resumen) -> str:
+    """
+    Convierte un resumen de tiempos en texto JSON para guardarlo en el almacén.
+    """
+    medias, por_agente, por_empresa = resumen
+    return json.dumps({
+        "medias": medias.to_json(),
+        "agente": por_agente.to_json(orient="split"),
+        "empresa": por_empresa.to_json(orient="split"),
+    })
+
+def decodificar_resumen(texto: str) -> Resumen:
+    """
+    Reconstruye un resumen de tiempos guardado con `codificar_resumen`.
+    """
+    datos = json.loads(texto)
+    # Sin conversiones: un agente o una empresa con nombre de fecha sigue siendo texto
+    opciones = {"convert_axes": False, "convert_dates": False}
+    medias = pd.read_json(io.StringIO(datos["medias"]), typ="series", **opciones)
+    por_agente = pd.read_json(io.StringIO(datos["agente"]), orient="split", **opciones)
+    por_empresa = pd.read_json(io.StringIO(datos["empresa"]), orient="split", **opciones)
+    por_agente.index.name, por_empresa.index.name = "agente", "empresa"
+    return medias, por_agente, por_empresa
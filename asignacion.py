@@ -0,0 +1,51 @@
+import heapq
+from typing import Dict, Iterable, List, Tuple
+
+# ============================================
+# 1. Carga de Trabajo
+# ============================================
+
+# Peso de un ticket abierto en la carga de su agente, según su prioridad
+PESOS_PRIORIDAD = {"Alta": 3, "Media": 2, "Baja": 1}
+
+def carga_ponderada(conteos: Iterable[Tuple[str, str, int]], agentes: List[str]) -> Dict[str, int]:
+    """
+    Calcula la carga de cada agente a partir de filas (agente, prioridad, tickets
+    abiertos). Los agentes sin tickets abiertos tienen carga cero.
+    """
+    cargas = {agente: 0 for agente in agentes}
+    for agente, prioridad, cantidad in conteos:
+        if agente in cargas:
+            cargas[agente] += PESOS_PRIORIDAD.get(prioridad, 1) * cantidad
+    return cargas
+
+# ============================================
+# 2. Reparto
+# ============================================
+
+def repartir(tickets: List[Tuple[int, str]], cargas: Dict[str, int]) -> Dict[int, str]:
+    """
+    Reparte tickets (numero, prioridad) entre los agentes de `cargas`.
+
+    Los tickets se asignan de mayor a menor prioridad, cada uno al agente con menos
+    carga en ese momento, usando un montículo de cargas: O(t log a) para t tickets
+    y a agentes. Devuelve el agente asignado a cada número de ticket.
+    """
+    if not cargas:
+        raise ValueError("No hay agentes disponibles para asignar tickets.")
+    monticulo = [(carga, agente) for agente, carga in cargas.items()]
+    heapq.heapify(monticulo)
+    asignaciones: Dict[int, str] = {}
+    for numero, prioridad in sorted(tickets, key=lambda t: -PESOS_PRIORIDAD.get(t[1], 1)):
+        carga, agente = heapq.heappop(monticulo)
+        asignaciones[numero] = agente
+        heapq.heappush(monticulo, (carga + PESOS_PRIORIDAD.get(prioridad, 1), agente))
+    return asignaciones
+
+def agente_menos_cargado(cargas: Dict[str, int]) -> str:
+    """
+    Devuelve el agente con menos carga; en caso de empate, el primero por nombre.
+    """
+    if not cargas:
+        raise ValueError("No hay agentes disponibles para asignar tickets.")
+    return min(cargas, key=lambda agente: (cargas[agente], agente))
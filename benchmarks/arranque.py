@@ -0,0 +1,102 @@
+"""
+Tiempo hasta el primer render de la aplicación, en frío y en caliente.
+
+En frío, cada repetición lanza un proceso nuevo que importa Streamlit, ejecuta
+la aplicación con AppTest y anota cuándo terminó la primera ejecución: mide lo
+que espera el primer usuario tras arrancar el servidor. En caliente, el mismo
+proceso abre sesiones nuevas (cachés ya llenas, módulos ya importados) y vuelve
+a ejecutar una de ellas, como al interactuar con un widget.
+
+    $ python benchmarks/arranque.py --repeticiones 5 --json arranque.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "streamlit_app.py")
+
+def _resumen(latencias: List[float]) -> Dict:
+    latencias = sorted(latencias)
+    return {
+        "repeticiones": len(latencias),
+        "p50_ms": round(statistics.median(latencias), 1),
+        "max_ms": round(latencias[-1], 1),
+    }
+
+def hijo(ruta: str, sesiones: int) -> None:
+    """
+    Ejecuta la aplicación en este proceso y escribe en la salida las mediciones
+    como JSON. Lo lanza `medir_frio` en un proceso nuevo.
+    """
+    os.environ["TICKETS_DB"] = ruta
+    from streamlit.testing.v1 import AppTest
+
+    prueba = AppTest.from_file(APP, default_timeout=600)
+    prueba.run()
+    primer_render = time.time()
+
+    # Otra ejecución de la misma sesión y sesiones nuevas en el proceso ya caliente
+    inicio = time.perf_counter()
+    prueba.run()
+    reejecucion_ms = (time.perf_counter() - inicio) * 1000
+    sesiones_ms = []
+    for _ in range(sesiones):
+        inicio = time.perf_counter()
+        AppTest.from_file(APP, default_timeout=600).run()
+        sesiones_ms.append((time.perf_counter() - inicio) * 1000)
+    print(json.dumps({"primer_render": primer_render, "reejecucion_ms": reejecucion_ms, "sesiones_ms": sesiones_ms}))
+
+def medir_frio(ruta: str, sesiones: int) -> Dict:
+    """
+    Lanza un proceso nuevo y devuelve sus mediciones, con el tiempo desde el
+    lanzamiento hasta el final de la primera ejecución en `frio_ms`.
+    """
+    inicio = time.time()
+    salida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--hijo", "--bd", ruta, "--sesiones", str(sesiones)],
+        capture_output=True, text=True, check=True, cwd=RAIZ
+    ).stdout
+    medicion = json.loads(salida.strip().splitlines()[-1])
+    medicion["frio_ms"] = (medicion.pop("primer_render") - inicio) * 1000
+    return medicion
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=5, help="procesos en frío")
+    parser.add_argument("--sesiones", type=int, default=5, help="sesiones en caliente por proceso")
+    parser.add_argument("--bd", help="base de datos a usar (por defecto, una temporal con datos de ejemplo)")
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    ruta = args.bd or os.path.join(tempfile.mkdtemp(), "arranque.db")
+    if args.hijo:
+        hijo(ruta, args.sesiones)
+        return
+
+    # Una primera ejecución siembra la base, para no medir la siembra como arranque
+    if not os.path.exists(ruta):
+        medir_frio(ruta, 0)
+    mediciones = [medir_frio(ruta, args.sesiones) for _ in range(args.repeticiones)]
+    resultado = {
+        "frio": _resumen([m["frio_ms"] for m in mediciones]),
+        "reejecucion": _resumen([m["reejecucion_ms"] for m in mediciones]),
+        "sesion_caliente": _resumen([t for m in mediciones for t in m["sesiones_ms"]]),
+    }
+    print(f"{'medición':<18}{'p50 ms':>10}{'máx ms':>10}")
+    for nombre, medida in resultado.items():
+        print(f"{nombre:<18}{medida['p50_ms']:>10}{medida['max_ms']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
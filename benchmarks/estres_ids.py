@@ -0,0 +1,75 @@
+"""
+Prueba de estrés de la asignación de números de ticket.
+
+Crea tickets desde varios procesos, cada uno con varios hilos, sobre la misma
+base de datos y comprueba que todos los identificadores asignados son únicos.
+
+    $ python benchmarks/estres_ids.py --procesos 4 --hilos 8 --tickets 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacen import AlmacenTickets  # noqa: E402
+from esquema import ahora  # noqa: E402
+
+def _ticket(proceso: int, hilo: int, i: int) -> dict:
+    return {
+        "problema": f"Estrés p{proceso} h{hilo} #{i}",
+        "estado": "Abierto",
+        "prioridad": "Media",
+        "fecha_creacion": ahora(),
+        "empresa": "Empresa A",
+        "usuario": "Usuario A1",
+        "agente": "Agente 1",
+    }
+
+def _crear_en_proceso(ruta: str, proceso: int, hilos: int, tickets: int) -> List[str]:
+    """
+    Crea `hilos * tickets` tickets desde un proceso y devuelve los ids asignados.
+    """
+    almacen = AlmacenTickets(ruta)
+
+    def crear(hilo: int) -> List[str]:
+        return [almacen.crear_ticket(_ticket(proceso, hilo, i)) for i in range(tickets)]
+
+    with ThreadPoolExecutor(hilos) as pool:
+        return [id_ for ids in pool.map(crear, range(hilos)) for id_ in ids]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--tickets", type=int, default=100, help="tickets por hilo")
+    parser.add_argument("--bd", help="base de datos a usar (por defecto, una temporal)")
+    args = parser.parse_args()
+
+    ruta = args.bd or os.path.join(tempfile.mkdtemp(), "estres.db")
+    # Crear el esquema antes de lanzar los procesos y cerrar la conexión antes del fork
+    AlmacenTickets(ruta).cerrar()
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(args.procesos) as pool:
+        futuros = [
+            pool.submit(_crear_en_proceso, ruta, p, args.hilos, args.tickets)
+            for p in range(args.procesos)
+        ]
+        ids = [id_ for f in futuros for id_ in f.result()]
+    duracion = time.perf_counter() - inicio
+
+    esperados = args.procesos * args.hilos * args.tickets
+    guardados = AlmacenTickets(ruta).contar()
+    print(f"Tickets creados: {len(ids)} en {duracion:.2f} s ({len(ids) / duracion:.0f} tickets/s)")
+    assert len(ids) == esperados, f"se esperaban {esperados} ids, se obtuvieron {len(ids)}"
+    assert len(set(ids)) == esperados, f"ids duplicados: {esperados - len(set(ids))}"
+    assert guardados == esperados, f"el almacén tiene {guardados} tickets, se esperaban {esperados}"
+    print("Todos los identificadores son únicos.")
+
+if __name__ == "__main__":
+    main()
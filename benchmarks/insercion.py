@@ -0,0 +1,76 @@
+"""
+Latencia de creación de tickets.
+
+Crea tickets uno a uno con AlmacenTickets.crear_ticket (una transacción por
+ticket, como hace la página "Nuevo Ticket") y muestra la latencia por inserción
+en tramos, para comprobar que no crece con el tamaño del almacén.
+
+    $ python benchmarks/insercion.py --tickets 100000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacen import AlmacenTickets  # noqa: E402
+from esquema import ahora  # noqa: E402
+
+def _percentil(valores, p: float) -> float:
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=100_000)
+    parser.add_argument("--tramos", type=int, default=10, help="en cuántos tramos se resume la latencia")
+    parser.add_argument("--bd", help="base de datos a usar (por defecto, una temporal)")
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    args = parser.parse_args()
+
+    almacen = AlmacenTickets(args.bd or os.path.join(tempfile.mkdtemp(), "insercion.db"))
+    latencias = []
+    for i in range(args.tickets):
+        momento = ahora()
+        ticket = {
+            "problema": f"Ticket de prueba {i}",
+            "estado": "Abierto",
+            "prioridad": "Media",
+            "fecha_creacion": momento,
+            "empresa": "Empresa A",
+            "usuario": "Usuario A1",
+            "agente": "Agente 1",
+            "mensajes": [{"contenido": f"Ticket de prueba {i}", "autor": "Usuario A1",
+                          "timestamp": momento, "tipo": "usuario"}],
+        }
+        inicio = time.perf_counter()
+        almacen.crear_ticket(ticket)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    tamano = max(1, len(latencias) // args.tramos)
+    tramos = []
+    print(f"{'tickets':>17}  {'p50 ms':>8}  {'p99 ms':>8}  {'media ms':>8}")
+    for inicio in range(0, len(latencias), tamano):
+        tramo = latencias[inicio:inicio + tamano]
+        fila = {
+            "desde": inicio,
+            "hasta": inicio + len(tramo),
+            "p50_ms": round(statistics.median(tramo), 3),
+            "p99_ms": round(_percentil(tramo, 0.99), 3),
+            "media_ms": round(statistics.fmean(tramo), 3),
+        }
+        tramos.append(fila)
+        print(f"{fila['desde']:>8}-{fila['hasta']:<8}  {fila['p50_ms']:>8}  {fila['p99_ms']:>8}  {fila['media_ms']:>8}")
+    total = sum(latencias) / 1000
+    print(f"Total: {args.tickets} tickets en {total:.1f} s ({args.tickets / total:.0f} tickets/s)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump({"tickets": args.tickets, "segundos": total, "tramos": tramos}, archivo, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Suite de rendimiento de los flujos de trabajo con tickets.
+
+Para cada escala genera (o reutiliza) una base con tickets sintéticos y mide:
+el dashboard y los filtros de "Tickets Existentes" renderizados sin navegador con
+AppTest, y la búsqueda por id, la creación de tickets y el envío de mensajes
+llamando directamente al almacén. El resultado se guarda en JSON; con
+--comparar se marca como regresión toda operación cuya mediana empeore más que
+la tolerancia respecto a una ejecución anterior.
+
+    $ python benchmarks/suite.py --escalas 10000 100000 --json resultado.json
+    $ python benchmarks/suite.py --escalas 10000 --comparar resultado.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import generador  # noqa: E402
+from almacen import AlmacenTickets, id_ticket  # noqa: E402
+from esquema import ahora  # noqa: E402
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "streamlit_app.py")
+
+# ============================================
+# 1. Medición
+# ============================================
+
+def _percentil(valores: List[float], p: float) -> float:
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+def medir(funcion: Callable[[], object], repeticiones: int) -> Dict:
+    """
+    Ejecuta `funcion` `repeticiones` veces y resume sus latencias en milisegundos.
+    """
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "repeticiones": repeticiones,
+        "p50_ms": round(statistics.median(latencias), 3),
+        "p99_ms": round(_percentil(latencias, 0.99), 3),
+        "media_ms": round(statistics.fmean(latencias), 3),
+    }
+
+def preparar(escala: int, directorio: str, semilla: int) -> Dict:
+    """
+    Devuelve la ruta de una copia de trabajo con `escala` tickets y, si hubo que
+    generar la base, cuánto tardó. Las bases generadas con la misma semilla se
+    reutilizan; las mediciones escriben en la copia, así que no alteran el original.
+    """
+    original = os.path.join(directorio, f"carga_{escala}_{semilla}.db")
+    generacion = None
+    if not os.path.exists(original):
+        empresas, agentes = generador.catalogo(empresas=50, usuarios=20, agentes=25)
+        inicio = time.perf_counter()
+        almacen = AlmacenTickets(original + ".tmp")
+        generador.poblar(
+            almacen,
+            generador.generar_tickets(escala, empresas, agentes, semilla=semilla, dias=365, max_mensajes=8)
+        )
+        # Al cerrar la última conexión SQLite vuelca el WAL en el archivo principal
+        almacen.cerrar()
+        os.replace(original + ".tmp", original)
+        generacion = round(time.perf_counter() - inicio, 2)
+    ruta = os.path.join(directorio, f"trabajo_{escala}_{semilla}.db")
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+    shutil.copyfile(original, ruta)
+    return {"ruta": ruta, "generacion_s": generacion}
+
+# ============================================
+# 2. Operaciones
+# ============================================
+
+def _nueva_prueba(ruta: str) -> AppTest:
+    # Cada escala usa su propia base: se vacían las cachés que guardan el almacén
+    os.environ["TICKETS_DB"] = ruta
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    return AppTest.from_file(APP, default_timeout=600)
+
+def medir_interfaz(ruta: str, repeticiones: int) -> Dict:
+    """
+    Mide las páginas renderizadas sin navegador, como las vería un usuario.
+    """
+    resultados = {}
+    prueba = _nueva_prueba(ruta)
+    resultados["dashboard_frio"] = medir(prueba.run, 1)
+    resultados["dashboard"] = medir(prueba.run, repeticiones)
+
+    prueba.sidebar.radio[0].set_value("Tickets Existentes").run()
+    filtros = [["Abierto"], ["Abierto", "En Progreso"], ["Cerrado"]]
+    ciclo = iter(filtros * repeticiones)
+    resultados["filtro_estado"] = medir(lambda: prueba.multiselect[0].set_value(next(ciclo)).run(), repeticiones)
+
+    prueba.sidebar.radio[0].set_value("Nuevo Ticket").run()
+
+    def crear_desde_formulario():
+        prueba.text_area[0].set_value(f"Ticket de la suite {time.perf_counter_ns()}")
+        prueba.button[0].click().run()
+
+    resultados["nuevo_ticket_formulario"] = medir(crear_desde_formulario, max(1, repeticiones // 5))
+    return resultados
+
+def medir_almacen(ruta: str, escala: int, repeticiones: int, semilla: int) -> Dict:
+    """
+    Mide las operaciones del almacén que respaldan cada página.
+    """
+    almacen = AlmacenTickets(ruta)
+    azar = random.Random(semilla)
+    numeros = [1000 + azar.randrange(escala) for _ in range(repeticiones)]
+    resultados = {}
+
+    ids = iter([id_ticket(n) for n in numeros])
+    resultados["buscar_por_id"] = medir(lambda: almacen.obtener_ticket(next(ids)), repeticiones)
+
+    resultados["filtro_pagina"] = medir(
+        lambda: almacen.pagina_tickets(["Abierto", "En Progreso"], [], ["Alta"], limite=51), repeticiones
+    )
+
+    def crear():
+        momento = ahora()
+        almacen.crear_ticket({
+            "problema": "Ticket de la suite", "estado": "Abierto", "prioridad": "Media",
+            "fecha_creacion": momento, "empresa": "Empresa 01", "usuario": "Usuario 01-1",
+            "agente": "Agente 1",
+            "mensajes": [{"contenido": "Ticket de la suite", "autor": "Usuario 01-1",
+                          "timestamp": momento, "tipo": "usuario"}],
+        })
+
+    resultados["nuevo_ticket"] = medir(crear, repeticiones)
+
+    destinos = iter(numeros)
+    resultados["agregar_mensaje"] = medir(
+        lambda: almacen.agregar_mensaje(next(destinos), {
+            "contenido": "Mensaje de la suite", "autor": "Agente 1", "timestamp": ahora(), "tipo": "agente"
+        }),
+        repeticiones
+    )
+    return resultados
+
+# ============================================
+# 3. Comparación y Línea de Comandos
+# ============================================
+
+def regresiones(actual: Dict, base: Dict, tolerancia: float, margen_ms: float) -> List[str]:
+    """
+    Lista las operaciones cuya mediana supera en más de `tolerancia` veces la de
+    `base` y además empeora en más de `margen_ms`, para no confundir el ruido de
+    las operaciones de microsegundos con una regresión.
+    """
+    encontradas = []
+    for escala, datos in actual["escalas"].items():
+        anteriores = base.get("escalas", {}).get(escala, {}).get("operaciones", {})
+        for operacion, medida in datos["operaciones"].items():
+            anterior = anteriores.get(operacion)
+            if (
+                anterior
+                and medida["p50_ms"] > anterior["p50_ms"] * tolerancia
+                and medida["p50_ms"] - anterior["p50_ms"] > margen_ms
+            ):
+                encontradas.append(
+                    f"{escala} tickets, {operacion}: p50 {medida['p50_ms']} ms (antes {anterior['p50_ms']} ms)"
+                )
+    return encontradas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--escalas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--directorio", default=tempfile.gettempdir(), help="dónde guardar las bases generadas")
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    parser.add_argument("--comparar", help="resultado JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=1.5, help="empeoramiento admitido de la mediana")
+    parser.add_argument("--margen-ms", type=float, default=1.0, help="empeoramiento absoluto ignorado")
+    args = parser.parse_args()
+
+    resultado = {
+        "fecha": ahora(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "semilla": args.semilla,
+        "escalas": {},
+    }
+    for escala in args.escalas:
+        preparada = preparar(escala, args.directorio, args.semilla)
+        if preparada["generacion_s"] is not None:
+            print(f"{escala} tickets generados en {preparada['generacion_s']} s")
+        operaciones = {
+            **medir_interfaz(preparada["ruta"], args.repeticiones),
+            **medir_almacen(preparada["ruta"], escala, args.repeticiones, args.semilla),
+        }
+        resultado["escalas"][str(escala)] = {"generacion_s": preparada["generacion_s"], "operaciones": operaciones}
+        print(f"\n{escala} tickets\n{'operación':<26}{'p50 ms':>10}{'p99 ms':>10}")
+        for operacion, medida in operaciones.items():
+            print(f"{operacion:<26}{medida['p50_ms']:>10}{medida['p99_ms']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            encontradas = regresiones(resultado, json.load(archivo), args.tolerancia, args.margen_ms)
+        for linea in encontradas:
+            print(f"REGRESIÓN: {linea}")
+        if encontradas:
+            sys.exit(1)
+        print("\nSin regresiones.")
+
+if __name__ == "__main__":
+    main()
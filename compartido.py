@@ -0,0 +1,63 @@
+import threading
+from typing import Optional, Tuple
+
+import pandas as pd
+
+import metricas
+from almacen import AlmacenTickets
+
+# ============================================
+# 1. Tiempos Compartidos entre Sesiones
+# ============================================
+
+# Si cambia más de esta fracción de los tickets, se recarga todo en lugar de
+# recalcular ticket a ticket
+UMBRAL_RECARGA = 0.25
+
+class TiemposCompartidos:
+    """
+    Tiempos de respuesta y resolución de todos los tickets, compartidos por todas
+    las sesiones del proceso (una sola copia en memoria, no una por sesión).
+
+    Cada lectura compara la versión global del almacén con la última aplicada y,
+    si cambió, recalcula solo las filas de los tickets modificados desde entonces.
+    El DataFrame nunca se modifica en sitio: cada refresco publica uno nuevo, así
+    que una sesión que ya tiene el anterior puede seguir usándolo sin bloqueos.
+    """
+
+    def __init__(self, almacen: AlmacenTickets):
+        self.almacen = almacen
+        self.version = -1
+        self.tiempos: Optional[pd.DataFrame] = None
+        self._cerrojo = threading.Lock()
+
+    def obtener(self) -> Tuple[int, pd.DataFrame]:
+        """
+        Devuelve la versión aplicada y los tiempos por ticket al día.
+        """
+        if self.tiempos is not None and self.almacen.version() == self.version:
+            return self.version, self.tiempos
+        with self._cerrojo:
+            if self.tiempos is None:
+                self._recargar()
+            else:
+                version, numeros = self.almacen.cambios_desde(self.version)
+                if len(numeros) > UMBRAL_RECARGA * max(len(self.tiempos), 1):
+                    self._recargar()
+                elif numeros:
+                    self._aplicar(version, numeros)
+            return self.version, self.tiempos
+
+    def _recargar(self) -> None:
+        # La versión se lee antes que los datos: lo que cambie mientras se cargan
+        # tendrá una versión mayor y se volverá a aplicar en el siguiente refresco
+        version = self.almacen.version()
+        self.tiempos = metricas.tiempos_por_ticket(*self.almacen.datos_tiempos())
+        self.version = version
+
+    def _aplicar(self, version: int, numeros) -> None:
+        nuevos = metricas.tiempos_por_ticket(*self.almacen.datos_tiempos(numeros))
+        # Los tickets borrados desaparecen: están en `numeros` pero no en `nuevos`
+        vigentes = self.tiempos[~self.tiempos["numero"].isin(numeros)]
+        self.tiempos = pd.concat([vigentes, nuevos], ignore_index=True)
+        self.version = version
@@ -0,0 +1,192 @@
+"""
+Despliegue en varios procesos de Streamlit detrás de un balanceador local.
+
+Lanza N procesos `streamlit run` en puertos consecutivos y un balanceador TCP en
+el puerto público. El balanceador reparte las conexiones nuevas entre los
+procesos por turnos y fija cada navegador a su proceso con una cookie: la
+conexión websocket de la sesión, sus reconexiones y los recursos de la página
+van siempre al mismo proceso, que es el que guarda el estado de la sesión.
+
+Todos los procesos comparten la base de tickets (TICKETS_DB) y, en ella, los
+agregados y los resúmenes ya calculados. Con --procesos-analitica, cada uno
+calcula además los resúmenes y las importaciones en su propio grupo de procesos.
+
+    $ python despliegue.py --trabajadores 4 --puerto 8501 --procesos-analitica 2
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import List, Optional
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(RAIZ, "streamlit_app.py")
+
+# Cookie que fija el navegador a un proceso
+COOKIE = "tickets_trabajador"
+
+# Tamaño máximo de la cabecera HTTP de la primera petición de una conexión
+MAX_CABECERA = 64 * 1024
+
+# ============================================
+# 1. Procesos de Streamlit
+# ============================================
+
+def lanzar_trabajadores(cantidad: int, puerto: int, procesos_analitica: int) -> List[subprocess.Popen]:
+    """
+    Lanza `cantidad` procesos de Streamlit en los puertos siguientes a `puerto`.
+    """
+    entorno = {**os.environ, "TICKETS_PROCESOS": str(procesos_analitica)}
+    return [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", APP,
+                "--server.headless", "true",
+                "--server.address", "127.0.0.1",
+                "--server.port", str(puerto + 1 + i),
+            ],
+            cwd=RAIZ, env=entorno
+        )
+        for i in range(cantidad)
+    ]
+
+def esperar_trabajadores(puerto: int, cantidad: int, limite: float = 60) -> None:
+    """
+    Espera a que todos los procesos respondan a la comprobación de salud de Streamlit.
+    """
+    fin = time.monotonic() + limite
+    for i in range(cantidad):
+        url = f"http://127.0.0.1:{puerto + 1 + i}/_stcore/health"
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=1):
+                    break
+            except OSError:
+                if time.monotonic() > fin:
+                    raise RuntimeError(f"El proceso de {url} no arrancó a tiempo.")
+                time.sleep(0.2)
+
+def detener_trabajadores(trabajadores: List[subprocess.Popen]) -> None:
+    for trabajador in trabajadores:
+        trabajador.terminate()
+    for trabajador in trabajadores:
+        try:
+            trabajador.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            trabajador.kill()
+
+# ============================================
+# 2. Balanceador con Sesiones Fijas
+# ============================================
+
+def trabajador_de_cookie(cabecera: bytes, cantidad: int) -> Optional[int]:
+    """
+    Devuelve el proceso fijado por la cookie de la cabecera, o None si no hay
+    cookie o no corresponde a ningún proceso.
+    """
+    encontrada = re.search(rb"^cookie:.*?\b" + COOKIE.encode() + rb"=(\d+)", cabecera, re.IGNORECASE | re.MULTILINE)
+    if encontrada is None:
+        return None
+    indice = int(encontrada.group(1))
+    return indice if indice < cantidad else None
+
+async def _copiar(origen: asyncio.StreamReader, destino: asyncio.StreamWriter) -> None:
+    try:
+        while datos := await origen.read(65536):
+            destino.write(datos)
+            await destino.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        destino.close()
+
+async def _copiar_con_cookie(origen: asyncio.StreamReader, destino: asyncio.StreamWriter, indice: int) -> None:
+    # Añade la cookie a la cabecera de la primera respuesta y copia el resto tal cual
+    try:
+        cabecera = await origen.readuntil(b"\r\n\r\n")
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        destino.close()
+        return
+    galleta = f"Set-Cookie: {COOKIE}={indice}; Path=/; HttpOnly; SameSite=Lax\r\n".encode()
+    destino.write(cabecera[:-2] + galleta + b"\r\n")
+    await _copiar(origen, destino)
+
+class Balanceador:
+    """
+    Reparte las conexiones entre los procesos de Streamlit de los puertos
+    siguientes a `puerto` y respeta la cookie de sesión fija de cada navegador.
+    Si el proceso elegido no acepta la conexión, prueba con el siguiente.
+    """
+
+    def __init__(self, puerto: int, cantidad: int):
+        self.puerto = puerto
+        self.cantidad = cantidad
+        self._turno = itertools.cycle(range(cantidad))
+
+    async def atender(self, lector: asyncio.StreamReader, escritor: asyncio.StreamWriter) -> None:
+        try:
+            cabecera = await lector.readuntil(b"\r\n\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            escritor.close()
+            return
+        fijado = trabajador_de_cookie(cabecera, self.cantidad)
+        primero = next(self._turno) if fijado is None else fijado
+        for intento in range(self.cantidad):
+            indice = (primero + intento) % self.cantidad
+            try:
+                lector_destino, escritor_destino = await asyncio.open_connection("127.0.0.1", self.puerto + 1 + indice)
+                break
+            except OSError:
+                continue
+        else:
+            escritor.close()
+            return
+        escritor_destino.write(cabecera)
+        # Se fija el navegador a este proceso si no lo estaba o si el suyo no respondió
+        respuesta = (
+            _copiar(lector_destino, escritor) if indice == fijado
+            else _copiar_con_cookie(lector_destino, escritor, indice)
+        )
+        await asyncio.gather(_copiar(lector, escritor_destino), respuesta)
+
+    async def servir(self) -> None:
+        servidor = await asyncio.start_server(self.atender, "0.0.0.0", self.puerto, limit=MAX_CABECERA)
+        async with servidor:
+            await servidor.serve_forever()
+
+# ============================================
+# 3. Línea de Comandos
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trabajadores", type=int, default=os.cpu_count() or 2, help="procesos de Streamlit")
+    parser.add_argument("--puerto", type=int, default=8501, help="puerto público del balanceador")
+    parser.add_argument(
+        "--procesos-analitica", type=int, default=0,
+        help="procesos de análisis por trabajador (0: en el propio trabajador)"
+    )
+    args = parser.parse_args()
+
+    trabajadores = lanzar_trabajadores(args.trabajadores, args.puerto, args.procesos_analitica)
+    # SIGTERM termina igual que Ctrl+C, deteniendo los procesos de Streamlit
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        esperar_trabajadores(args.puerto, args.trabajadores)
+        print(f"{args.trabajadores} procesos listos en http://localhost:{args.puerto}", flush=True)
+        asyncio.run(Balanceador(args.puerto, args.trabajadores).servir())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Un segundo Ctrl+C no debe dejar procesos a medio detener
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        detener_trabajadores(trabajadores)
+
+if __name__ == "__main__":
+    main()
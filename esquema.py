@@ -0,0 +1,109 @@
+import datetime
+from typing import Dict
+
+import pandas as pd
+
+# ============================================
+# 1. Valores Permitidos
+# ============================================
+
+ESTADOS = ["Abierto", "En Progreso", "Cerrado"]
+ESTADOS_ABIERTOS = ["Abierto", "En Progreso"]
+PRIORIDADES = ["Alta", "Media", "Baja"]
+TIPOS_MENSAJE = ["usuario", "agente"]
+
+# Formato con el que se guardan las fechas en el almacén
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+# Tipos de las columnas de un ticket una vez cargado en un DataFrame
+TIPOS_TICKET = {
+    "estado": pd.CategoricalDtype(ESTADOS),
+    "prioridad": pd.CategoricalDtype(PRIORIDADES),
+    "empresa": "category",
+    "usuario": "category",
+    "agente": "category",
+}
+COLUMNAS_FECHA = ["fecha_creacion", "fecha_cierre"]
+
+CAMPOS_TICKET = ["problema", "estado", "prioridad", "fecha_creacion", "empresa", "usuario", "agente"]
+CAMPOS_MENSAJE = ["contenido", "autor", "timestamp", "tipo"]
+
+def ahora() -> str:
+    """
+    Devuelve la fecha y hora actuales en el formato del almacén.
+    """
+    return datetime.datetime.now().strftime(FORMATO_FECHA)
+
+# ============================================
+# 2. Validación
+# ============================================
+
+def _validar_fecha(valor, campo: str) -> None:
+    # fromisoformat está implementado en C y es mucho más rápido que strptime; la
+    # longitud y el separador fijan el formato exacto AAAA-MM-DD HH:MM:SS
+    try:
+        valido = len(valor) == 19 and valor[10] == " " and datetime.datetime.fromisoformat(valor)
+    except (TypeError, ValueError):
+        valido = False
+    if not valido:
+        raise ValueError(f"'{campo}' debe tener el formato AAAA-MM-DD HH:MM:SS, no {valor!r}.")
+
+def validar_ticket(ticket: Dict) -> None:
+    """
+    Comprueba que un ticket cumple el esquema antes de guardarlo.
+    Lanza ValueError con un mensaje legible si no es así.
+    """
+    faltantes = [c for c in CAMPOS_TICKET if c not in ticket]
+    if faltantes:
+        raise ValueError(f"Faltan campos del ticket: {', '.join(faltantes)}.")
+    validar_campos(ticket["estado"], ticket["prioridad"])
+    for campo in ("problema", "empresa", "usuario", "agente"):
+        if not isinstance(ticket[campo], str) or not ticket[campo].strip():
+            raise ValueError(f"'{campo}' no puede estar vacío.")
+    _validar_fecha(ticket["fecha_creacion"], "fecha_creacion")
+    if ticket.get("fecha_cierre") is not None:
+        _validar_fecha(ticket["fecha_cierre"], "fecha_cierre")
+    for mensaje in ticket.get("mensajes", []):
+        validar_mensaje(mensaje)
+
+def validar_campos(estado: str, prioridad: str) -> None:
+    """
+    Comprueba los campos editables de un ticket.
+    """
+    if estado not in ESTADOS:
+        raise ValueError(f"Estado desconocido: {estado!r}.")
+    if prioridad not in PRIORIDADES:
+        raise ValueError(f"Prioridad desconocida: {prioridad!r}.")
+
+def validar_mensaje(mensaje: Dict) -> None:
+    """
+    Comprueba que un mensaje cumple el esquema antes de guardarlo.
+    """
+    if not isinstance(mensaje, dict):
+        raise ValueError(f"Cada mensaje debe ser un objeto con sus campos, no {mensaje!r}.")
+    faltantes = [c for c in CAMPOS_MENSAJE if c not in mensaje]
+    if faltantes:
+        raise ValueError(f"Faltan campos del mensaje: {', '.join(faltantes)}.")
+    # Un valor de otro tipo haría fallar la inserción de todo el lote, no solo la fila
+    for campo in ("contenido", "autor", "tipo", "timestamp"):
+        if not isinstance(mensaje[campo], str):
+            raise ValueError(f"'{campo}' del mensaje debe ser texto, no {mensaje[campo]!r}.")
+    if mensaje["tipo"] not in TIPOS_MENSAJE:
+        raise ValueError(f"Tipo de mensaje desconocido: {mensaje['tipo']!r}.")
+    _validar_fecha(mensaje["timestamp"], "timestamp")
+
+# ============================================
+# 3. Tipado de DataFrames
+# ============================================
+
+def tipar_tickets(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte las columnas de tickets presentes en `df` a sus tipos nativos:
+    datetime64[ns] para las fechas y categorías para los campos de baja cardinalidad.
+    """
+    tipos = {c: t for c, t in TIPOS_TICKET.items() if c in df.columns}
+    df = df.astype(tipos)
+    for columna in COLUMNAS_FECHA:
+        if columna in df.columns:
+            df[columna] = pd.to_datetime(df[columna], format=FORMATO_FECHA).astype("datetime64[ns]")
+    return df
@@ -0,0 +1,200 @@
+"""
+Generador reproducible de tickets sintéticos.
+
+Produce tickets con mensajes, empresas y agentes con distribuciones parecidas a
+las reales: unas pocas empresas concentran la mayoría de los tickets (Zipf), el
+número de mensajes por ticket decae geométricamente y los tickets antiguos están
+casi todos cerrados. Con la misma semilla se obtienen siempre los mismos tickets.
+Se genera por lotes, así que la memoria no crece con el número de tickets.
+
+    $ python generador.py --tickets 1000000 --bd carga.db --semilla 42
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from almacen import AlmacenTickets, id_ticket
+from esquema import FORMATO_FECHA, PRIORIDADES
+
+# ============================================
+# 1. Catálogo
+# ============================================
+
+PROBLEMAS = [
+    "Error de conexión a la red",
+    "Aplicación se cierra inesperadamente",
+    "Impresora no responde",
+    "Problemas con el correo electrónico",
+    "Fallo en respaldo de datos",
+    "Problemas de autenticación",
+    "Bajo rendimiento del sitio web",
+    "Vulnerabilidad de seguridad detectada",
+    "Fallo de hardware en servidor",
+    "Problemas de acceso a archivos compartidos"
+]
+
+MENSAJES_USUARIO = [
+    "El problema sigue ocurriendo",
+    "Adjunto captura del error",
+    "Ocurre desde esta mañana",
+    "Afecta a todo el equipo",
+    "Ya reinicié el equipo y no se resolvió",
+    "¿Hay novedades?"
+]
+
+MENSAJES_AGENTE = [
+    "Estamos revisando el caso",
+    "¿Puede indicar la versión que usa?",
+    "Aplicamos una corrección, por favor confirme",
+    "Escalado al equipo de infraestructura",
+    "Reinicie el servicio e intente de nuevo",
+    "El problema quedó resuelto"
+]
+
+# Proporción de tickets de cada prioridad, en el orden de PRIORIDADES
+PESOS_PRIORIDAD = [0.2, 0.5, 0.3]
+
+def catalogo(empresas: int, usuarios: int, agentes: int) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Crea `empresas` empresas con `usuarios` usuarios cada una y `agentes` agentes.
+    """
+    ancho = len(str(empresas))
+    nombres = {
+        f"Empresa {e:0{ancho}d}": [f"Usuario {e:0{ancho}d}-{u}" for u in range(1, usuarios + 1)]
+        for e in range(1, empresas + 1)
+    }
+    return nombres, [f"Agente {a}" for a in range(1, agentes + 1)]
+
+# ============================================
+# 2. Generación
+# ============================================
+
+def generar_tickets(
+    cantidad: int,
+    empresas: Dict[str, List[str]],
+    agentes: List[str],
+    semilla: int = 0,
+    dias: int = 30,
+    max_mensajes: int = 4,
+    inicio: int = 1000,
+    lote: int = 5000,
+    hasta: Optional[datetime.datetime] = None
+) -> Iterator[List[Dict]]:
+    """
+    Genera `cantidad` tickets en listas de hasta `lote`, con ids consecutivos
+    desde TICKET-`inicio` y fechas de creación en los `dias` anteriores a `hasta`.
+
+    - Empresas: popularidad Zipf (la k-ésima recibe tickets en proporción a 1/k).
+    - Mensajes: entre 1 y `max_mensajes`, geométrico; alternan usuario y agente
+      con esperas exponenciales (respuesta del agente ~4 h, del usuario ~12 h).
+    - Estado: la probabilidad de estar cerrado crece con la antigüedad; un
+      ticket cerrado se da por resuelto con su último mensaje.
+    """
+    azar = random.Random(semilla)
+    hasta = (hasta or datetime.datetime.now()).replace(microsecond=0)
+    nombres_empresas = list(empresas)
+    pesos_empresas = _acumulados([1 / k for k in range(1, len(nombres_empresas) + 1)])
+    pesos_prioridad = _acumulados(PESOS_PRIORIDAD)
+    segundos = dias * 86400
+
+    pendientes: List[Dict] = []
+    for i in range(cantidad):
+        empresa = azar.choices(nombres_empresas, cum_weights=pesos_empresas)[0]
+        usuario = azar.choice(empresas[empresa])
+        agente = azar.choice(agentes)
+        fecha = hasta - datetime.timedelta(seconds=azar.randrange(segundos))
+
+        mensajes: List[Dict] = []
+        momento = fecha
+        for j in range(max_mensajes):
+            if j > 0 and (momento > hasta or azar.random() < 0.45):
+                break
+            de_usuario = j % 2 == 0
+            mensajes.append({
+                "contenido": azar.choice(MENSAJES_USUARIO if de_usuario else MENSAJES_AGENTE),
+                "autor": usuario if de_usuario else agente,
+                "timestamp": momento.strftime(FORMATO_FECHA),
+                "tipo": "usuario" if de_usuario else "agente"
+            })
+            momento += datetime.timedelta(hours=azar.expovariate(1 / (4 if de_usuario else 12)))
+
+        edad = (hasta - fecha).total_seconds() / 86400
+        if azar.random() < min(0.95, edad / 10):
+            estado = "Cerrado"
+        else:
+            estado = "En Progreso" if len(mensajes) > 1 else "Abierto"
+
+        pendientes.append({
+            "id": id_ticket(inicio + i),
+            "problema": azar.choice(PROBLEMAS),
+            "estado": estado,
+            "prioridad": azar.choices(PRIORIDADES, cum_weights=pesos_prioridad)[0],
+            "fecha_creacion": fecha.strftime(FORMATO_FECHA),
+            "empresa": empresa,
+            "usuario": usuario,
+            "agente": agente,
+            "mensajes": mensajes,
+            "fecha_cierre": mensajes[-1]["timestamp"] if estado == "Cerrado" else None
+        })
+        if len(pendientes) == lote:
+            yield pendientes
+            pendientes = []
+    if pendientes:
+        yield pendientes
+
+def _acumulados(pesos: List[float]) -> List[float]:
+    total = 0.0
+    acumulados = []
+    for peso in pesos:
+        total += peso
+        acumulados.append(total)
+    return acumulados
+
+def poblar(almacen: AlmacenTickets, lotes: Iterator[List[Dict]], progreso=None) -> int:
+    """
+    Inserta en el almacén los lotes de `generar_tickets`, uno por transacción.
+    Devuelve el número de tickets insertados.
+    """
+    total = 0
+    for tickets in lotes:
+        almacen.insertar_tickets(tickets)
+        total += len(tickets)
+        if progreso is not None:
+            progreso(total)
+    return total
+
+# ============================================
+# 3. Línea de Comandos
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Llena una base de datos con tickets sintéticos.")
+    parser.add_argument("--tickets", type=int, default=10_000)
+    parser.add_argument("--bd", default=os.environ.get("TICKETS_DB", "tickets.db"), help="base de datos de tickets")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--empresas", type=int, default=50)
+    parser.add_argument("--usuarios", type=int, default=20, help="usuarios por empresa")
+    parser.add_argument("--agentes", type=int, default=25)
+    parser.add_argument("--dias", type=int, default=365, help="antigüedad máxima de los tickets")
+    parser.add_argument("--mensajes", type=int, default=8, help="máximo de mensajes por ticket")
+    parser.add_argument("--lote", type=int, default=5000, help="tickets por lote")
+    args = parser.parse_args()
+
+    almacen = AlmacenTickets(args.bd)
+    empresas, agentes = catalogo(args.empresas, args.usuarios, args.agentes)
+    inicio = time.perf_counter()
+    total = poblar(
+        almacen,
+        generar_tickets(
+            args.tickets, empresas, agentes, semilla=args.semilla, dias=args.dias,
+            max_mensajes=args.mensajes, inicio=almacen.siguiente_numero(), lote=args.lote
+        ),
+        progreso=lambda n: print(f"\r{n} tickets", end="", flush=True)
+    )
+    print(f"\nGenerados {total} tickets en {time.perf_counter() - inicio:.1f} s.")
+
+if __name__ == "__main__":
+    main()
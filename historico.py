@@ -0,0 +1,259 @@
+"""
+Histórico columnar de los tickets cerrados.
+
+Los tickets cerrados ya no cambian, pero son la mayor parte de los datos y el
+dashboard los volvía a recorrer con cada cambio. `compactar` pasa los cerrados
+hace más de unos días, por lotes, a archivos Parquet inmutables particionados
+por el mes de creación, y los borra del almacén, donde quedan solo los tickets
+vivos:
+
+    <raiz>/tickets/mes=2024-03/lote-7.parquet
+    <raiz>/mensajes/mes=2024-03/lote-7.parquet
+
+Cada lote se escribe dentro de la transacción que lo anota en el almacén y borra
+sus tickets, así que un fallo a medias no pierde ni duplica tickets: los archivos
+de un lote sin confirmar no se leen nunca (y el siguiente intento los
+sobrescribe). Los conteos del dashboard suman los del almacén y los del
+histórico, y los eventos de los tickets archivados se quedan en el almacén.
+
+Las lecturas abren los archivos con memoria mapeada y piden solo las columnas que
+usan, de modo que el resto no llega a cargarse. Buscar un ticket archivado lee
+un solo archivo, el de su lote y mes.
+
+    $ python historico.py compactar --bd tickets.db --raiz historico --dias 30
+"""
+import argparse
+import datetime
+import functools
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+import metricas
+from almacen import COLUMNAS_MENSAJE, AlmacenTickets, id_ticket, numero_ticket
+from esquema import COLUMNAS_FECHA, FORMATO_FECHA, tipar_tickets
+
+# Días que pasan desde el cierre de un ticket hasta que se archiva
+DIAS_COMPACTAR = 30
+
+# Tickets por lote: el almacén no admite otras escrituras mientras se archiva uno
+LOTE_COMPACTAR = 5000
+
+# ============================================
+# 1. Archivos
+# ============================================
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("El histórico de tickets necesita pyarrow.") from None
+    return pyarrow
+
+def _esquemas(pa) -> Dict:
+    texto, fecha = pa.string(), pa.timestamp("s")
+    return {
+        "tickets": pa.schema([
+            ("numero", pa.int64()), ("problema", texto), ("estado", texto), ("prioridad", texto),
+            ("fecha_creacion", fecha), ("empresa", texto), ("usuario", texto), ("agente", texto),
+            ("fecha_cierre", fecha),
+        ]),
+        "mensajes": pa.schema([
+            ("numero", pa.int64()), ("contenido", texto), ("autor", texto), ("timestamp", fecha), ("tipo", texto),
+        ]),
+    }
+
+def ruta_archivo(raiz: str, tabla: str, lote: int, mes: str) -> str:
+    """
+    Devuelve la ruta del archivo de `tabla` ("tickets" o "mensajes") de un lote y un mes.
+    """
+    return os.path.join(raiz, tabla, f"mes={mes}", f"lote-{lote}.parquet")
+
+def escribir_lote(raiz: str, lote: int, tickets: pd.DataFrame, mensajes: pd.DataFrame) -> List[str]:
+    """
+    Escribe los tickets y los mensajes de un lote, tal como salen del almacén, en un
+    archivo por tabla y mes. Devuelve los meses escritos.
+    """
+    pa = _pyarrow()
+    esquemas = _esquemas(pa)
+    meses = tickets["fecha_creacion"].str[:7]
+    tickets = tickets.assign(**{
+        c: pd.to_datetime(tickets[c], format=FORMATO_FECHA) for c in COLUMNAS_FECHA
+    })
+    mensajes = mensajes.assign(timestamp=pd.to_datetime(mensajes["timestamp"], format=FORMATO_FECHA))
+    mes_mensajes = mensajes["numero"].map(pd.Series(meses.to_numpy(), index=tickets["numero"]))
+    for mes in sorted(meses.unique()):
+        for tabla, filas in (("tickets", tickets[meses == mes]), ("mensajes", mensajes[mes_mensajes == mes])):
+            ruta = ruta_archivo(raiz, tabla, lote, mes)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            # Se escribe aparte y se renombra: nunca queda un archivo a medias con el nombre final
+            temporal = ruta + ".tmp"
+            tabla_arrow = pa.Table.from_pandas(filas, schema=esquemas[tabla], preserve_index=False)
+            pa.parquet.write_table(tabla_arrow, temporal)
+            os.replace(temporal, ruta)
+    return sorted(meses.unique())
+
+def compactar(
+    almacen: AlmacenTickets,
+    raiz: str,
+    dias: float = DIAS_COMPACTAR,
+    lote: int = LOTE_COMPACTAR,
+    momento: Optional[datetime.datetime] = None
+) -> int:
+    """
+    Pasa al histórico de `raiz` los tickets cerrados hace más de `dias` días, en
+    lotes de `lote` tickets, y devuelve cuántos se archivaron.
+    """
+    # Sin pyarrow se falla antes de abrir ninguna transacción
+    _pyarrow()
+    antes = ((momento or datetime.datetime.now()) - datetime.timedelta(days=dias)).strftime(FORMATO_FECHA)
+    total = 0
+    while archivados := almacen.archivar_cerrados(antes, lote, functools.partial(escribir_lote, raiz)):
+        total += archivados
+    return total
+
+# ============================================
+# 2. Lectura
+# ============================================
+
+def _a_texto(fechas: pd.Series) -> pd.Series:
+    # Las fechas vuelven al formato del almacén; las vacías, a None
+    return fechas.dt.strftime(FORMATO_FECHA).astype(object).where(fechas.notna(), None)
+
+class Historico:
+    """
+    Lector del histórico de `raiz`. Solo abre los archivos que el almacén tiene
+    anotados, así que nunca ve un lote sin confirmar.
+
+    Se comparte una instancia por proceso: los tiempos de los tickets archivados se
+    calculan una vez y se guardan hasta que una compactación añade archivos.
+    """
+
+    def __init__(self, almacen: AlmacenTickets, raiz: str):
+        self.almacen = almacen
+        self.raiz = raiz
+        self._archivos: Optional[Tuple[Tuple[int, str], ...]] = None
+        self._tiempos: Optional[pd.DataFrame] = None
+        self._cerrojo = threading.Lock()
+
+    def _leer(self, tabla: str, archivos, columnas: Optional[List[str]] = None, filtro=None) -> pd.DataFrame:
+        """
+        Lee las `columnas` de `tabla` de los archivos `archivos` (lote y mes) que
+        cumplen `filtro`, una expresión de pyarrow.dataset.
+        """
+        pa = _pyarrow()
+        # Con memoria mapeada solo se leen del disco las páginas de las columnas pedidas
+        datos = pa.dataset.dataset(
+            [ruta_archivo(self.raiz, tabla, lote, mes) for lote, mes in archivos],
+            schema=_esquemas(pa)[tabla], format="parquet",
+            filesystem=pa.fs.LocalFileSystem(use_mmap=True)
+        )
+        filas = datos.to_table(columns=columnas, filter=filtro).to_pandas()
+        for columna in filas.columns.intersection(COLUMNAS_FECHA + ["timestamp"]):
+            filas[columna] = filas[columna].astype("datetime64[ns]")
+        return filas
+
+    def datos_tiempos(self, archivos) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Devuelve, como `AlmacenTickets.datos_tiempos`, los tickets de `archivos` con
+        sus fechas y los momentos de los mensajes de agentes.
+        """
+        tipo = _pyarrow().dataset.field("tipo")
+        tickets = self._leer("tickets", archivos, ["numero", "empresa", "agente", "fecha_creacion", "fecha_cierre"])
+        mensajes = self._leer("mensajes", archivos, ["numero", "timestamp"], tipo == "agente")
+        return tipar_tickets(tickets), mensajes
+
+    def tiempos(self) -> Optional[pd.DataFrame]:
+        """
+        Devuelve los tiempos por ticket de todos los tickets archivados, o None si
+        el histórico está vacío.
+        """
+        archivos = tuple(self.almacen.archivos_historico())
+        with self._cerrojo:
+            if archivos != self._archivos:
+                self._tiempos = metricas.tiempos_por_ticket(*self.datos_tiempos(archivos)) if archivos else None
+                self._archivos = archivos
+            return self._tiempos
+
+    def agregar_tiempos(self, tiempos: pd.DataFrame) -> pd.DataFrame:
+        """
+        Devuelve los tiempos del almacén, `tiempos`, junto con los del histórico.
+        """
+        archivados = self.tiempos()
+        return tiempos if archivados is None else pd.concat([tiempos, archivados], ignore_index=True)
+
+    def obtener_ticket(self, identificador: str) -> Optional[Dict]:
+        """
+        Devuelve un ticket archivado, sin sus mensajes y con las mismas claves que
+        `AlmacenTickets.obtener_ticket` más `archivado`, o None si no está en el histórico.
+        """
+        numero = numero_ticket(identificador)
+        ubicacion = None if numero is None else self.almacen.ubicacion_archivado(numero)
+        if ubicacion is None:
+            return None
+        filas = self._leer("tickets", [ubicacion], filtro=_pyarrow().dataset.field("numero") == numero)
+        if filas.empty:
+            return None
+        for columna in COLUMNAS_FECHA:
+            filas[columna] = _a_texto(filas[columna])
+        ticket = filas.iloc[0].to_dict()
+        return {"numero": numero, "id": id_ticket(numero), **ticket, "version": 0, "archivado": True}
+
+    def obtener_mensajes(self, numero: int) -> List[Dict]:
+        """
+        Devuelve el historial de mensajes de un ticket archivado, en orden cronológico.
+        """
+        ubicacion = self.almacen.ubicacion_archivado(numero)
+        if ubicacion is None:
+            return []
+        mensajes = self._leer(
+            "mensajes", [ubicacion], COLUMNAS_MENSAJE, _pyarrow().dataset.field("numero") == numero
+        )
+        mensajes["timestamp"] = _a_texto(mensajes["timestamp"])
+        return mensajes.to_dict("records")
+
+    def iterar_tickets(self) -> Iterator[List[Dict]]:
+        """
+        Recorre los tickets archivados con sus mensajes, un archivo por lote, en el
+        formato de `AlmacenTickets.iterar_tickets`.
+        """
+        for archivo in self.almacen.archivos_historico():
+            tickets = self._leer("tickets", [archivo])
+            mensajes = self._leer("mensajes", [archivo])
+            for columna in COLUMNAS_FECHA:
+                tickets[columna] = _a_texto(tickets[columna])
+            mensajes["timestamp"] = _a_texto(mensajes["timestamp"])
+            por_ticket: Dict[int, List[Dict]] = {}
+            for mensaje in mensajes.to_dict("records"):
+                por_ticket.setdefault(mensaje.pop("numero"), []).append(mensaje)
+            lote = []
+            for ticket in tickets.to_dict("records"):
+                numero = ticket.pop("numero")
+                lote.append({"id": id_ticket(numero), **ticket, "mensajes": por_ticket.get(numero, [])})
+            yield lote
+
+# ============================================
+# 3. Línea de Comandos
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Pasa los tickets cerrados al histórico Parquet.")
+    parser.add_argument("accion", choices=["compactar"])
+    parser.add_argument("--bd", default=os.environ.get("TICKETS_DB", "tickets.db"), help="base de datos de tickets")
+    parser.add_argument(
+        "--raiz", default=os.environ.get("TICKETS_HISTORICO", "historico"), help="directorio del histórico"
+    )
+    parser.add_argument("--dias", type=float, default=DIAS_COMPACTAR, help="días desde el cierre")
+    parser.add_argument("--lote", type=int, default=LOTE_COMPACTAR, help="tickets por lote")
+    args = parser.parse_args()
+
+    total = compactar(AlmacenTickets(args.bd), args.raiz, args.dias, args.lote)
+    print(f"Archivados: {total} tickets.")
+
+if __name__ == "__main__":
+    main()
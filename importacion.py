@@ -0,0 +1,275 @@
+"""
+Importación y exportación masiva de tickets en CSV, JSONL y Parquet.
+
+Los archivos se leen y escriben por lotes, así que la memoria usada depende del
+tamaño del lote y no del archivo. Cada ticket lleva sus mensajes anidados en la
+columna "mensajes" (texto JSON en CSV, lista de objetos en JSONL y Parquet); al
+importar se aplanan en la tabla de mensajes del almacén.
+
+    $ python importacion.py importar historico.parquet --bd tickets.db
+    $ python importacion.py exportar copia.jsonl --bd tickets.db
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, List, Optional, Union
+
+from almacen import MAX_NUMERO, PREFIJO_ID, AlmacenTickets, numero_ticket
+from esquema import validar_ticket
+from historico import Historico
+
+# ============================================
+# 1. Formatos
+# ============================================
+
+FORMATOS = ["csv", "jsonl", "parquet"]
+
+# Columnas de un ticket en los archivos de intercambio
+COLUMNAS_ARCHIVO = [
+    "id", "problema", "estado", "prioridad", "fecha_creacion",
+    "empresa", "usuario", "agente", "fecha_cierre", "mensajes"
+]
+
+# Número máximo de errores que se guardan en el resumen de una importación
+MAX_ERRORES = 100
+
+Origen = Union[str, IO]
+
+def detectar_formato(nombre: str) -> str:
+    """
+    Deduce el formato a partir de la extensión del archivo.
+    """
+    extension = os.path.splitext(nombre)[1].lower().lstrip(".")
+    if extension == "json":
+        extension = "jsonl"
+    if extension not in FORMATOS:
+        raise ValueError(f"Formato no soportado: '{extension}'. Use uno de: {', '.join(FORMATOS)}.")
+    return extension
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Para leer o escribir Parquet hace falta instalar pyarrow.") from None
+    return pyarrow
+
+@contextmanager
+def _abrir_texto(origen: Origen, modo: str) -> Iterator[IO[str]]:
+    """
+    Abre `origen` como texto. Las rutas se cierran al salir; los archivos del
+    llamador, incluidos los binarios como los de st.file_uploader, quedan abiertos.
+    """
+    if isinstance(origen, str):
+        with open(origen, modo, encoding="utf-8", newline="") as texto:
+            yield texto
+    elif isinstance(origen, io.TextIOBase):
+        yield origen
+    else:
+        texto = io.TextIOWrapper(origen, encoding="utf-8", newline="")
+        try:
+            yield texto
+        finally:
+            texto.flush()
+            texto.detach()
+
+# ============================================
+# 2. Lectura por Lotes
+# ============================================
+
+def _normalizar(registro: Dict) -> Dict:
+    """
+    Convierte un registro leído de un archivo en un ticket del almacén.
+    """
+    if not isinstance(registro, dict):
+        raise ValueError("Registro mal formado.")
+    ticket = {c: registro.get(c) for c in COLUMNAS_ARCHIVO}
+    for campo in ("id", "fecha_cierre"):
+        if ticket[campo] in ("", None) or ticket[campo] != ticket[campo]:  # vacío o NaN
+            ticket[campo] = None
+    mensajes = ticket["mensajes"]
+    if isinstance(mensajes, str):
+        mensajes = json.loads(mensajes) if mensajes.strip() else []
+    ticket["mensajes"] = list(mensajes or [])
+    if ticket["id"] is not None:
+        if numero_ticket(str(ticket["id"])) is None:
+            cifras = str(ticket["id"]).strip().upper().removeprefix(PREFIJO_ID)
+            if cifras.isascii() and cifras.isdigit():
+                raise ValueError(f"Número de ticket fuera de rango (máximo {MAX_NUMERO}): {ticket['id']!r}.")
+            raise ValueError(f"Identificador de ticket inválido: {ticket['id']!r}.")
+        ticket["id"] = str(ticket["id"])
+    return ticket
+
+def _leer_linea_json(linea: str):
+    # Una línea inválida se devuelve tal cual para rechazarla sin cortar la importación
+    try:
+        return json.loads(linea)
+    except json.JSONDecodeError:
+        return linea
+
+def leer_registros(origen: Origen, formato: str, lote: int) -> Iterator[List[Dict]]:
+    """
+    Lee un archivo de tickets y devuelve sus registros en listas de hasta `lote`.
+    """
+    if formato == "parquet":
+        archivo = _pyarrow().parquet.ParquetFile(origen)
+        for bloque in archivo.iter_batches(batch_size=lote):
+            yield bloque.to_pylist()
+        return
+
+    with _abrir_texto(origen, "r") as texto:
+        filas = csv.DictReader(texto) if formato == "csv" else (
+            _leer_linea_json(linea) for linea in texto if linea.strip()
+        )
+        pendientes: List[Dict] = []
+        for fila in filas:
+            pendientes.append(fila)
+            if len(pendientes) == lote:
+                yield pendientes
+                pendientes = []
+        if pendientes:
+            yield pendientes
+
+def importar(
+    almacen: AlmacenTickets,
+    origen: Origen,
+    formato: Optional[str] = None,
+    lote: int = 5000,
+    progreso=None
+) -> Dict:
+    """
+    Importa tickets desde un archivo al almacén, un lote por transacción.
+
+    Los registros que no cumplen el esquema o cuyo id ya existe se descartan y se
+    informan en el resumen devuelto, que tiene las claves "importados",
+    "rechazados" y "errores" (los primeros MAX_ERRORES, como (fila, motivo)).
+    `progreso`, si se indica, se llama con el número de filas leídas tras cada lote.
+    """
+    formato = formato or detectar_formato(origen if isinstance(origen, str) else origen.name)
+    resumen = {"importados": 0, "rechazados": 0, "errores": []}
+    fila = 0
+
+    def rechazar(numero_fila: int, motivo: str) -> None:
+        resumen["rechazados"] += 1
+        if len(resumen["errores"]) < MAX_ERRORES:
+            resumen["errores"].append((numero_fila, motivo))
+
+    for registros in leer_registros(origen, formato, lote):
+        validos: List[Dict] = []
+        filas_validas: List[int] = []
+        for registro in registros:
+            fila += 1
+            try:
+                ticket = _normalizar(registro)
+                validar_ticket(ticket)
+            except (ValueError, TypeError) as error:
+                rechazar(fila, str(error))
+                continue
+            validos.append(ticket)
+            filas_validas.append(fila)
+
+        # Descartar ids que ya existen o que se repiten dentro del mismo lote
+        existentes = almacen.numeros_existentes(
+            [numero_ticket(t["id"]) for t in validos if t["id"] is not None]
+        )
+        nuevos: List[Dict] = []
+        for numero_fila, ticket in zip(filas_validas, validos):
+            if ticket["id"] is not None:
+                numero = numero_ticket(ticket["id"])
+                if numero in existentes:
+                    rechazar(numero_fila, f"El ticket {ticket['id']} ya existe.")
+                    continue
+                existentes.add(numero)
+            nuevos.append(ticket)
+
+        if nuevos:
+            almacen.insertar_tickets(nuevos)
+            resumen["importados"] += len(nuevos)
+        if progreso is not None:
+            progreso(fila)
+    return resumen
+
+# ============================================
+# 3. Exportación
+# ============================================
+
+def exportar(
+    almacen: AlmacenTickets,
+    destino: Origen,
+    formato: Optional[str] = None,
+    lote: int = 5000,
+    historico: Optional[Historico] = None
+) -> int:
+    """
+    Escribe todos los tickets del almacén, con sus mensajes, en `destino`; con
+    `historico`, también los archivados. Devuelve el número de tickets exportados.
+    """
+    formato = formato or detectar_formato(destino if isinstance(destino, str) else destino.name)
+    lotes = almacen.iterar_tickets(lote)
+    if historico is not None:
+        lotes = itertools.chain(lotes, historico.iterar_tickets())
+    total = 0
+
+    if formato == "parquet":
+        pa = _pyarrow()
+        esquema_mensaje = pa.struct([(c, pa.string()) for c in ("contenido", "autor", "timestamp", "tipo")])
+        esquema = pa.schema(
+            [(c, pa.string()) for c in COLUMNAS_ARCHIVO[:-1]] + [("mensajes", pa.list_(esquema_mensaje))]
+        )
+        with pa.parquet.ParquetWriter(destino, esquema) as escritor:
+            for tickets in lotes:
+                escritor.write_batch(pa.RecordBatch.from_pylist(tickets, schema=esquema))
+                total += len(tickets)
+        return total
+
+    with _abrir_texto(destino, "w") as texto:
+        if formato == "csv":
+            escritor = csv.DictWriter(texto, fieldnames=COLUMNAS_ARCHIVO)
+            escritor.writeheader()
+            for tickets in lotes:
+                escritor.writerows(
+                    {**t, "mensajes": json.dumps(t["mensajes"], ensure_ascii=False)} for t in tickets
+                )
+                total += len(tickets)
+        else:
+            for tickets in lotes:
+                texto.writelines(json.dumps(t, ensure_ascii=False) + "\n" for t in tickets)
+                total += len(tickets)
+    return total
+
+# ============================================
+# 4. Línea de Comandos
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa o exporta tickets en CSV, JSONL o Parquet.")
+    parser.add_argument("accion", choices=["importar", "exportar"])
+    parser.add_argument("archivo")
+    parser.add_argument("--bd", default=os.environ.get("TICKETS_DB", "tickets.db"), help="base de datos de tickets")
+    parser.add_argument("--formato", choices=FORMATOS, help="por defecto, según la extensión del archivo")
+    parser.add_argument("--lote", type=int, default=5000, help="tickets por lote")
+    parser.add_argument(
+        "--historico", default=os.environ.get("TICKETS_HISTORICO", "historico"),
+        help="directorio del histórico de tickets cerrados, que también se exporta"
+    )
+    args = parser.parse_args()
+
+    almacen = AlmacenTickets(args.bd)
+    if args.accion == "importar":
+        resumen = importar(
+            almacen, args.archivo, args.formato, args.lote,
+            progreso=lambda filas: print(f"\r{filas} filas leídas", end="", flush=True)
+        )
+        print(f"\nImportados: {resumen['importados']}. Rechazados: {resumen['rechazados']}.")
+        for fila, motivo in resumen["errores"]:
+            print(f"  fila {fila}: {motivo}")
+    else:
+        total = exportar(almacen, args.archivo, args.formato, args.lote, Historico(almacen, args.historico))
+        print(f"Exportados: {total} tickets.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Instrumentación opcional de cada ejecución del script.
+
+Se activa con la variable de entorno TICKETS_PERFIL=1 o con el parámetro de URL
+?perfil=1. Mientras está activa, cada ejecución mide sus tramos (inicialización,
+página, filtrado, gráficos...), la memoria de los DataFrames y el tamaño de lo que
+se envía al navegador. Al terminar, la ejecución se emite como una línea JSON en
+el logger "tickets.perfil" (y en TICKETS_PERFIL_LOG, si se indica un archivo) y se
+acumula en un histórico del proceso exportable en formato de texto de Prometheus.
+Inactiva, cada medición cuesta una consulta a una variable local del hilo.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+registro = logging.getLogger("tickets.perfil")
+
+# Número de ejecuciones que se guardan en el histórico del proceso
+MAX_HISTORICO = 500
+
+# ============================================
+# 1. Perfil de una Ejecución
+# ============================================
+
+class Perfil:
+    """
+    Mediciones de una ejecución del script.
+    """
+
+    def __init__(self, pagina: str = ""):
+        self.pagina = pagina
+        self.fecha = time.time()
+        self.inicio = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.tramos: List[Dict] = []
+        self.dataframes: Dict[str, Dict[str, int]] = {}
+        self.graficos: Dict[str, int] = {}
+
+    def como_dict(self) -> Dict:
+        return {
+            "fecha": round(self.fecha, 3),
+            "pagina": self.pagina,
+            "total_ms": self.total_ms,
+            "tramos": self.tramos,
+            "dataframes": self.dataframes,
+            "graficos": self.graficos,
+        }
+
+_local = threading.local()
+_historico: Deque[Dict] = deque(maxlen=MAX_HISTORICO)
+_cerrojo = threading.Lock()
+
+def activo_por_entorno() -> bool:
+    return os.environ.get("TICKETS_PERFIL", "") not in ("", "0")
+
+def iniciar(activo: bool) -> Optional[Perfil]:
+    """
+    Empieza a medir la ejecución actual si `activo`; si no, desactiva las mediciones.
+    """
+    _local.perfil = Perfil() if activo else None
+    return _local.perfil
+
+def actual() -> Optional[Perfil]:
+    return getattr(_local, "perfil", None)
+
+@contextmanager
+def medir(nombre: str) -> Iterator[None]:
+    """
+    Mide el tiempo del bloque como un tramo de la ejecución actual.
+    Los tramos anidados quedan registrados con su profundidad.
+    """
+    perfil = actual()
+    if perfil is None:
+        yield
+        return
+    profundidad = getattr(_local, "profundidad", 0)
+    _local.profundidad = profundidad + 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.profundidad = profundidad
+        perfil.tramos.append({
+            "nombre": nombre,
+            "profundidad": profundidad,
+            "ms": round((time.perf_counter() - inicio) * 1000, 3),
+        })
+
+def registrar_dataframe(nombre: str, df: pd.DataFrame, enviado: bool = True) -> None:
+    """
+    Anota la memoria de `df` y, si se muestra (`enviado`), el tamaño en Arrow con
+    el que Streamlit lo envía al navegador.
+    """
+    perfil = actual()
+    if perfil is None:
+        return
+    perfil.dataframes[nombre] = {"filas": len(df), "memoria_bytes": int(df.memory_usage(deep=True).sum())}
+    if not enviado:
+        return
+    import pyarrow as pa
+
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    salida = pa.MockOutputStream()
+    with pa.ipc.new_stream(salida, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    perfil.dataframes[nombre]["carga_bytes"] = salida.size()
+
+def registrar_grafico(nombre: str, grafico) -> None:
+    """
+    Anota el tamaño de la especificación Vega-Lite (datos incluidos) de un gráfico de Altair.
+    """
+    perfil = actual()
+    if perfil is not None:
+        perfil.graficos[nombre] = len(grafico.to_json(indent=None).encode("utf-8"))
+
+def finalizar(pagina: str) -> Optional[Dict]:
+    """
+    Cierra la medición de la ejecución actual, la emite como log estructurado y
+    la añade al histórico. Devuelve la ejecución como diccionario.
+    """
+    perfil = actual()
+    if perfil is None:
+        return None
+    perfil.pagina = pagina
+    perfil.total_ms = round((time.perf_counter() - perfil.inicio) * 1000, 3)
+    datos = perfil.como_dict()
+    linea = json.dumps(datos, ensure_ascii=False)
+    registro.info(linea)
+    ruta = os.environ.get("TICKETS_PERFIL_LOG")
+    if ruta:
+        with open(ruta, "a", encoding="utf-8") as archivo:
+            archivo.write(linea + "\n")
+    with _cerrojo:
+        _historico.append(datos)
+    _local.perfil = None
+    return datos
+
+# ============================================
+# 2. Exportación
+# ============================================
+
+def historico() -> List[Dict]:
+    with _cerrojo:
+        return list(_historico)
+
+def texto_prometheus() -> str:
+    """
+    Resume el histórico del proceso en formato de texto de Prometheus: tiempo
+    acumulado y número de ejecuciones por página y por tramo, y la última carga
+    medida de cada DataFrame y gráfico.
+    """
+    paginas: Dict[str, List[float]] = {}
+    tramos: Dict[str, List[float]] = {}
+    memoria: Dict[str, int] = {}
+    carga: Dict[str, int] = {}
+    for ejecucion in historico():
+        acumulado = paginas.setdefault(ejecucion["pagina"], [0.0, 0])
+        acumulado[0] += ejecucion["total_ms"] / 1000
+        acumulado[1] += 1
+        for tramo in ejecucion["tramos"]:
+            acumulado = tramos.setdefault(tramo["nombre"], [0.0, 0])
+            acumulado[0] += tramo["ms"] / 1000
+            acumulado[1] += 1
+        for nombre, df in ejecucion["dataframes"].items():
+            memoria[nombre] = df["memoria_bytes"]
+            if "carga_bytes" in df:
+                carga[f"dataframe:{nombre}"] = df["carga_bytes"]
+        for nombre, tamano in ejecucion["graficos"].items():
+            carga[f"grafico:{nombre}"] = tamano
+
+    lineas = [
+        "# HELP tickets_ejecucion_segundos Duración de las ejecuciones del script por página.",
+        "# TYPE tickets_ejecucion_segundos summary",
+    ]
+    for pagina, (suma, cuenta) in sorted(paginas.items()):
+        lineas.append(f'tickets_ejecucion_segundos_sum{{pagina="{_etiqueta(pagina)}"}} {suma:.6f}')
+        lineas.append(f'tickets_ejecucion_segundos_count{{pagina="{_etiqueta(pagina)}"}} {cuenta}')
+    lineas += [
+        "# HELP tickets_tramo_segundos Duración de cada tramo medido de una ejecución.",
+        "# TYPE tickets_tramo_segundos summary",
+    ]
+    for tramo, (suma, cuenta) in sorted(tramos.items()):
+        lineas.append(f'tickets_tramo_segundos_sum{{tramo="{_etiqueta(tramo)}"}} {suma:.6f}')
+        lineas.append(f'tickets_tramo_segundos_count{{tramo="{_etiqueta(tramo)}"}} {cuenta}')
+    lineas += [
+        "# HELP tickets_dataframe_memoria_bytes Memoria del último DataFrame medido.",
+        "# TYPE tickets_dataframe_memoria_bytes gauge",
+    ]
+    lineas += [f'tickets_dataframe_memoria_bytes{{nombre="{_etiqueta(n)}"}} {v}' for n, v in sorted(memoria.items())]
+    lineas += [
+        "# HELP tickets_carga_bytes Tamaño del último envío al navegador de cada elemento.",
+        "# TYPE tickets_carga_bytes gauge",
+    ]
+    lineas += [f'tickets_carga_bytes{{elemento="{_etiqueta(n)}"}} {v}' for n, v in sorted(carga.items())]
+    return "\n".join(lineas) + "\n"
+
+def _etiqueta(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def texto_jsonl() -> str:
+    """
+    Devuelve el histórico del proceso como líneas JSON, una por ejecución.
+    """
+    return "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in historico())
@@ -0,0 +1,84 @@
+from typing import List
+
+import pandas as pd
+
+# Percentiles que se informan en el panel de SLA
+PERCENTILES = [0.5, 0.9, 0.99]
+
+# ============================================
+# 1. Tiempos por Ticket
+# ============================================
+
+def tiempos_por_ticket(tickets: pd.DataFrame, mensajes_agente: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calcula, para cada ticket, las horas hasta la primera respuesta de un agente y
+    las horas hasta el cierre.
+
+    `tickets` debe tener las columnas numero, empresa, agente, fecha_creacion y
+    fecha_cierre; `mensajes_agente`, las columnas numero y timestamp de los
+    mensajes escritos por agentes. Las fechas deben venir ya como datetime64.
+    Todo el cálculo es vectorizado: una agrupación sobre la tabla plana de
+    mensajes y restas entre columnas de fechas.
+    """
+    creacion = tickets["fecha_creacion"]
+    cierre = tickets["fecha_cierre"]
+
+    primera_respuesta = (
+        mensajes_agente["timestamp"]
+        .groupby(mensajes_agente["numero"].to_numpy(), sort=False)
+        .min()
+        .reindex(tickets["numero"].to_numpy())
+    )
+
+    una_hora = pd.Timedelta(hours=1)
+    return pd.DataFrame({
+        "numero": tickets["numero"].to_numpy(),
+        "empresa": tickets["empresa"].to_numpy(),
+        "agente": tickets["agente"].to_numpy(),
+        "horas_primera_respuesta": (primera_respuesta.to_numpy() - creacion.to_numpy()) / una_hora,
+        "horas_resolucion": (cierre - creacion).to_numpy() / una_hora,
+    })
+
+# ============================================
+# 2. Resúmenes
+# ============================================
+
+def promedios(tiempos: pd.DataFrame) -> pd.Series:
+    """
+    Devuelve el promedio de horas de primera respuesta y de resolución,
+    ignorando los tickets sin respuesta o sin cerrar.
+    """
+    return tiempos[["horas_primera_respuesta", "horas_resolucion"]].mean()
+
+def percentiles_por(tiempos: pd.DataFrame, columna: str, percentiles: List[float] = PERCENTILES) -> pd.DataFrame:
+    """
+    Devuelve una fila por valor de `columna` (p. ej. 'agente' o 'empresa') con los
+    percentiles de horas de primera respuesta y de resolución.
+    """
+    resultado = (
+        tiempos.groupby(columna)[["horas_primera_respuesta", "horas_resolucion"]]
+        .quantile(percentiles)
+        .unstack()
+    )
+    resultado.columns = [
+        f"{'respuesta' if metrica == 'horas_primera_respuesta' else 'resolucion'}_p{round(p * 100)}"
+        for metrica, p in resultado.columns
+    ]
+    return resultado.round(1)
+
+# ============================================
+# 3. Evolución en el Tiempo
+# ============================================
+
+def backlog_por_dia(diferencias: pd.DataFrame) -> pd.DataFrame:
+    """
+    Devuelve cuántos tickets había abiertos al final de cada día.
+
+    `diferencias` es lo que subió o bajó el número de tickets abiertos cada día,
+    con las columnas fecha y diferencia (`AlmacenTickets.backlog_diario`); la
+    serie es su suma acumulada, con los días sin cambios rellenados.
+    """
+    if diferencias.empty:
+        return pd.DataFrame({"fecha": pd.Series(dtype="datetime64[ns]"), "abiertos": pd.Series(dtype="int64")})
+    abiertos = diferencias.set_index("fecha")["diferencia"].astype("int64").asfreq("D", fill_value=0).cumsum()
+    return pd.DataFrame({"fecha": abiertos.index, "abiertos": abiertos.to_numpy()})
@@ -0,0 +1,179 @@
+"""
+Vigilancia en segundo plano de los plazos de SLA.
+
+Un hilo por proceso revisa periódicamente los tickets abiertos y marca los que
+llevan abiertos más horas de las que admite su prioridad. Cada incumplimiento
+nuevo se notifica una sola vez a los destinos configurados (un archivo JSONL, una
+lista en memoria o cualquier objeto con un método `enviar`). El hilo usa su
+propia conexión a la base, así que nunca bloquea la ejecución del script.
+
+Cada revisión es incremental: por cada prioridad recorre solo el rango de fechas
+de creación que venció desde la revisión anterior, más los tickets que cambiaron
+(reabiertos o con la prioridad subida). Con un millón de tickets abiertos, una
+revisión lee solo los que acaban de vencer.
+"""
+import datetime
+import json
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from almacen import AlmacenTickets
+from esquema import FORMATO_FECHA
+
+registro = logging.getLogger("tickets.sla")
+
+# Horas que puede seguir abierto un ticket de cada prioridad
+LIMITES_HORAS = {"Alta": 4, "Media": 24, "Baja": 72}
+
+# Segundos entre dos revisiones
+INTERVALO_REVISION = 60
+
+# Tickets que se marcan por transacción, para no retener la escritura mucho tiempo
+LOTE_MARCAS = 1000
+
+# Notificaciones que guarda el destino en memoria
+MAX_NOTIFICACIONES = 200
+
+# ============================================
+# 1. Destinos de las Notificaciones
+# ============================================
+
+class DestinoMemoria:
+    """
+    Guarda las últimas notificaciones en memoria: para mostrarlas en la
+    aplicación o para comprobarlas en pruebas.
+    """
+
+    def __init__(self, maximo: int = MAX_NOTIFICACIONES):
+        self._notificaciones: Deque[Dict] = deque(maxlen=maximo)
+        self._cerrojo = threading.Lock()
+
+    def enviar(self, notificaciones: List[Dict]) -> None:
+        with self._cerrojo:
+            self._notificaciones.extend(notificaciones)
+
+    def recientes(self) -> List[Dict]:
+        """
+        Devuelve las notificaciones guardadas, de la más reciente a la más antigua.
+        """
+        with self._cerrojo:
+            return list(reversed(self._notificaciones))
+
+class DestinoArchivo:
+    """
+    Añade cada notificación como una línea JSON al final de un archivo.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+
+    def enviar(self, notificaciones: List[Dict]) -> None:
+        with open(self.ruta, "a", encoding="utf-8") as archivo:
+            archivo.writelines(json.dumps(n, ensure_ascii=False) + "\n" for n in notificaciones)
+
+# ============================================
+# 2. Vigilante
+# ============================================
+
+class VigilanteSLA:
+    """
+    Revisa los plazos de SLA cada `intervalo` segundos en un hilo en segundo plano.
+    `revisar()` también puede llamarse directamente, sin arrancar el hilo.
+    """
+
+    def __init__(
+        self,
+        almacen: AlmacenTickets,
+        destinos: List,
+        limites: Dict[str, float] = LIMITES_HORAS,
+        intervalo: float = INTERVALO_REVISION,
+        reloj: Callable[[], datetime.datetime] = datetime.datetime.now
+    ):
+        self.almacen = almacen
+        self.destinos = destinos
+        self.limites = limites
+        self.intervalo = intervalo
+        self.reloj = reloj
+        self._ultima: Optional[datetime.datetime] = None
+        self._version: Optional[int] = None
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self) -> "VigilanteSLA":
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="vigilante-sla", daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def _bucle(self) -> None:
+        while not self._detener.is_set():
+            try:
+                self.revisar()
+            except Exception:
+                # Un fallo (base bloqueada, destino caído...) no detiene la vigilancia
+                registro.exception("Falló la revisión de SLA")
+            self._detener.wait(self.intervalo)
+        # La conexión es del hilo: se cierra desde él
+        self.almacen.cerrar()
+
+    def revisar(self) -> List[Dict]:
+        """
+        Marca los tickets que vencieron desde la revisión anterior (en la primera,
+        todos los vencidos que aún no estaban marcados), notifica los nuevos
+        incumplimientos y los devuelve.
+        """
+        momento = self.reloj().replace(microsecond=0)
+        # La versión se lee antes que los tickets: lo que cambie durante la
+        # revisión se vuelve a mirar en la siguiente
+        version = self.almacen.version()
+        candidatos: Dict[int, Dict] = {}
+        for prioridad, horas in self.limites.items():
+            plazo = datetime.timedelta(hours=horas)
+            desde = None if self._ultima is None else (self._ultima - plazo).strftime(FORMATO_FECHA)
+            for ticket in self.almacen.abiertos_creados_entre(
+                prioridad, desde, (momento - plazo).strftime(FORMATO_FECHA)
+            ):
+                candidatos[ticket["numero"]] = ticket
+        if self._version is not None:
+            _, cambiados = self.almacen.cambios_desde(self._version)
+            for ticket in self.almacen.tickets_abiertos(cambiados) if cambiados else []:
+                if self._vencido(ticket, momento):
+                    candidatos[ticket["numero"]] = ticket
+
+        numeros = sorted(candidatos)
+        nuevos = [
+            numero
+            for i in range(0, len(numeros), LOTE_MARCAS)
+            for numero in self.almacen.marcar_incumplimientos(
+                numeros[i:i + LOTE_MARCAS], momento.strftime(FORMATO_FECHA)
+            )
+        ]
+        notificaciones = [self._notificacion(candidatos[n], momento) for n in nuevos]
+        self._ultima, self._version = momento, version
+        if notificaciones:
+            registro.info("%d tickets fuera de SLA", len(notificaciones))
+            for destino in self.destinos:
+                destino.enviar(notificaciones)
+        return notificaciones
+
+    def _vencido(self, ticket: Dict, momento: datetime.datetime) -> bool:
+        horas = self.limites.get(ticket["prioridad"])
+        creacion = datetime.datetime.strptime(ticket["fecha_creacion"], FORMATO_FECHA)
+        return horas is not None and momento - creacion >= datetime.timedelta(hours=horas)
+
+    def _notificacion(self, ticket: Dict, momento: datetime.datetime) -> Dict:
+        creacion = datetime.datetime.strptime(ticket["fecha_creacion"], FORMATO_FECHA)
+        return {
+            **ticket,
+            "horas_abierto": round((momento - creacion).total_seconds() / 3600, 1),
+            "limite_horas": self.limites[ticket["prioridad"]],
+            "detectado": momento.strftime(FORMATO_FECHA),
+        }
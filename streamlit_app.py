@@ -1,11 +1,26 @@
-import datetime
-import random
-from typing import Dict, List
+import html
+import io
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Set
 
-import altair as alt
 import pandas as pd
 import streamlit as st
 
+import analitica
+import generador
+import importacion
+import instrumentacion
+import metricas
+import sla
+from almacen import AlmacenTickets, numero_ticket
+from asignacion import agente_menos_cargado
+from compartido import TiemposCompartidos
+from esquema import ESTADOS, PRIORIDADES, ahora
+from historico import Historico
+from instrumentacion import medir
+
 # ============================================
 # 1. Configuración de la Página y CSS
 # ============================================
@@ -17,128 +32,301 @@ st.set_page_config(
     layout="wide"
 )
 
+# Hoja de estilos de los mensajes y encabezados; la fuente y los colores base
+# vienen del tema de .streamlit/config.toml
+RUTA_ESTILOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "estilos.css")
+
+@st.cache_resource
+def hoja_estilos() -> str:
+    """
+    Lee la hoja de estilos una sola vez por proceso.
+    """
+    with open(RUTA_ESTILOS, encoding="utf-8") as archivo:
+        return f"<style>{archivo.read()}</style>"
+
 # Inyectar CSS personalizado
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap');
+st.markdown(hoja_estilos(), unsafe_allow_html=True)
 
-    html, body, [class*="css"] {
-        font-family: 'Inter', sans-serif;
-    }
+# ============================================
+# 2. Inicialización del Estado
+# ============================================
 
-    h1, h2, h3, h4, h5, h6 {
-        font-weight: 700;
-    }
+# Ruta de la base de datos compartida por todas las sesiones
+RUTA_BD = os.environ.get("TICKETS_DB", "tickets.db")
 
-    .mensaje-agente {
-        background-color: #e3f2fd;
-        padding: 10px;
-        border-radius: 5px;
-        margin: 5px 0;
-        color: #000000; /* Asegura que el texto sea negro */
-    }
+# Directorio del histórico Parquet de los tickets cerrados (ver historico.py)
+RUTA_HISTORICO = os.environ.get("TICKETS_HISTORICO", "historico")
 
-    .mensaje-usuario {
-        background-color: #f5f5f5;
-        padding: 10px;
-        border-radius: 5px;
-        margin: 5px 0;
-        color: #000000; /* Asegura que el texto sea negro */
-    }
+# Tamaños de página disponibles en la lista de tickets
+TAMANOS_PAGINA = [25, 50, 100, 250]
 
-    .ticket-header {
-        background-color: #f8f9fa;
-        padding: 10px;
-        border-radius: 5px;
-        margin-bottom: 10px;
-        color: #000000; /* Asegura que el texto sea negro */
-    }
+# Cada cuántos segundos se consulta si otras sesiones cambiaron tickets
+INTERVALO_SONDEO = 5
 
-    .stButton > button {
-        width: 100%;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+# Mensajes del historial que se muestran al abrir un ticket y que añade cada "Cargar anteriores"
+MENSAJES_POR_TANDA = 50
 
-# ============================================
-# 2. Inicialización del Estado
-# ============================================
+# Registro con el que se siembra un almacén nuevo
+EMPRESAS_EJEMPLO: Dict[str, List[str]] = {
+    "Empresa A": ["Usuario A1", "Usuario A2"],
+    "Empresa B": ["Usuario B1", "Usuario B2"],
+    "Empresa C": ["Usuario C1"]
+}
+AGENTES_EJEMPLO: List[str] = ["Agente 1", "Agente 2", "Agente 3"]
 
-def inicializar_estado():
+# Máximo de opciones que se piden al registro para un selector, y usuarios por página
+LIMITE_OPCIONES = 100
+USUARIOS_POR_PAGINA = 25
+
+# Opción de "Nuevo Ticket" que asigna el agente con menos carga abierta
+ASIGNACION_AUTOMATICA = "Asignación automática"
+
+# Encabezados con los que se muestran las columnas de los tickets
+NOMBRES_COLUMNAS = {
+    "id": "ID",
+    "problema": "Problema",
+    "estado": "Estado",
+    "prioridad": "Prioridad",
+    "fecha_creacion": "Fecha de Creación",
+    "empresa": "Empresa",
+    "usuario": "Usuario",
+    "agente": "Agente Asignado",
+    "coincidencia": "Coincidencia"
+}
+
+@st.cache_resource
+def obtener_almacen() -> AlmacenTickets:
     """
-    Inicializa el estado de la sesión con datos de ejemplo si no existe.
-    """
-    if "tickets_df" not in st.session_state:
-        # Datos de ejemplo
-        problemas_ejemplo = [
-            "Error de conexión a la red",
-            "Aplicación se cierra inesperadamente",
-            "Impresora no responde",
-            "Problemas con el correo electrónico",
-            "Fallo en respaldo de datos",
-            "Problemas de autenticación",
-            "Bajo rendimiento del sitio web",
-            "Vulnerabilidad de seguridad detectada",
-            "Fallo de hardware en servidor",
-            "Problemas de acceso a archivos compartidos"
-        ]
+    Devuelve el almacén de tickets compartido por todas las sesiones del proceso.
+    """
+    return AlmacenTickets(RUTA_BD)
 
-        # Inicializar datos de empresas y usuarios
-        st.session_state.empresas: Dict[str, List[str]] = {
-            "Empresa A": ["Usuario A1", "Usuario A2"],
-            "Empresa B": ["Usuario B1", "Usuario B2"],
-            "Empresa C": ["Usuario C1"]
-        }
-
-        # Inicializar datos de agentes
-        st.session_state.agentes: List[str] = [
-            "Agente 1",
-            "Agente 2",
-            "Agente 3"
+@st.cache_resource
+def sembrar_datos_ejemplo() -> None:
+    """
+    Siembra el almacén con datos de ejemplo si está vacío. Se ejecuta una sola vez
+    por proceso, no una vez por sesión.
+    """
+    almacen = obtener_almacen()
+    # Empresas, usuarios y agentes de ejemplo, solo si el registro está vacío
+    almacen.sembrar_registro_si_vacio(EMPRESAS_EJEMPLO, AGENTES_EJEMPLO)
+
+    # Generar tickets de ejemplo solo la primera vez que se abre el almacén
+    almacen.sembrar_si_vacio(
+        lambda: [
+            ticket
+            for lote in generador.generar_tickets(100, EMPRESAS_EJEMPLO, AGENTES_EJEMPLO)
+            for ticket in lote
         ]
+    )
 
-        # Generar tickets de ejemplo
-        tickets_data: List[Dict] = []
-        for i in range(100):
-            empresa = random.choice(list(st.session_state.empresas.keys()))
-            usuario = random.choice(st.session_state.empresas[empresa])
-            agente = random.choice(st.session_state.agentes)
-            fecha = datetime.datetime.now() - datetime.timedelta(days=random.randint(0, 30))
-            fecha_str = fecha.strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Crear mensajes de ejemplo
-            mensajes: List[Dict] = []
-            num_mensajes = random.randint(1, 4)
-            for j in range(num_mensajes):
-                timestamp_msg = (fecha + datetime.timedelta(hours=j)).strftime("%Y-%m-%d %H:%M:%S")
-                if j % 2 == 0:
-                    mensajes.append({
-                        "contenido": f"Mensaje de usuario {j+1}",
-                        "autor": usuario,
-                        "timestamp": timestamp_msg,
-                        "tipo": "usuario"
-                    })
-                else:
-                    mensajes.append({
-                        "contenido": f"Respuesta del agente {j+1}",
-                        "autor": agente,
-                        "timestamp": timestamp_msg,
-                        "tipo": "agente"
-                    })
-
-            tickets_data.append({
-                "id": f"TICKET-{1000 + i}",
-                "problema": random.choice(problemas_ejemplo),
-                "estado": random.choice(["Abierto", "En Progreso", "Cerrado"]),
-                "prioridad": random.choice(["Alta", "Media", "Baja"]),
-                "fecha_creacion": fecha_str,  # Convertir a string
-                "empresa": empresa,
-                "usuario": usuario,
-                "agente": agente,
-                "mensajes": mensajes  # Guardar la lista de mensajes
-            })
+def inicializar_estado():
+    """
+    Inicializa el estado de la sesión y siembra el almacén con datos de ejemplo si está vacío.
+    """
+    if "inicializado" not in st.session_state:
+        sembrar_datos_ejemplo()
+        st.session_state.inicializado = True
+
+def mostrar_perfil(perfil: Dict):
+    """
+    Muestra en el sidebar las mediciones de la ejecución y permite descargar el
+    histórico del proceso como líneas JSON o como texto de Prometheus.
+    """
+    with st.sidebar.expander("🛠️ Perfil de la ejecución"):
+        st.write(f"Ejecución: **{perfil['total_ms']:.1f} ms**")
+        st.dataframe(
+            pd.DataFrame(perfil["tramos"], columns=["nombre", "profundidad", "ms"]),
+            hide_index=True
+        )
+        if perfil["dataframes"]:
+            st.write("DataFrames (bytes)")
+            st.dataframe(pd.DataFrame.from_dict(perfil["dataframes"], orient="index"))
+        if perfil["graficos"]:
+            st.write("Gráficos (bytes de especificación)")
+            st.dataframe(pd.Series(perfil["graficos"], name="bytes"))
+        st.download_button(
+            "Descargar log (JSONL)", instrumentacion.texto_jsonl(),
+            file_name="perfil.jsonl", key="perfil_jsonl"
+        )
+        st.download_button(
+            "Descargar métricas (Prometheus)", instrumentacion.texto_prometheus(),
+            file_name="metricas.prom", key="perfil_prometheus"
+        )
+
+@st.cache_resource(on_release=lambda vigilante: vigilante.detener())
+def obtener_vigilante() -> sla.VigilanteSLA:
+    """
+    Arranca, una sola vez por proceso, la revisión de SLA en segundo plano.
+    Las notificaciones se guardan en memoria para el sidebar y, si se indica
+    TICKETS_SLA_LOG, se añaden a ese archivo como líneas JSON.
+    """
+    destinos = [sla.DestinoMemoria()]
+    if os.environ.get("TICKETS_SLA_LOG"):
+        destinos.append(sla.DestinoArchivo(os.environ["TICKETS_SLA_LOG"]))
+    return sla.VigilanteSLA(obtener_almacen(), destinos).iniciar()
+
+@st.cache_data(ttl=INTERVALO_SONDEO)
+def contar_incumplimientos() -> int:
+    """
+    Cuenta los tickets abiertos fuera de SLA; la marca la pone el vigilante, no
+    una escritura de tickets, así que se cachea por tiempo y no por versión.
+    """
+    return obtener_almacen().contar_incumplimientos()
+
+@st.cache_resource
+def obtener_tiempos() -> TiemposCompartidos:
+    """
+    Devuelve los tiempos por ticket compartidos por todas las sesiones del proceso,
+    que se refrescan recalculando solo los tickets que cambiaron.
+    """
+    return TiemposCompartidos(obtener_almacen())
+
+@st.cache_resource
+def obtener_historico() -> Historico:
+    """
+    Devuelve el histórico de tickets cerrados, compartido por todas las sesiones
+    del proceso junto con los tiempos ya calculados de sus tickets.
+    """
+    return Historico(obtener_almacen(), RUTA_HISTORICO)
+
+@st.cache_resource(on_release=lambda ejecutor: ejecutor and ejecutor.shutdown(cancel_futures=True))
+def obtener_ejecutor():
+    """
+    Devuelve el grupo de procesos de análisis (TICKETS_PROCESOS > 0), o None si
+    los cálculos se hacen en el propio proceso.
+    """
+    return analitica.crear_ejecutor()
+
+@st.cache_data(max_entries=4)
+def resumen_tiempos(version: int):
+    """
+    Calcula los promedios y los percentiles por agente y por empresa de los tiempos.
+    La clave de la caché es la versión de los datos, así que el resumen se recalcula
+    solo cuando algún ticket cambió y lo comparten todas las sesiones.
+
+    Antes de calcularlo se busca en la caché compartida del almacén, por si otro
+    proceso del despliegue ya lo hizo. Si no, se calcula en el grupo de procesos de
+    análisis o, si no hay, con los tiempos compartidos del proceso, y se guarda.
+    En ambos casos incluye los tickets del histórico, cuyos tiempos no se recalculan.
+    """
+    almacen = obtener_almacen()
+    guardado = almacen.leer_resumen(analitica.CLAVE_TIEMPOS)
+    if guardado is not None and guardado[0] >= version:
+        return analitica.decodificar_resumen(guardado[1])
+    ejecutor = obtener_ejecutor()
+    if ejecutor is not None:
+        version, resumen = ejecutor.submit(analitica.resumen_tiempos, RUTA_BD, RUTA_HISTORICO).result()
+    else:
+        version, tiempos = obtener_tiempos().obtener()
+        tiempos = obtener_historico().agregar_tiempos(tiempos)
+        instrumentacion.registrar_dataframe("tiempos", tiempos, enviado=False)
+        resumen = analitica.resumir_tiempos(tiempos)
+    almacen.guardar_resumen(analitica.CLAVE_TIEMPOS, version, analitica.codificar_resumen(resumen))
+    return resumen
+
+def html_mensaje(mensaje: Dict) -> str:
+    """
+    Devuelve un mensaje como HTML, con todo el texto escapado.
+    """
+    contenido = html.escape(mensaje["contenido"]).replace("\n", "<br>")
+    return (
+        f'<div class="mensaje-{html.escape(mensaje["tipo"])}">'
+        f'<strong>{html.escape(mensaje["autor"])}</strong> - {html.escape(mensaje["timestamp"])}'
+        f'<br>{contenido}</div>'
+    )
+
+@st.cache_data(max_entries=256)
+def historial_html(numero: int, total_mensajes: int, ultimos: int) -> str:
+    """
+    Devuelve los `ultimos` mensajes de un ticket como un único bloque HTML.
+    `total_mensajes` forma parte de la clave de la caché: un mensaje nuevo cambia
+    la clave, así que el resultado nunca queda desactualizado.
+    """
+    return "".join(html_mensaje(m) for m in obtener_almacen().obtener_mensajes(numero, ultimos))
+
+@st.cache_data(max_entries=4)
+def conteos_estado(version: int) -> Dict[str, int]:
+    """
+    Devuelve el número de tickets de cada estado. Como `resumen_tiempos`, se
+    recalcula solo cuando cambia la versión de los datos.
+    """
+    return obtener_almacen().conteo_por_estado()
+
+@st.cache_data(max_entries=16)
+def resumen_agregado(version: int, dimension: str, por_estado: bool = True) -> pd.DataFrame:
+    """
+    Devuelve los conteos que dibuja un gráfico del dashboard, cacheados por versión.
+    """
+    return obtener_almacen().resumen(dimension, por_estado=por_estado)
+
+@st.cache_data(max_entries=4)
+def serie_backlog(version: int) -> pd.DataFrame:
+    """
+    Devuelve los tickets abiertos al final de cada día. El almacén lleva la cuenta
+    de lo que cambió cada día, así que basta con acumularla, cacheada por versión.
+    """
+    return metricas.backlog_por_dia(obtener_almacen().backlog_diario())
+
+@st.fragment(run_every=INTERVALO_SONDEO)
+def vigilar_cambios():
+    """
+    Sondea el registro de cambios del almacén y vuelve a ejecutar la página si
+    otra sesión modificó alguno de los tickets que muestran sus fragmentos (cada
+    uno anota los suyos en `tickets_visibles`) o, con la lista en su primera
+    página, si creó un ticket nuevo. Mientras no haya cambios, cada sondeo es una
+    sola lectura de la versión global.
+    """
+    almacen = obtener_almacen()
+    vista = st.session_state.get("version_vista")
+    if vista is None or almacen.version() == vista:
+        return
+    version, cambiados = almacen.cambios_desde(vista)
+    st.session_state.version_vista = version
+    visibles: Set[int] = set().union(*st.session_state.get("tickets_visibles", {}).values())
+    nuevos_desde = st.session_state.get("tickets_nuevos_desde")
+    if visibles.intersection(cambiados) or (nuevos_desde is not None and max(cambiados, default=0) > nuevos_desde):
+        st.rerun()
+
+def confirmar_cambio_propio(numero: int):
+    """
+    Da por vista una modificación del ticket `numero` hecha por esta sesión, para
+    que el sondeo no vuelva a ejecutar toda la página por ella. Si otra sesión
+    cambió otros tickets entretanto, la versión no avanza y el sondeo los detecta.
+    """
+    vista = st.session_state.get("version_vista")
+    if vista is None:
+        return
+    version, cambiados = obtener_almacen().cambios_desde(vista)
+    if set(cambiados) <= {numero}:
+        st.session_state.version_vista = version
+
+@st.fragment(run_every=INTERVALO_SONDEO)
+def metricas_rapidas():
+    """
+    Muestra los conteos por estado y los refresca solo, sin volver a ejecutar la página.
+    """
+    st.subheader("Métricas Rápidas")
+    with medir("metricas_sidebar"):
+        conteos = conteos_estado(obtener_almacen().version())
+    total_tickets = sum(conteos.values())
+    tickets_abiertos = conteos.get("Abierto", 0)
+    tickets_progreso = conteos.get("En Progreso", 0)
+    
+    st.write(f"Total de Tickets: **{total_tickets}**")
+    st.write(f"Tickets Abiertos: **{tickets_abiertos}**")
+    st.write(f"Tickets en Progreso: **{tickets_progreso}**")
+    st.write(f"Fuera de SLA: **{contar_incumplimientos()}**")
 
-        st.session_state.tickets_df = pd.DataFrame(tickets_data)
+    # Últimos incumplimientos detectados por el vigilante de este proceso
+    recientes = obtener_vigilante().destinos[0].recientes()[:5]
+    if recientes:
+        with st.expander("⚠️ Últimos incumplimientos de SLA"):
+            for aviso in recientes:
+                st.write(
+                    f"{aviso['id']} ({aviso['prioridad']}, {aviso['agente']}): "
+                    f"{aviso['horas_abierto']} h abierto, límite {aviso['limite_horas']} h"
+                )
 
 # ============================================
 # 3. Funciones Principales
@@ -149,19 +337,39 @@ def dashboard():
     3.1. Muestra el dashboard con métricas y gráficos de análisis de tickets.
     """
     st.header("Dashboard de Tickets")
+    indicadores_dashboard()
+    graficos_dashboard()
 
-    # Crear una copia del DataFrame sin la columna 'mensajes'
-    df_chart = st.session_state.tickets_df.drop(columns=['mensajes'])
+    # Volver a dibujar el dashboard solo cuando cambian los datos
+    vigilar_dashboard()
+
+@st.fragment(run_every=INTERVALO_SONDEO)
+def vigilar_dashboard():
+    """
+    3.1.3. Sondea la versión global de los datos y vuelve a ejecutar la página si
+    cambió desde la que se dibujó. Mientras no cambie, cada sondeo es una sola
+    lectura de la versión y no vuelve a construir ni a enviar los gráficos.
+    """
+    vista = st.session_state.get("version_vista")
+    if vista is not None and obtener_almacen().version() != vista:
+        st.rerun()
 
-    # Métricas principales
+@st.fragment
+def indicadores_dashboard():
+    """
+    3.1.1. Muestra las métricas principales y los percentiles de los tiempos de atención.
+    Todo sale de cachés por versión: entre cambios, cada refresco no consulta los tickets.
+    """
     col1, col2, col3 = st.columns(3)
-    tickets_abiertos = len(df_chart[df_chart.estado == "Abierto"])
-    tiempo_respuesta = 5.2  # Ejemplo
-    tiempo_resolucion = 16  # Ejemplo
+    with medir("calcular_tiempos"):
+        version = obtener_almacen().version()
+        medias, por_agente, por_empresa = resumen_tiempos(version)
+    tiempo_respuesta, tiempo_resolucion = medias.round(1).fillna(0)
+    tickets_abiertos = conteos_estado(version).get("Abierto", 0)
 
     col1.metric("Tickets Abiertos", tickets_abiertos, "10%")
-    col2.metric("Tiempo Primera Respuesta (horas)", tiempo_respuesta, "-1.5")
-    col3.metric("Tiempo Promedio Resolución (horas)", tiempo_resolucion, "2")
+    col2.metric("Tiempo Primera Respuesta (horas)", tiempo_respuesta)
+    col3.metric("Tiempo Promedio Resolución (horas)", tiempo_resolucion)
 
     # Explicación de métricas
     with st.expander("ℹ️ Explicación de Métricas"):
@@ -169,62 +377,116 @@ def dashboard():
         - **Tickets Abiertos**: Número total de tickets que aún no han sido resueltos.
         - **Tiempo Primera Respuesta**: Tiempo promedio que toma dar la primera respuesta a un ticket.
         - **Tiempo Promedio Resolución**: Tiempo promedio que toma resolver completamente un ticket.
+        - **Percentiles (p50/p90/p99)**: Horas dentro de las que se atendió el 50%, 90% y 99% de los tickets.
         """)
 
-    # Gráficos
+    # Tiempos de atención por agente y por empresa
+    st.subheader("Tiempos de Atención (horas)")
+    col1, col2 = st.columns(2)
+    instrumentacion.registrar_dataframe("percentiles_agente", por_agente)
+    instrumentacion.registrar_dataframe("percentiles_empresa", por_empresa)
+    with col1:
+        st.write("### Por Agente")
+        st.dataframe(por_agente)
+    with col2:
+        st.write("### Por Empresa")
+        st.dataframe(por_empresa)
+
+@st.fragment
+def graficos_dashboard():
+    """
+    3.1.2. Dibuja los gráficos de análisis a partir de los conteos agregados, cacheados por versión.
+    """
+    # Altair solo hace falta en el dashboard: se importa aquí y no al arrancar
+    import altair as alt
+
     st.subheader("Análisis de Tickets")
+    version = obtener_almacen().version()
 
+    # Los gráficos reciben solo los conteos agregados, no los tickets
     # Estado de tickets por mes
-    tickets_mes = (
-        alt.Chart(df_chart)
-        .mark_bar()
-        .encode(
-            x=alt.X("yearmonth(fecha_creacion):O", title="Mes"),
-            y=alt.Y("count():Q", title="Número de Tickets"),
-            color=alt.Color("estado:N", title="Estado")
+    with medir("grafico_mes"):
+        tickets_mes = (
+            alt.Chart(resumen_agregado(version, "mes"))
+            .mark_bar()
+            .encode(
+                x=alt.X("clave:O", title="Mes"),
+                y=alt.Y("conteo:Q", title="Número de Tickets"),
+                color=alt.Color("estado:N", title="Estado")
+            )
         )
-    )
-    st.altair_chart(tickets_mes, use_container_width=True)
+        st.altair_chart(tickets_mes, use_container_width=True)
+    instrumentacion.registrar_grafico("mes", tickets_mes)
+
+    # Tickets abiertos al final de cada día
+    with medir("grafico_backlog"):
+        backlog_chart = (
+            alt.Chart(serie_backlog(version))
+            .mark_line()
+            .encode(
+                x=alt.X("fecha:T", title="Fecha"),
+                y=alt.Y("abiertos:Q", title="Tickets Abiertos")
+            )
+        )
+        st.altair_chart(backlog_chart, use_container_width=True)
+    instrumentacion.registrar_grafico("backlog", backlog_chart)
 
     # Distribución por prioridad y agente
     col1, col2 = st.columns(2)
     
     with col1:
         st.write("### Distribución por Prioridad")
-        prioridad_chart = (
-            alt.Chart(df_chart)
-            .mark_arc()
-            .encode(
-                theta="count()",
-                color="prioridad:N"
+        with medir("grafico_prioridad"):
+            prioridad_chart = (
+                alt.Chart(resumen_agregado(version, "prioridad", por_estado=False))
+                .mark_arc()
+                .encode(
+                    theta="conteo:Q",
+                    color=alt.Color("clave:N", title="prioridad")
+                )
             )
-        )
-        st.altair_chart(prioridad_chart, use_container_width=True)
+            st.altair_chart(prioridad_chart, use_container_width=True)
+        instrumentacion.registrar_grafico("prioridad", prioridad_chart)
 
     with col2:
         st.write("### Tickets por Agente")
-        agente_chart = (
-            alt.Chart(df_chart)
-            .mark_bar()
-            .encode(
-                y=alt.Y("agente:N", title="Agente"),
-                x=alt.X("count():Q", title="Tickets Asignados")
+        with medir("grafico_agente"):
+            agente_chart = (
+                alt.Chart(resumen_agregado(version, "agente", por_estado=False))
+                .mark_bar()
+                .encode(
+                    y=alt.Y("clave:N", title="Agente"),
+                    x=alt.X("conteo:Q", title="Tickets Asignados")
+                )
             )
-        )
-        st.altair_chart(agente_chart, use_container_width=True)
+            st.altair_chart(agente_chart, use_container_width=True)
+        instrumentacion.registrar_grafico("agente", agente_chart)
 
 def nuevo_ticket():
     """
     3.2. Permite crear un nuevo ticket de soporte.
     """
     st.header("Crear Nuevo Ticket")
+    almacen = obtener_almacen()
+
+    # Empresa y usuario se eligen fuera del formulario para que los usuarios cambien
+    # con la empresa; el registro devuelve solo las opciones que coinciden con lo escrito
+    col1, col2 = st.columns(2)
+    with col1:
+        buscar_empresa = st.text_input("Buscar empresa", key="nuevo_buscar_empresa")
+        empresa = st.selectbox("Empresa", almacen.buscar_empresas(buscar_empresa, LIMITE_OPCIONES))
+    with col2:
+        buscar_usuario = st.text_input("Buscar usuario", key="nuevo_buscar_usuario")
+        usuario = st.selectbox(
+            "Usuario",
+            almacen.buscar_usuarios(empresa, buscar_usuario, LIMITE_OPCIONES) if empresa else []
+        )
 
     with st.form("nuevo_ticket"):
-        empresa = st.selectbox("Empresa", list(st.session_state.empresas.keys()))
-        usuario = st.selectbox("Usuario", st.session_state.empresas[empresa])
-        agente = st.selectbox("Asignar Agente", st.session_state.agentes)
+        agentes = almacen.nombres_agentes()
+        agente = st.selectbox("Asignar Agente", [ASIGNACION_AUTOMATICA] + agentes)
         problema = st.text_area("Descripción del Problema")
-        prioridad = st.select_slider("Prioridad", ["Baja", "Media", "Alta"])
+        prioridad = st.select_slider("Prioridad", PRIORIDADES[::-1])
         
         submitted = st.form_submit_button("Crear Ticket")
         
@@ -232,37 +494,44 @@ def nuevo_ticket():
             if not problema.strip():
                 st.error("Por favor, describe el problema")
                 return
+            if not empresa or not usuario:
+                st.error("Seleccione una empresa y un usuario.")
+                return
 
+            if agente == ASIGNACION_AUTOMATICA:
+                agente = agente_menos_cargado(almacen.cargas_abiertas(agentes))
+            momento = ahora()
             nuevo_ticket = {
-                "id": f"TICKET-{len(st.session_state.tickets_df) + 1001}",
                 "problema": problema,
                 "estado": "Abierto",
                 "prioridad": prioridad,
-                "fecha_creacion": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "fecha_creacion": momento,
                 "empresa": empresa,
                 "usuario": usuario,
                 "agente": agente,
                 "mensajes": [{
                     "contenido": problema,
                     "autor": usuario,
-                    "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "timestamp": momento,
                     "tipo": "usuario"
                 }]
             }
             
-            st.session_state.tickets_df = pd.concat([
-                pd.DataFrame([nuevo_ticket]),
-                st.session_state.tickets_df
-            ], ignore_index=True)
+            try:
+                nuevo_id = almacen.crear_ticket(nuevo_ticket)
+            except ValueError as error:
+                st.error(f"No se pudo crear el ticket: {error}")
+                return
             
-            st.success("Ticket creado exitosamente")
-            st.experimental_rerun()
+            st.success(f"Ticket {nuevo_id} creado exitosamente y asignado a '{agente}'")
+            st.rerun()
 
 def gestionar_usuarios():
     """
     3.3. Permite crear y gestionar empresas y sus usuarios.
     """
     st.header("Gestión de Usuarios y Empresas")
+    almacen = obtener_almacen()
     
     # Agregar nueva empresa
     with st.expander("Agregar Nueva Empresa"):
@@ -272,56 +541,80 @@ def gestionar_usuarios():
             submitted = st.form_submit_button("Agregar Empresa")
             
             if submitted:
-                nombre_empresa = nombre_empresa.strip()
-                if not nombre_empresa:
-                    st.error("El nombre de la empresa no puede estar vacío.")
-                elif nombre_empresa in st.session_state.empresas:
-                    st.error("Esta empresa ya existe.")
+                usuarios_lista = usuarios.split("\n")
+                try:
+                    almacen.agregar_empresa(nombre_empresa, usuarios_lista)
+                except ValueError as error:
+                    st.error(str(error))
                 else:
-                    usuarios_lista = [u.strip() for u in usuarios.split("\n") if u.strip()]
-                    if not usuarios_lista:
-                        st.error("Debe agregar al menos un usuario.")
-                    else:
-                        st.session_state.empresas[nombre_empresa] = usuarios_lista
-                        st.success(f"Empresa '{nombre_empresa}' agregada con {len(usuarios_lista)} usuarios.")
+                    total = len([u for u in usuarios_lista if u.strip()])
+                    st.success(f"Empresa '{nombre_empresa.strip()}' agregada con {total} usuarios.")
     
-    # Mostrar y gestionar empresas existentes
+    # Buscar una empresa y mostrar sus usuarios por páginas
     st.subheader("Empresas y Usuarios Actuales")
-    for empresa, usuarios in st.session_state.empresas.items():
-        with st.expander(f"{empresa} ({len(usuarios)} usuarios)"):
-            st.write("**Usuarios:**")
-            for usuario in usuarios:
-                col1, col2 = st.columns([4, 1])
-                col1.write(f"- {usuario}")
-                if col2.button("Eliminar", key=f"del_user_{empresa}_{usuario}"):
-                    if len(usuarios) > 1:
-                        st.session_state.empresas[empresa].remove(usuario)
-                        st.success(f"Usuario '{usuario}' eliminado de '{empresa}'.")
-                        st.experimental_rerun()
-                    else:
-                        st.error("No se puede eliminar el último usuario de una empresa.")
+    col1, col2 = st.columns(2)
+    buscar_empresa = col1.text_input("Buscar empresa", key="usuarios_buscar_empresa")
+    empresas = almacen.buscar_empresas(buscar_empresa, LIMITE_OPCIONES)
+    if not empresas:
+        st.info("No hay empresas que coincidan con la búsqueda.")
+        return
+    empresa = col1.selectbox("Empresa", empresas)
+    buscar_usuario = col2.text_input("Buscar usuario", key="usuarios_buscar_usuario")
+
+    # Volver a la primera página cuando cambian la empresa o la búsqueda
+    consulta = (empresa, buscar_usuario)
+    if st.session_state.get("consulta_usuarios") != consulta:
+        st.session_state.consulta_usuarios = consulta
+        st.session_state.pagina_usuarios = 0
+    pagina = st.session_state.pagina_usuarios
+
+    total = almacen.contar_usuarios(empresa, buscar_usuario)
+    paginas = max(1, -(-total // USUARIOS_POR_PAGINA))
+    usuarios = almacen.buscar_usuarios(
+        empresa, buscar_usuario, USUARIOS_POR_PAGINA, pagina * USUARIOS_POR_PAGINA
+    )
+    st.write(f"**Usuarios de {empresa}:** {total}")
+    for usuario in usuarios:
+        col1, col2 = st.columns([4, 1])
+        col1.write(f"- {usuario}")
+        if col2.button("Eliminar", key=f"del_user_{empresa}_{usuario}"):
+            try:
+                almacen.eliminar_usuario(empresa, usuario)
+            except ValueError as error:
+                st.error(str(error))
+            else:
+                st.success(f"Usuario '{usuario}' eliminado de '{empresa}'.")
+                st.rerun()
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀ Anterior", key="usuarios_anterior", disabled=pagina == 0):
+        st.session_state.pagina_usuarios -= 1
+        st.rerun()
+    col2.caption(f"Página {pagina + 1} de {paginas}")
+    if col3.button("Siguiente ▶", key="usuarios_siguiente", disabled=pagina + 1 >= paginas):
+        st.session_state.pagina_usuarios += 1
+        st.rerun()
             
-            # Agregar usuario a empresa existente
-            with st.form(f"agregar_usuario_{empresa}"):
-                nuevo_usuario = st.text_input("Nuevo Usuario")
-                submitted = st.form_submit_button("Agregar Usuario")
-                
-                if submitted:
-                    nuevo_usuario = nuevo_usuario.strip()
-                    if not nuevo_usuario:
-                        st.error("El nombre del usuario no puede estar vacío.")
-                    elif nuevo_usuario in usuarios:
-                        st.error("Este usuario ya existe en la empresa.")
-                    else:
-                        st.session_state.empresas[empresa].append(nuevo_usuario)
-                        st.success(f"Usuario '{nuevo_usuario}' agregado a '{empresa}'.")
-                        st.experimental_rerun()
+    # Agregar usuario a la empresa seleccionada
+    with st.form(f"agregar_usuario_{empresa}"):
+        nuevo_usuario = st.text_input("Nuevo Usuario")
+        submitted = st.form_submit_button("Agregar Usuario")
+        
+        if submitted:
+            try:
+                almacen.agregar_usuario(empresa, nuevo_usuario)
+            except ValueError as error:
+                st.error(str(error))
+            else:
+                st.success(f"Usuario '{nuevo_usuario.strip()}' agregado a '{empresa}'.")
+                st.rerun()
 
 def gestionar_agentes():
     """
     3.4. Permite crear y gestionar agentes de atención.
     """
     st.header("Gestión de Agentes")
+    almacen = obtener_almacen()
     
     # Agregar nuevo agente
     with st.form("nuevo_agente"):
@@ -336,221 +629,412 @@ def gestionar_agentes():
         submitted = st.form_submit_button("Agregar Agente")
         
         if submitted:
-            nombre_agente = nombre_agente.strip()
-            email_agente = email_agente.strip()
-            if not nombre_agente or not email_agente:
+            if not nombre_agente.strip() or not email_agente.strip():
                 st.error("Por favor, complete todos los campos.")
-            elif nombre_agente in st.session_state.agentes:
-                st.error("Este agente ya existe.")
             else:
-                st.session_state.agentes.append(nombre_agente)
-                st.success(f"Agente '{nombre_agente}' agregado exitosamente.")
-                st.experimental_rerun()
+                try:
+                    almacen.agregar_agente(nombre_agente, email_agente, departamento)
+                except ValueError as error:
+                    st.error(str(error))
+                else:
+                    st.success(f"Agente '{nombre_agente.strip()}' agregado exitosamente.")
+                    st.rerun()
     
     # Mostrar y gestionar agentes existentes
     st.subheader("Agentes Actuales")
-    if not st.session_state.agentes:
+    agentes = almacen.agentes()
+    if not agentes:
         st.info("No hay agentes registrados.")
     else:
-        for agente in st.session_state.agentes.copy():  # Usar una copia para evitar errores al modificar la lista
+        cargas = almacen.cargas_abiertas([a["nombre"] for a in agentes])
+        for datos in agentes:
+            agente = datos["nombre"]
             col1, col2 = st.columns([4, 1])
-            col1.write(f"👤 {agente}")
-            if len(st.session_state.agentes) > 1:  # Evitar eliminar el último agente
+            detalle = " · ".join(d for d in (datos["departamento"], datos["email"]) if d)
+            col1.write(
+                f"👤 {agente}" + (f" ({detalle})" if detalle else "")
+                + f" · carga abierta: {cargas.get(agente, 0)}"
+            )
+            if len(agentes) > 1:  # Evitar eliminar el último agente
                 if col2.button("Eliminar", key=f"del_agent_{agente}"):
-                    st.session_state.agentes.remove(agente)
-                    # Reasignar tickets del agente eliminado
-                    idx = st.session_state.tickets_df[st.session_state.tickets_df.agente == agente].index
-                    if not idx.empty:
-                        # Reasignar a otro agente aleatorio
-                        nuevos_agentes = [a for a in st.session_state.agentes if a != agente]
-                        if nuevos_agentes:
-                            nuevo_agente = random.choice(nuevos_agentes)
-                            st.session_state.tickets_df.loc[idx, 'agente'] = nuevo_agente
-                            st.success(f"Agente '{agente}' eliminado y tickets reasignados a '{nuevo_agente}'.")
-                        else:
-                            st.error("No hay agentes disponibles para reasignar.")
+                    # Repartir los tickets abiertos del agente eliminado según la carga de los demás
+                    recibidos = almacen.eliminar_agente(agente)
+                    if recibidos:
+                        st.success(
+                            f"Agente '{agente}' eliminado y {sum(recibidos.values())} tickets abiertos "
+                            f"repartidos entre {len(recibidos)} agentes."
+                        )
                     else:
                         st.success(f"Agente '{agente}' eliminado.")
-                    st.experimental_rerun()
+                    st.rerun()
 
 def tickets_existentes():
     """
     3.5. Muestra y permite gestionar los tickets existentes, con la capacidad de buscar por número.
+    La lista y el detalle son fragmentos: filtrar no vuelve a dibujar el ticket abierto,
+    y editar el ticket no vuelve a filtrar la lista.
     """
     st.header("Tickets Existentes")
+    lista_tickets()
+    detalle_ticket()
+
+    # Volver a ejecutar la página si otra sesión cambia un ticket que se está mostrando
+    vigilar_cambios()
+
+def _pagina_anterior():
+    st.session_state.cursores_tickets.pop()
+
+def _pagina_siguiente(cursor):
+    st.session_state.cursores_tickets.append(cursor)
+
+@st.fragment
+def lista_tickets():
+    """
+    3.5.1. Muestra los filtros, la lista paginada de tickets y la búsqueda de texto.
+    """
+    almacen = obtener_almacen()
     
     # Filtros
     col1, col2, col3 = st.columns(3)
     with col1:
         filtro_estado = st.multiselect(
             "Estado",
-            ["Abierto", "En Progreso", "Cerrado"],
-            default=["Abierto", "En Progreso", "Cerrado"]
+            ESTADOS,
+            default=ESTADOS
         )
     with col2:
+        # El registro devuelve solo las empresas que coinciden con lo escrito; las ya
+        # elegidas se mantienen entre las opciones para no perderlas al buscar otra
+        buscar_empresa = st.text_input("Buscar empresa", key="lista_buscar_empresa")
+        elegidas = st.session_state.get("lista_filtro_empresa", [])
         filtro_empresa = st.multiselect(
             "Empresa",
-            list(st.session_state.empresas.keys())
+            sorted(set(almacen.buscar_empresas(buscar_empresa, LIMITE_OPCIONES)) | set(elegidas)),
+            key="lista_filtro_empresa"
         )
     with col3:
         filtro_prioridad = st.multiselect(
             "Prioridad",
-            ["Alta", "Media", "Baja"]
+            PRIORIDADES
         )
     
-    # Aplicar filtros
-    df_filtrado = st.session_state.tickets_df.copy()
-    if filtro_estado:
-        df_filtrado = df_filtrado[df_filtrado.estado.isin(filtro_estado)]
-    if filtro_empresa:
-        df_filtrado = df_filtrado[df_filtrado.empresa.isin(filtro_empresa)]
-    if filtro_prioridad:
-        df_filtrado = df_filtrado[df_filtrado.prioridad.isin(filtro_prioridad)]
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        mas_antiguos = st.toggle("Más antiguos primero")
+    with col2:
+        tamano_pagina = st.selectbox("Tickets por página", TAMANOS_PAGINA, index=1)
+
+    # Volver a la primera página cuando cambian los filtros o el orden.
+    # Cada cursor es la clave (fecha_creacion, id) de la última fila de la página anterior.
+    consulta = (tuple(filtro_estado), tuple(filtro_empresa), tuple(filtro_prioridad), mas_antiguos, tamano_pagina)
+    if st.session_state.get("consulta_tickets") != consulta:
+        st.session_state.consulta_tickets = consulta
+        st.session_state.cursores_tickets = [None]
+    cursores = st.session_state.cursores_tickets
+
+    # En la primera página de los más recientes aparecen los tickets que creen otras
+    # sesiones: el sondeo vuelve a ejecutar la página si se crea uno con número mayor
+    # que el último que existía al leerla (se anota antes, para no perder ninguno)
+    ultimo = almacen.siguiente_numero() - 1
+    st.session_state.tickets_nuevos_desde = ultimo if len(cursores) == 1 and not mas_antiguos else None
+
+    # Aplicar filtros y ordenar en el almacén; se pide una fila extra para saber si hay más páginas
+    with medir("filtrar_tickets"):
+        df_pagina = almacen.pagina_tickets(
+            filtro_estado, filtro_empresa, filtro_prioridad,
+            limite=tamano_pagina + 1,
+            despues_de=cursores[-1],
+            descendente=not mas_antiguos
+        )
+    hay_siguiente = len(df_pagina) > tamano_pagina
+    df_pagina = df_pagina.iloc[:tamano_pagina]
+    st.session_state.setdefault("tickets_visibles", {})["lista"] = {
+        numero_ticket(id_) for id_ in df_pagina["id"]
+    }
     
     # Mostrar tickets en una tabla interactiva sin la columna 'mensajes'
     st.subheader("Lista de Tickets")
-    tickets_display = df_filtrado[["id", "problema", "estado", "prioridad", "fecha_creacion", "empresa", "usuario", "agente"]]
-    tickets_display = tickets_display.rename(columns={
-        "id": "ID",
-        "problema": "Problema",
-        "estado": "Estado",
-        "prioridad": "Prioridad",
-        "fecha_creacion": "Fecha de Creación",
-        "empresa": "Empresa",
-        "usuario": "Usuario",
-        "agente": "Agente Asignado"
-    })
-    tickets_display = tickets_display.sort_values(by="fecha_creacion", ascending=False)
-    tickets_display = tickets_display.reset_index(drop=True)
-
-    st.dataframe(tickets_display)
-    
-    # Búsqueda de ticket por número
-    st.subheader("Buscar Ticket por Número")
-    numero_ticket = st.text_input("Ingrese el número de ticket (e.g., TICKET-1050)")
-    if numero_ticket:
-        df_busqueda = st.session_state.tickets_df[st.session_state.tickets_df.id == numero_ticket]
-        if df_busqueda.empty:
-            st.error("No se encontró ningún ticket con ese número.")
+    tickets_display = df_pagina.rename(columns=NOMBRES_COLUMNAS)
+    instrumentacion.registrar_dataframe("lista_tickets", tickets_display)
+
+    with medir("tabla_tickets"):
+        st.dataframe(tickets_display, hide_index=True)
+
+    # Los botones cambian de página en su callback, antes de que el fragmento se vuelva a dibujar
+    col1, col2, col3 = st.columns([1, 2, 1])
+    col1.button("◀ Anterior", disabled=len(cursores) == 1, on_click=_pagina_anterior)
+    col2.caption(f"Página {len(cursores)}")
+    siguiente = None
+    if hay_siguiente:
+        ultima = df_pagina.iloc[-1]
+        siguiente = (ultima["fecha_creacion"], ultima["id"])
+    col3.button("Siguiente ▶", disabled=not hay_siguiente, on_click=_pagina_siguiente, args=(siguiente,))
+
+    # Búsqueda de texto en problemas y mensajes, con los mismos filtros de la lista
+    st.subheader("Buscar en Tickets")
+    texto_busqueda = st.text_input("Palabras a buscar en el problema o en los mensajes")
+    if texto_busqueda:
+        with medir("buscar_texto"):
+            resultados = almacen.buscar_texto(texto_busqueda, filtro_estado, filtro_empresa, filtro_prioridad)
+        instrumentacion.registrar_dataframe("busqueda", resultados)
+        if resultados.empty:
+            st.info("No se encontraron tickets con esas palabras.")
         else:
-            ticket = df_busqueda.iloc[0]
-            with st.expander(f"#{ticket.id} - {ticket.problema[:50]}...", expanded=True):
-                # Información del ticket
-                st.markdown(f"""
+            st.dataframe(resultados.rename(columns=NOMBRES_COLUMNAS), hide_index=True)
+
+def _guardar_edicion(ticket: Dict, sufijo: str):
+    # Callback de los selectores del detalle: guarda antes de que el fragmento se vuelva a dibujar
+    try:
+        obtener_almacen().actualizar_ticket(
+            ticket["numero"],
+            st.session_state[f"estado_{sufijo}"],
+            st.session_state[f"agente_{sufijo}"],
+            st.session_state[f"prioridad_{sufijo}"],
+            ahora(),
+            # Solo si nadie lo cambió desde que se mostró: si no, se muestran sus valores nuevos
+            anterior=ticket
+        )
+    except ValueError as error:
+        st.session_state.aviso_ticket = ("error", f"No se pudo actualizar el ticket: {error}")
+    else:
+        confirmar_cambio_propio(ticket["numero"])
+        st.session_state.aviso_ticket = ("success", "Información del ticket actualizada.")
+
+@st.fragment
+def detalle_ticket():
+    """
+    3.5.2. Busca un ticket por número y permite cambiar su estado, agente y prioridad.
+    Si el ticket ya pasó al histórico, lo muestra con sus mensajes, sin edición.
+    """
+    almacen = obtener_almacen()
+    st.subheader("Buscar Ticket por Número")
+    numero_buscado = st.text_input("Ingrese el número de ticket (e.g., TICKET-1050)")
+    ticket = None
+    if numero_buscado:
+        ticket = almacen.obtener_ticket(numero_buscado) or obtener_historico().obtener_ticket(numero_buscado)
+    st.session_state.setdefault("tickets_visibles", {})["detalle"] = {ticket["numero"]} if ticket else set()
+    if not numero_buscado:
+        return
+    if ticket is None:
+        st.error("No se encontró ningún ticket con ese número.")
+        return
+
+    with st.expander(f"#{ticket['id']} - {ticket['problema'][:50]}...", expanded=True):
+        # Información del ticket
+        st.markdown(f"""
     <div class="ticket-header">
         <table width="100%">
             <tr>
-                <td><strong>Estado:</strong> {ticket.estado}</td>
-                <td><strong>Prioridad:</strong> {ticket.prioridad}</td>
-                <td><strong>Fecha:</strong> {ticket.fecha_creacion}</td>
+                <td><strong>Estado:</strong> {html.escape(ticket['estado'])}</td>
+                <td><strong>Prioridad:</strong> {html.escape(ticket['prioridad'])}</td>
+                <td><strong>Fecha:</strong> {html.escape(ticket['fecha_creacion'])}</td>
             </tr>
             <tr>
-                <td><strong>Empresa:</strong> {ticket.empresa}</td>
-                <td><strong>Usuario:</strong> {ticket.usuario}</td>
-                <td><strong>Agente:</strong> {ticket.agente}</td>
+                <td><strong>Empresa:</strong> {html.escape(ticket['empresa'])}</td>
+                <td><strong>Usuario:</strong> {html.escape(ticket['usuario'])}</td>
+                <td><strong>Agente:</strong> {html.escape(ticket['agente'])}</td>
             </tr>
         </table>
     </div>
     """, unsafe_allow_html=True)
-                
-                # Edición de estado, agente y prioridad
-                col1, col2, col3 = st.columns(3)
-                nuevo_estado = col1.selectbox(
-                    "Estado",
-                    ["Abierto", "En Progreso", "Cerrado"], 
-                    index=["Abierto", "En Progreso", "Cerrado"].index(ticket.estado),
-                    key=f"estado_{ticket.id}"
-                )
-                nuevo_agente = col2.selectbox(
-                    "Agente",
-                    st.session_state.agentes,
-                    index=st.session_state.agentes.index(ticket.agente) if ticket.agente in st.session_state.agentes else 0,
-                    key=f"agente_{ticket.id}"
-                )
-                nueva_prioridad = col3.selectbox(
-                    "Prioridad",
-                    ["Alta", "Media", "Baja"],
-                    index=["Alta", "Media", "Baja"].index(ticket.prioridad),
-                    key=f"prioridad_{ticket.id}"
-                )
-                
-                # Actualizar ticket si hay cambios
-                if (nuevo_estado != ticket.estado or 
-                    nuevo_agente != ticket.agente or 
-                    nueva_prioridad != ticket.prioridad):
-                    idx = st.session_state.tickets_df[st.session_state.tickets_df.id == ticket.id].index[0]
-                    st.session_state.tickets_df.at[idx, 'estado'] = nuevo_estado
-                    st.session_state.tickets_df.at[idx, 'agente'] = nuevo_agente
-                    st.session_state.tickets_df.at[idx, 'prioridad'] = nueva_prioridad
-                    st.success("Información del ticket actualizada.")
-                    st.experimental_rerun()
-                
-                # Mostrar mensajes
-                st.write("---")
-                st.write("**Historial de Mensajes:**")
-                for msg in ticket["mensajes"]:
-                    if msg["tipo"] == "usuario":
-                        st.markdown(f"""
-                            <div class="mensaje-usuario">
-                                <strong>{msg['autor']}</strong> - {msg['timestamp']}
-                                <br>{msg['contenido']}
-                            </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"""
-                            <div class="mensaje-agente">
-                                <strong>{msg['autor']}</strong> - {msg['timestamp']}
-                                <br>{msg['contenido']}
-                            </div>
-                        """, unsafe_allow_html=True)
-                
-                # Agregar nuevo mensaje
-                st.write("---")
-                st.write("**Agregar Nuevo Mensaje:**")
-                with st.form(f"nuevo_mensaje_{ticket.id}"):
-                    nuevo_mensaje = st.text_area("Nuevo Mensaje")
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        tipo_mensaje = st.radio("Tipo de Mensaje", ["Agente", "Usuario"], key=f"tipo_msg_{ticket.id}")
-                    with col2:
-                        submitted = st.form_submit_button("Enviar Mensaje")
-                    
-                    if submitted:
-                        nuevo_mensaje = nuevo_mensaje.strip()
-                        if nuevo_mensaje:
-                            autor = ticket["agente"] if tipo_mensaje == "Agente" else ticket["usuario"]
-                            nuevo_msg = {
-                                "contenido": nuevo_mensaje,
-                                "autor": autor,
-                                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "tipo": tipo_mensaje.lower()
-                            }
-                            idx = st.session_state.tickets_df[st.session_state.tickets_df.id == ticket.id].index[0]
-                            st.session_state.tickets_df.at[idx, 'mensajes'].append(nuevo_msg)
-                            st.success("Mensaje agregado exitosamente.")
-                            st.experimental_rerun()
-                        else:
-                            st.error("El mensaje no puede estar vacío.")
-    
-    # ============================================
-    # 4. Función Principal
-    # ============================================
 
-    def main():
-        """
-        4.1. Función principal que ejecuta la aplicación.
-        """
-        # Inicializar el estado
-        inicializar_estado()
+        if ticket.get("archivado"):
+            st.info("Este ticket está cerrado y archivado en el histórico: no se puede modificar.")
+            st.write("**Historial de Mensajes:**")
+            mensajes = obtener_historico().obtener_mensajes(ticket["numero"])
+            st.markdown("".join(html_mensaje(m) for m in mensajes), unsafe_allow_html=True)
+            return
         
-        # Menú lateral
-        st.sidebar.title("Navegación")
-        pagina = st.sidebar.radio(
-            "Seleccione una página",
-            ["Dashboard", "Nuevo Ticket", "Tickets Existentes", "Usuarios", "Agentes"]
+        # Edición de estado, agente y prioridad. Las claves llevan los valores
+        # actuales del ticket para que, si otra sesión los cambia, los selectores
+        # muestren los nuevos en lugar de reescribir los que tenía esta sesión. Un
+        # mensaje nuevo no cambia las claves ni pierde lo que se estaba eligiendo.
+        sufijo = f"{ticket['id']}_{ticket['estado']}_{ticket['agente']}_{ticket['prioridad']}"
+        col1, col2, col3 = st.columns(3)
+        col1.selectbox(
+            "Estado",
+            ESTADOS, 
+            index=ESTADOS.index(ticket['estado']),
+            key=f"estado_{sufijo}",
+            on_change=_guardar_edicion, args=(ticket, sufijo)
         )
-        
-        # Mostrar página seleccionada
+        agentes = almacen.nombres_agentes()
+        col2.selectbox(
+            "Agente",
+            agentes,
+            index=agentes.index(ticket['agente']) if ticket['agente'] in agentes else 0,
+            key=f"agente_{sufijo}",
+            on_change=_guardar_edicion, args=(ticket, sufijo)
+        )
+        col3.selectbox(
+            "Prioridad",
+            PRIORIDADES,
+            index=PRIORIDADES.index(ticket['prioridad']),
+            key=f"prioridad_{sufijo}",
+            on_change=_guardar_edicion, args=(ticket, sufijo)
+        )
+        aviso = st.session_state.pop("aviso_ticket", None)
+        if aviso is not None:
+            tipo, texto = aviso
+            (st.error if tipo == "error" else st.success)(texto)
+
+        conversacion_ticket(ticket)
+
+def _mostrar_anteriores(clave_visibles: str, visibles: int):
+    st.session_state[clave_visibles] = visibles + MENSAJES_POR_TANDA
+
+def _enviar_mensaje(ticket: Dict):
+    # Callback del formulario: se ejecuta antes de que el historial se vuelva a dibujar
+    contenido = st.session_state[f"texto_msg_{ticket['id']}"].strip()
+    if not contenido:
+        st.session_state.aviso_mensaje = ("error", "El mensaje no puede estar vacío.")
+        return
+    tipo_mensaje = st.session_state[f"tipo_msg_{ticket['id']}"]
+    autor = ticket["agente"] if tipo_mensaje == "Agente" else ticket["usuario"]
+    nuevo_msg = {
+        "contenido": contenido,
+        "autor": autor,
+        "timestamp": ahora(),
+        "tipo": tipo_mensaje.lower()
+    }
+    try:
+        obtener_almacen().agregar_mensaje(ticket["numero"], nuevo_msg)
+    except ValueError as error:
+        st.session_state.aviso_mensaje = ("error", f"No se pudo agregar el mensaje: {error}")
+    else:
+        confirmar_cambio_propio(ticket["numero"])
+        st.session_state.aviso_mensaje = ("success", "Mensaje agregado exitosamente.")
+
+@st.fragment
+def conversacion_ticket(ticket: Dict):
+    """
+    3.5.3. Muestra el historial de mensajes de un ticket y el formulario para agregar uno.
+    Enviar un mensaje solo vuelve a dibujar este fragmento.
+    """
+    almacen = obtener_almacen()
+
+    # Mostrar mensajes
+    st.write("---")
+    st.write("**Historial de Mensajes:**")
+    total_mensajes = almacen.contar_mensajes(ticket["numero"])
+    clave_visibles = f"mensajes_visibles_{ticket['id']}"
+    visibles = min(st.session_state.get(clave_visibles, MENSAJES_POR_TANDA), total_mensajes)
+    if total_mensajes > visibles:
+        st.button(
+            f"Cargar anteriores ({total_mensajes - visibles} más)",
+            key=f"anteriores_{ticket['id']}",
+            on_click=_mostrar_anteriores, args=(clave_visibles, visibles)
+        )
+    # Todo el historial visible va en un único elemento
+    with medir("historial_mensajes"):
+        st.markdown(
+            historial_html(ticket["numero"], total_mensajes, visibles),
+            unsafe_allow_html=True
+        )
+    
+    # Agregar nuevo mensaje
+    st.write("---")
+    st.write("**Agregar Nuevo Mensaje:**")
+    with st.form(f"nuevo_mensaje_{ticket['id']}", clear_on_submit=True):
+        st.text_area("Nuevo Mensaje", key=f"texto_msg_{ticket['id']}")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.radio("Tipo de Mensaje", ["Agente", "Usuario"], key=f"tipo_msg_{ticket['id']}")
+        with col2:
+            st.form_submit_button("Enviar Mensaje", on_click=_enviar_mensaje, args=(ticket,))
+    aviso = st.session_state.pop("aviso_mensaje", None)
+    if aviso is not None:
+        tipo, texto = aviso
+        (st.error if tipo == "error" else st.success)(texto)
+    
+def importar_en_proceso(archivo) -> Dict:
+    """
+    Importa un archivo subido en el grupo de procesos de análisis. El archivo se
+    copia a disco, para no enviar su contenido completo al otro proceso.
+    """
+    sufijo = os.path.splitext(archivo.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=sufijo, delete=False) as copia:
+        shutil.copyfileobj(archivo, copia)
+    try:
+        with st.spinner("Importando..."):
+            return obtener_ejecutor().submit(analitica.importar_archivo, RUTA_BD, copia.name).result()
+    finally:
+        os.remove(copia.name)
+
+def importar_exportar():
+    """
+    3.6. Permite cargar tickets históricos desde un archivo y descargar todos los tickets.
+    """
+    st.header("Importar y Exportar Tickets")
+    almacen = obtener_almacen()
+
+    st.subheader("Importar")
+    st.write(
+        "Archivos CSV, JSONL o Parquet con las columnas "
+        f"{', '.join(importacion.COLUMNAS_ARCHIVO)}. Los tickets sin `id` reciben un número nuevo."
+    )
+    archivo = st.file_uploader("Archivo de tickets", type=["csv", "jsonl", "json", "parquet"])
+    if archivo is not None and st.button("Importar"):
+        estado = st.empty()
+        try:
+            if obtener_ejecutor() is not None:
+                resumen = importar_en_proceso(archivo)
+            else:
+                resumen = importacion.importar(
+                    almacen, archivo,
+                    progreso=lambda filas: estado.write(f"{filas} filas leídas...")
+                )
+        except (ValueError, ImportError) as error:
+            st.error(f"No se pudo importar el archivo: {error}")
+        else:
+            estado.empty()
+            st.success(f"Importados: {resumen['importados']}. Rechazados: {resumen['rechazados']}.")
+            if resumen["errores"]:
+                with st.expander("Filas rechazadas"):
+                    for fila, motivo in resumen["errores"]:
+                        st.write(f"- Fila {fila}: {motivo}")
+
+    st.subheader("Exportar")
+    st.caption("Para exportaciones muy grandes use `python importacion.py exportar`, que escribe directo a disco.")
+    formato = st.selectbox("Formato", importacion.FORMATOS)
+    if st.button("Preparar exportación"):
+        contenido = io.BytesIO()
+        total = importacion.exportar(almacen, contenido, formato, historico=obtener_historico())
+        st.download_button(
+            f"Descargar {total} tickets",
+            contenido.getvalue(),
+            file_name=f"tickets.{formato}"
+        )
+
+# ============================================
+# 4. Función Principal
+# ============================================
+
+def main():
+    """
+    4.1. Función principal que ejecuta la aplicación.
+    """
+    # La instrumentación se activa con TICKETS_PERFIL=1 o con ?perfil=1 en la URL
+    perfil_activo = instrumentacion.activo_por_entorno() or st.query_params.get("perfil") == "1"
+    instrumentacion.iniciar(perfil_activo)
+
+    # Inicializar el estado
+    with medir("inicializar_estado"):
+        inicializar_estado()
+    obtener_vigilante()
+    
+    # Menú lateral
+    st.sidebar.title("Navegación")
+    pagina = st.sidebar.radio(
+        "Seleccione una página",
+        ["Dashboard", "Nuevo Ticket", "Tickets Existentes", "Usuarios", "Agentes", "Importar / Exportar"]
+    )
+    
+    # Versión de los datos que va a mostrar esta ejecución; la usan los sondeos de cambios
+    st.session_state.version_vista = obtener_almacen().version()
+
+    # Mostrar página seleccionada
+    with medir(f"pagina:{pagina}"):
         if pagina == "Dashboard":
             dashboard()
         elif pagina == "Nuevo Ticket":
@@ -561,31 +1045,33 @@ def tickets_existentes():
             gestionar_usuarios()
         elif pagina == "Agentes":
             gestionar_agentes()
-        
-        # ============================================
-        # 5. Métricas en el Sidebar
-        # ============================================
-        st.sidebar.markdown("---")
-        st.sidebar.subheader("Métricas Rápidas")
-        total_tickets = len(st.session_state.tickets_df)
-        tickets_abiertos = len(st.session_state.tickets_df[st.session_state.tickets_df.estado == "Abierto"])
-        tickets_progreso = len(st.session_state.tickets_df[st.session_state.tickets_df.estado == "En Progreso"])
-        
-        st.sidebar.write(f"Total de Tickets: **{total_tickets}**")
-        st.sidebar.write(f"Tickets Abiertos: **{tickets_abiertos}**")
-        st.sidebar.write(f"Tickets en Progreso: **{tickets_progreso}**")
-        
-        # ============================================
-        # 6. Información del Sistema
-        # ============================================
-        st.sidebar.markdown("---")
-        st.sidebar.info(
-            """
-            Sistema de Tickets de Soporte
-            - Versión 1.0
-            - © 2024
-            """
-        )
+        elif pagina == "Importar / Exportar":
+            importar_exportar()
+    
+    # ============================================
+    # 5. Métricas en el Sidebar
+    # ============================================
+    st.sidebar.markdown("---")
+    with st.sidebar:
+        metricas_rapidas()
+    
+    # ============================================
+    # 6. Información del Sistema
+    # ============================================
+    st.sidebar.markdown("---")
+    st.sidebar.info(
+        """
+        Sistema de Tickets de Soporte
+        - Versión 1.0
+        - © 2024
+        """
+    )
+
+    # ============================================
+    # 7. Perfil de la Ejecución
+    # ============================================
+    if perfil_activo:
+        mostrar_perfil(instrumentacion.finalizar(pagina))
 
 # ============================================
 # 5. Ejecutar la Aplicación
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos de la aplicación están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacen import AlmacenTickets  # noqa: E402
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = AlmacenTickets(str(tmp_path / "tickets.db"))
+    yield almacen
+    almacen.cerrar()
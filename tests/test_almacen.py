@@ -0,0 +1,72 @@
+"""
+Pruebas del almacén de tickets.
+"""
+import pytest
+
+from almacen import MAX_NUMERO, numero_ticket
+
+TICKET = {
+    "problema": "No funciona la impresora", "estado": "Abierto", "prioridad": "Media",
+    "fecha_creacion": "2024-06-01 10:00:00", "empresa": "Empresa A",
+    "usuario": "Usuario A1", "agente": "Agente 1",
+}
+
+MENSAJE = {"contenido": "¿Sigue fallando?", "autor": "Agente 1", "timestamp": "2024-06-01 11:00:00", "tipo": "agente"}
+
+
+def test_edicion_tras_un_mensaje_se_guarda(almacen):
+    id_ticket = almacen.crear_ticket(TICKET)
+    mostrado = almacen.obtener_ticket(id_ticket)
+    almacen.agregar_mensaje(mostrado["numero"], MENSAJE)
+
+    almacen.actualizar_ticket(
+        mostrado["numero"], "En Progreso", "Agente 2", "Alta", "2024-06-01 12:00:00", anterior=mostrado
+    )
+
+    ticket = almacen.obtener_ticket(id_ticket)
+    assert (ticket["estado"], ticket["agente"], ticket["prioridad"]) == ("En Progreso", "Agente 2", "Alta")
+
+
+def test_edicion_sobre_valores_cambiados_por_otra_sesion_falla(almacen):
+    id_ticket = almacen.crear_ticket(TICKET)
+    mostrado = almacen.obtener_ticket(id_ticket)
+    almacen.actualizar_ticket(mostrado["numero"], "Abierto", "Agente 3", "Media", "2024-06-01 12:00:00")
+
+    with pytest.raises(ValueError, match="otra sesión"):
+        almacen.actualizar_ticket(
+            mostrado["numero"], "Cerrado", "Agente 1", "Media", "2024-06-01 13:00:00", anterior=mostrado
+        )
+    ticket = almacen.obtener_ticket(id_ticket)
+    assert (ticket["estado"], ticket["agente"], ticket["fecha_cierre"]) == ("Abierto", "Agente 3", None)
+
+
+def test_la_secuencia_no_pasa_del_mayor_numero_admitido(almacen):
+    ultimo = f"TICKET-{MAX_NUMERO}"
+    almacen.insertar_tickets([{**TICKET, "id": ultimo}])
+    assert almacen.obtener_ticket(ultimo)["numero"] == MAX_NUMERO
+
+    with pytest.raises(ValueError, match="No quedan números"):
+        almacen.crear_ticket(TICKET)
+    assert almacen.contar() == 1
+    assert numero_ticket(f"TICKET-{MAX_NUMERO + 1}") is None
+
+
+def test_eliminar_agente_reparte_sus_tickets_abiertos(almacen):
+    for agente, estado, prioridad in [
+        ("Agente 1", "Abierto", "Alta"), ("Agente 1", "En Progreso", "Media"), ("Agente 1", "Abierto", "Baja"),
+        ("Agente 1", "Cerrado", "Alta"), ("Agente 2", "Abierto", "Alta"), ("Agente 2", "Abierto", "Alta"),
+    ]:
+        almacen.crear_ticket({**TICKET, "agente": agente, "estado": estado, "prioridad": prioridad})
+    almacen.agregar_agente("Agente 3")
+
+    recibidos = almacen.eliminar_agente("Agente 1")
+
+    assert sum(recibidos.values()) == 3
+    assert recibidos["Agente 3"] > recibidos.get("Agente 2", 0)
+    assert "Agente 1" not in almacen.nombres_agentes()
+    assert almacen.cargas_abiertas(["Agente 1"]) == {"Agente 1": 0}
+    assert almacen.obtener_ticket("TICKET-1004")["agente"] == "Agente 1"
+
+    almacen.eliminar_agente("Agente 2")
+    with pytest.raises(ValueError, match="último agente"):
+        almacen.eliminar_agente("Agente 3")
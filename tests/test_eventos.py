@@ -0,0 +1,88 @@
+"""
+Pruebas del historial de eventos: el backlog por día que mantienen los triggers y
+el estado en un momento dado coinciden con volver a recorrer todos los eventos.
+"""
+import datetime
+import random
+
+import pandas as pd
+
+import generador
+import metricas
+from esquema import ESTADOS, ESTADOS_ABIERTOS, PRIORIDADES
+
+HASTA = datetime.datetime(2024, 6, 1)
+
+
+def _sembrar_y_editar(almacen):
+    empresas, agentes = generador.catalogo(empresas=5, usuarios=3, agentes=4)
+    generador.poblar(almacen, generador.generar_tickets(
+        300, empresas, agentes, semilla=1, dias=120, max_mensajes=3, hasta=HASTA
+    ))
+    azar = random.Random(2)
+    for _ in range(200):
+        ticket = almacen.obtener_ticket(f"TICKET-{azar.randrange(1000, 1300)}")
+        almacen.actualizar_ticket(
+            ticket["numero"], azar.choice(ESTADOS), azar.choice(agentes), azar.choice(PRIORIDADES),
+            "2024-06-01 12:00:00"
+        )
+    # Eventos fuera de orden: tickets creados en el futuro que se editan ahora, antes de su alta
+    futuros = almacen.insertar_tickets([
+        {
+            "problema": "Creado en el futuro", "estado": estado, "prioridad": "Alta",
+            "fecha_creacion": "2099-01-01 10:00:00", "empresa": "Empresa 01",
+            "usuario": "Usuario 01-1", "agente": agentes[0],
+        }
+        for estado in ("Abierto", "En Progreso")
+    ])
+    for id_ticket, estado in zip(futuros, ("Cerrado", "Abierto")):
+        numero = almacen.obtener_ticket(id_ticket)["numero"]
+        almacen.actualizar_ticket(numero, estado, agentes[1], "Baja", "2024-06-01 12:00:00")
+
+
+def _eventos(almacen, condicion):
+    return almacen._conexion().execute(
+        f"SELECT numero, momento, estado, prioridad, agente FROM eventos WHERE {condicion} ORDER BY momento, rowid"
+    ).fetchall()
+
+
+def _backlog_recorriendo_eventos(almacen):
+    """Reproduce el backlog al final de cada día aplicando los eventos uno a uno."""
+    abierto, al_final_del_dia = {}, {}
+    for numero, momento, estado, _, _ in _eventos(almacen, "tipo IN (0, 1)"):
+        abierto[numero] = ESTADOS[estado] in ESTADOS_ABIERTOS
+        al_final_del_dia[momento // 86400] = sum(abierto.values())
+    dias = pd.Series(al_final_del_dia)
+    dias = dias.reindex(range(dias.index.min(), dias.index.max() + 1)).ffill().astype("int64")
+    fechas = pd.to_datetime(dias.index.to_numpy() * 86400, unit="s").astype("datetime64[ns]")
+    return pd.DataFrame({"fecha": fechas, "abiertos": dias.to_numpy()})
+
+
+def test_backlog_diario_coincide_con_recorrer_los_eventos(almacen):
+    _sembrar_y_editar(almacen)
+    esperado = _backlog_recorriendo_eventos(almacen)
+
+    pd.testing.assert_frame_equal(metricas.backlog_por_dia(almacen.backlog_diario()), esperado)
+    almacen.reconstruir_backlog()
+    pd.testing.assert_frame_equal(metricas.backlog_por_dia(almacen.backlog_diario()), esperado)
+
+
+def test_estado_en_coincide_con_recorrer_los_eventos(almacen):
+    _sembrar_y_editar(almacen)
+    momento = "2024-04-15 00:00:00"
+    limite = int(datetime.datetime.fromisoformat(momento).replace(tzinfo=datetime.timezone.utc).timestamp())
+    esperado = {}
+    for numero, instante, estado, prioridad, agente in _eventos(almacen, "estado IS NOT NULL"):
+        if instante <= limite:
+            esperado[numero] = (ESTADOS[estado], PRIORIDADES[prioridad], agente)
+
+    estados = almacen.estado_en(momento)
+    obtenido = {
+        fila.numero: (fila.estado, fila.prioridad, fila.agente) for fila in estados.itertuples()
+    }
+    assert obtenido == esperado
+    assert 0 < len(obtenido) < 300
+
+    numeros = sorted(esperado)[:10] + [10 ** 9]
+    parcial = almacen.estado_en(momento, numeros)
+    assert parcial["numero"].tolist() == sorted(esperado)[:10]
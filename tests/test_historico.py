@@ -0,0 +1,133 @@
+"""
+Pruebas del histórico: compactar no pierde ni duplica tickets, ni siquiera cuando
+un lote falla a medias o cuando ya se archivaron todos.
+"""
+import datetime
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import generador  # noqa: E402
+import historico  # noqa: E402
+import metricas  # noqa: E402
+
+HASTA = datetime.datetime(2024, 6, 1)
+
+
+def _sembrar(almacen, cantidad=300):
+    empresas, agentes = generador.catalogo(empresas=5, usuarios=3, agentes=4)
+    generador.poblar(almacen, generador.generar_tickets(
+        cantidad, empresas, agentes, semilla=1, dias=120, max_mensajes=4, hasta=HASTA
+    ))
+
+
+def _todos(almacen, lector=None):
+    """Devuelve todos los tickets, vivos y archivados, por id."""
+    lotes = list(almacen.iterar_tickets()) + (list(lector.iterar_tickets()) if lector else [])
+    ids = [t["id"] for lote in lotes for t in lote]
+    assert len(ids) == len(set(ids)), "hay tickets duplicados"
+    return {t["id"]: t for lote in lotes for t in lote}
+
+
+def _tiempos(almacen, lector):
+    tiempos = lector.agregar_tiempos(metricas.tiempos_por_ticket(*almacen.datos_tiempos()))
+    columnas = ["numero", "horas_primera_respuesta", "horas_resolucion"]
+    return tiempos[columnas].sort_values("numero").reset_index(drop=True)
+
+
+def test_compactar_conserva_tickets_conteos_y_tiempos(almacen, tmp_path):
+    _sembrar(almacen)
+    raiz = str(tmp_path / "historico")
+    lector = historico.Historico(almacen, raiz)
+    antes = _todos(almacen)
+    conteos = almacen.conteo_por_estado()
+    por_mes = almacen.resumen("mes").sort_values(["clave", "estado"]).reset_index(drop=True)
+    tiempos = _tiempos(almacen, lector)
+
+    archivados = historico.compactar(almacen, raiz, dias=7, lote=40, momento=HASTA)
+
+    assert 0 < archivados < len(antes)
+    assert len(almacen.archivos_historico()) > 1
+    assert _todos(almacen, lector) == antes
+    assert almacen.conteo_por_estado() == conteos
+    pd.testing.assert_frame_equal(
+        almacen.resumen("mes").sort_values(["clave", "estado"]).reset_index(drop=True), por_mes
+    )
+    pd.testing.assert_frame_equal(_tiempos(almacen, lector), tiempos)
+
+
+def test_ticket_archivado_se_lee_del_historico(almacen, tmp_path):
+    _sembrar(almacen)
+    raiz = str(tmp_path / "historico")
+    antes = _todos(almacen)
+    historico.compactar(almacen, raiz, dias=7, momento=HASTA)
+    lector = historico.Historico(almacen, raiz)
+
+    numero = next(n for n in range(1000, 1300) if almacen.ubicacion_archivado(n))
+    ticket = lector.obtener_ticket(f"TICKET-{numero}")
+    assert almacen.obtener_ticket(f"TICKET-{numero}") is None
+    assert ticket["archivado"] and ticket["estado"] == "Cerrado"
+    assert lector.obtener_mensajes(numero) == antes[f"TICKET-{numero}"]["mensajes"]
+
+
+def test_lote_que_falla_no_cambia_el_almacen(almacen, tmp_path):
+    _sembrar(almacen)
+    raiz = str(tmp_path / "historico")
+    antes = _todos(almacen)
+    antes_cambios = almacen.version()
+
+    def escribir_y_fallar(lote, tickets, mensajes):
+        historico.escribir_lote(raiz, lote, tickets, mensajes)
+        raise OSError("disco lleno")
+
+    with pytest.raises(OSError):
+        almacen.archivar_cerrados(HASTA.strftime("%Y-%m-%d %H:%M:%S"), 50, escribir_y_fallar)
+
+    # Los archivos del lote fallido existen, pero no están anotados ni se leen
+    assert os.listdir(os.path.join(raiz, "tickets"))
+    assert almacen.archivos_historico() == []
+    assert almacen.version() == antes_cambios
+    lector = historico.Historico(almacen, raiz)
+    assert _todos(almacen, lector) == antes
+
+    # El siguiente intento los sobrescribe sin duplicar nada
+    assert historico.compactar(almacen, raiz, dias=7, momento=HASTA) > 0
+    assert _todos(almacen, lector) == antes
+
+
+def test_no_se_vuelve_a_sembrar_tras_archivar_todo(almacen, tmp_path):
+    _sembrar(almacen, cantidad=20)
+    with almacen._transaccion() as conexion:
+        conexion.execute("UPDATE tickets SET estado = 'Cerrado', fecha_cierre = fecha_creacion")
+    raiz = str(tmp_path / "historico")
+    assert historico.compactar(almacen, raiz, dias=0, momento=HASTA) == 20
+    assert almacen.contar() == 20
+
+    assert not almacen.sembrar_si_vacio(lambda: pytest.fail("se volvió a sembrar"))
+    nuevo = almacen.crear_ticket({
+        "problema": "Nuevo", "estado": "Abierto", "prioridad": "Alta",
+        "fecha_creacion": "2024-06-01 10:00:00", "empresa": "Empresa 01",
+        "usuario": "Usuario 01-1", "agente": "Agente 1",
+    })
+    assert nuevo == "TICKET-1020"
+    assert len(_todos(almacen, historico.Historico(almacen, raiz))) == 21
+
+
+def test_no_se_inserta_un_numero_archivado(almacen, tmp_path):
+    _sembrar(almacen)
+    historico.compactar(almacen, str(tmp_path / "historico"), dias=7, momento=HASTA)
+    numero = next(n for n in range(1000, 1300) if almacen.ubicacion_archivado(n))
+    ticket = {
+        "id": f"TICKET-{numero}", "problema": "Repetido", "estado": "Abierto", "prioridad": "Alta",
+        "fecha_creacion": "2024-06-01 10:00:00", "empresa": "Empresa 01",
+        "usuario": "Usuario 01-1", "agente": "Agente 1",
+    }
+    total = almacen.contar()
+
+    with pytest.raises(ValueError, match="histórico"):
+        almacen.insertar_tickets([ticket])
+    assert almacen.obtener_ticket(ticket["id"]) is None
+    assert almacen.contar() == total
@@ -0,0 +1,37 @@
+"""
+Pruebas de la importación de tickets.
+"""
+import json
+
+import importacion
+
+TICKET = {
+    "problema": "No funciona la impresora", "estado": "Abierto", "prioridad": "Media",
+    "fecha_creacion": "2024-06-01 10:00:00", "empresa": "Empresa A",
+    "usuario": "Usuario A1", "agente": "Agente 1",
+}
+
+MENSAJE = {"contenido": "Sigue fallando", "autor": "Usuario A1", "timestamp": "2024-06-01 11:00:00", "tipo": "usuario"}
+
+
+def test_mensajes_mal_formados_se_rechazan_por_fila(almacen, tmp_path):
+    registros = [
+        {**TICKET, "id": "TICKET-1", "mensajes": [MENSAJE]},
+        {**TICKET, "id": "TICKET-2", "mensajes": [{**MENSAJE, "contenido": 5}]},
+        {**TICKET, "id": "TICKET-3", "mensajes": [{**MENSAJE, "autor": None}]},
+        {**TICKET, "id": "TICKET-4", "mensajes": [{**MENSAJE, "tipo": 1}]},
+        {**TICKET, "id": "TICKET-5", "mensajes": [{**MENSAJE, "timestamp": 1717236000}]},
+        {**TICKET, "id": "TICKET-6", "mensajes": ["Sigue fallando"]},
+        {**TICKET, "id": "TICKET-7", "mensajes": []},
+    ]
+    archivo = tmp_path / "tickets.jsonl"
+    archivo.write_text("\n".join(json.dumps(r) for r in registros), encoding="utf-8")
+
+    resumen = importacion.importar(almacen, str(archivo))
+
+    assert resumen["importados"] == 2
+    assert [fila for fila, _ in resumen["errores"]] == [2, 3, 4, 5, 6]
+    assert almacen.obtener_ticket("TICKET-1") is not None
+    assert almacen.obtener_ticket("TICKET-2") is None
+    assert almacen.obtener_mensajes(1) == [MENSAJE]
+    assert almacen.contar() == 2
@@ -0,0 +1,90 @@
+"""
+Pruebas del vigilante de SLA con un reloj fijo y el destino en memoria.
+"""
+import datetime
+
+import sla
+from esquema import FORMATO_FECHA
+
+AHORA = datetime.datetime(2024, 6, 1, 12, 0, 0)
+
+
+class Reloj:
+    def __init__(self, momento: datetime.datetime):
+        self.momento = momento
+
+    def __call__(self) -> datetime.datetime:
+        return self.momento
+
+    def avanzar(self, **tiempo) -> None:
+        self.momento += datetime.timedelta(**tiempo)
+
+
+def _crear(almacen, prioridad: str, horas: float, estado: str = "Abierto") -> int:
+    creacion = (AHORA - datetime.timedelta(hours=horas)).strftime(FORMATO_FECHA)
+    id_ticket = almacen.crear_ticket({
+        "problema": f"{prioridad} de hace {horas} h", "estado": estado, "prioridad": prioridad,
+        "fecha_creacion": creacion, "empresa": "Empresa A", "usuario": "Usuario A1",
+        "agente": "Agente 1",
+    })
+    return almacen.obtener_ticket(id_ticket)["numero"]
+
+
+def _vigilante(almacen, reloj):
+    destino = sla.DestinoMemoria()
+    return sla.VigilanteSLA(almacen, [destino], reloj=reloj), destino
+
+
+def test_cada_incumplimiento_se_notifica_una_vez(almacen):
+    reloj = Reloj(AHORA)
+    alta_vencida = _crear(almacen, "Alta", 5)
+    alta_a_tiempo = _crear(almacen, "Alta", 3)
+    _crear(almacen, "Media", 10)
+    baja_vencida = _crear(almacen, "Baja", 100)
+    _crear(almacen, "Alta", 50, estado="Cerrado")
+    vigilante, destino = _vigilante(almacen, reloj)
+
+    assert sorted(n["numero"] for n in vigilante.revisar()) == [alta_vencida, baja_vencida]
+    assert vigilante.revisar() == []
+
+    # Dentro de la ventana siguiente solo vence el ticket de hace 3 h
+    reloj.avanzar(hours=1, minutes=30)
+    assert [n["numero"] for n in vigilante.revisar()] == [alta_a_tiempo]
+    assert [n["numero"] for n in destino.recientes()] == [alta_a_tiempo, baja_vencida, alta_vencida]
+    assert almacen.contar_incumplimientos() == 3
+
+
+def test_la_primera_revision_de_otro_proceso_no_relee_los_marcados(almacen):
+    reloj = Reloj(AHORA)
+    for _ in range(3):
+        _crear(almacen, "Alta", 10)
+    primero, _ = _vigilante(almacen, reloj)
+    assert len(primero.revisar()) == 3
+
+    assert almacen.abiertos_creados_entre("Alta", None, AHORA.strftime(FORMATO_FECHA)) == []
+    segundo, destino = _vigilante(almacen, reloj)
+    assert segundo.revisar() == []
+    assert destino.recientes() == []
+
+
+def test_los_cambios_fuera_de_la_ventana_se_revisan(almacen):
+    reloj = Reloj(AHORA)
+    cerrado = _crear(almacen, "Media", 48, estado="Cerrado")
+    baja = _crear(almacen, "Baja", 10)
+    vigilante, _ = _vigilante(almacen, reloj)
+    assert vigilante.revisar() == []
+
+    # Reabrir un ticket antiguo y subir la prioridad de otro: ninguno está en la
+    # ventana de fechas de la siguiente revisión, pero sí en el registro de cambios
+    almacen.actualizar_ticket(cerrado, "Abierto", "Agente 1", "Media", AHORA.strftime(FORMATO_FECHA))
+    almacen.actualizar_ticket(baja, "Abierto", "Agente 1", "Alta", AHORA.strftime(FORMATO_FECHA))
+    reloj.avanzar(minutes=1)
+    notificados = vigilante.revisar()
+    assert sorted(n["numero"] for n in notificados) == sorted([cerrado, baja])
+    assert {n["numero"]: n["limite_horas"] for n in notificados} == {cerrado: 24, baja: 4}
+
+    # Cerrar borra la marca; si se reabre y sigue vencido, se notifica de nuevo
+    almacen.actualizar_ticket(baja, "Cerrado", "Agente 1", "Alta", AHORA.strftime(FORMATO_FECHA))
+    assert vigilante.revisar() == []
+    almacen.actualizar_ticket(baja, "En Progreso", "Agente 1", "Alta", AHORA.strftime(FORMATO_FECHA))
+    assert [n["numero"] for n in vigilante.revisar()] == [baja]